@@ -1,16 +1,19 @@
 import os
 import time
 import json
+import heapq
 import smtplib
 import logging
 import sqlite3
 from email.mime.text import MIMEText
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 # Adjust imports to your actual modules
 from data_locker import DataLocker
 from calc_services import CalcServices
+from price_retention import PriceRetention
 from config_manager import load_config
+from liquidation_index import LiquidationIndex, liquid_band
 
 logger = logging.getLogger("AlertManagerLogger")
 logger.setLevel(logging.DEBUG)
@@ -27,7 +30,7 @@ class AlertManager:
         self.config_path = config_path
 
         # Setup
-        self.data_locker = DataLocker(self.db_path)
+        self.data_locker = DataLocker.startup(self.db_path, self.config_path)
         self.calc_services = CalcServices()
 
         # Load config (a dict)
@@ -50,6 +53,23 @@ class AlertManager:
         # We store times of last triggers to enforce cooldown
         self.last_triggered: Dict[str, float] = {}
 
+        # Travel% bands by price level (liquidation_index.py), rebuilt when
+        # positions change here or every index_refresh seconds for changes
+        # made by another process.
+        self.liquid_index: Optional[LiquidationIndex] = None
+        self._index_version = None
+        self._index_built_at = 0.0
+        self.index_refresh = self.config["system_config"].get("liquidation_index_refresh_seconds", 300)
+        # When each in-band position may alert again: a heap of
+        # (due time, position id, band), plus the latest due per
+        # (position id, band) so superseded heap entries are skipped.
+        self._travel_due: List[Tuple[float, str, str]] = []
+        self._travel_scheduled: Dict[Tuple[str, str], float] = {}
+        self._index_is_new = False
+
+        # Raw price tick pruning, run from the monitor loop
+        self.retention = PriceRetention.from_config(self.data_locker, self.config)
+
         logger.info(
             "AlertManagerV2 started. poll_interval=%s, cooldown=%s",
             poll_interval,
@@ -62,6 +82,7 @@ class AlertManager:
         """
         while True:
             self.check_alerts()
+            self.retention.maybe_run()
             time.sleep(self.poll_interval)
 
     def check_alerts(self):
@@ -73,16 +94,75 @@ class AlertManager:
             logger.debug("Alert monitoring disabled. Skipping.")
             return
 
-        # 1) Travel% check
-        positions = self.data_locker.read_positions()
-        logger.debug("Loaded %d positions for TravelPercent checks.", len(positions))
+        # 1) Travel% check: move the index to the latest prices (only the
+        #    positions whose band changed get re-evaluated), alert on those
+        #    that entered a band, then on those still in a band whose
+        #    cooldown ran out. Same alerts as checking every in-band
+        #    position each cycle, for O(crossings + due) work.
+        index = self.get_liquidation_index()
+        latest = self.data_locker.get_latest_prices(index.assets)
+        changes = index.move_many({a: float(row["current_price"]) for a, row in latest.items()})
+        for pos_id, before, after in changes:
+            logger.debug("Position %s moved from band %s to %s.", pos_id, before, after)
+        if self._index_is_new:
+            # Includes positions priced by their own current_price, which
+            # never move.
+            to_check = list(index.in_band())
+            self._index_is_new = False
+        else:
+            to_check = [pos_id for pos_id, _, after in changes if after is not None]
+
+        now = time.time()
+        while self._travel_due and self._travel_due[0][0] <= now:
+            due, pos_id, band = heapq.heappop(self._travel_due)
+            if self._travel_scheduled.get((pos_id, band)) == due:
+                del self._travel_scheduled[(pos_id, band)]
+                to_check.append(pos_id)
+            # else: rescheduled since
 
-        for pos in positions:
-            self.check_travel_percent_liquid(pos)
+        for pos_id in dict.fromkeys(to_check):
+            self._check_indexed_position(index, pos_id)
 
         # 2) PriceThreshold check
         self.check_price_alerts()
 
+    def get_liquidation_index(self) -> LiquidationIndex:
+        """
+        The travel% band index, rebuilt from the positions table when this
+        process changed positions (portfolio version) or it is older than
+        index_refresh seconds.
+        """
+        version = self.data_locker.portfolio.version
+        stale = time.time() - self._index_built_at >= self.index_refresh
+        if self.liquid_index is None or version != self._index_version or stale:
+            positions = self.data_locker.read_positions()
+            logger.debug("Indexing %d positions for TravelPercent checks.", len(positions))
+            self.liquid_index = LiquidationIndex.build(positions, self.liquid_cfg)
+            self._index_version = version
+            self._index_built_at = time.time()
+            self._index_is_new = True
+            self._travel_due = []
+            self._travel_scheduled = {}
+        return self.liquid_index
+
+    def _check_indexed_position(self, index: LiquidationIndex, pos_id: str):
+        """
+        Travel% alert check for one indexed position, then schedules its
+        next check for when the cooldown on its current band runs out.
+        """
+        info = index.position(pos_id)
+        if info is None:
+            return  # left every band
+        asset, band, travel = info
+        self.check_travel_percent_liquid(
+            {"id": pos_id, "asset_type": asset, "current_travel_percent": travel}
+        )
+        key = (pos_id, band)
+        due = self.last_triggered.get(f"{pos_id}-{band}", 0) + self.cooldown
+        if self._travel_scheduled.get(key) != due:
+            self._travel_scheduled[key] = due
+            heapq.heappush(self._travel_due, (due, pos_id, band))
+
     def check_travel_percent_liquid(self, pos: Dict[str, Any]):
         """
         If current_travel_percent is negative and passes certain thresholds
@@ -95,20 +175,10 @@ class AlertManager:
         pos_id = pos.get("id", "unknown")
         asset = pos.get("asset_type", "???")
 
-        # e.g. {"low": -25, "medium": -50, "high": -75}
-        low = self.liquid_cfg["low"]
-        medium = self.liquid_cfg["medium"]
-        high = self.liquid_cfg["high"]
-
         # figure out if val is in HIGH, MEDIUM, LOW zone
-        alert_level = None
-        if val <= high:
-            alert_level = "HIGH"
-        elif val <= medium:
-            alert_level = "MEDIUM"
-        elif val <= low:
-            alert_level = "LOW"
-        else:
+        # (self.liquid_cfg, e.g. {"low": -25, "medium": -50, "high": -75})
+        alert_level = liquid_band(val, self.liquid_cfg)
+        if alert_level is None:
             return  # -10, for example, doesn't cross any threshold
 
         # cooldown check
@@ -148,6 +218,11 @@ class AlertManager:
             and a.get("status", "").lower() == "active"
         ]
 
+        # One lookup for every asset up front (served from the price cache)
+        latest = self.data_locker.get_latest_prices(
+            [a.get("asset_type", "BTC") for a in price_alerts]
+        )
+
         for alert in price_alerts:
             asset = alert.get("asset_type", "BTC")
             trigger_val = float(alert.get("trigger_value", 0.0))
@@ -155,8 +230,7 @@ class AlertManager:
             # The new field that decides "ABOVE" vs "BELOW" logic
             condition = alert.get("condition", "ABOVE").upper()
 
-            # Grab latest price from DB
-            price_info = self.data_locker.get_latest_price(asset)
+            price_info = latest.get(asset)
             if not price_info:
                 continue  # no price data, skip
 
@@ -0,0 +1,137 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from data_locker import DataLocker
+
+logger = logging.getLogger("AsyncDataLockerLogger")
+
+# DataLocker methods exposed as coroutines, grouped like DataLocker itself.
+PRICE_METHODS = (
+    "insert_price", "insert_prices_bulk", "insert_or_update_price",
+    "get_prices", "read_prices", "get_latest_price", "get_latest_prices", "delete_price",
+    "delete_all_prices", "get_price_series", "rebuild_price_rollups", "read_price_models",
+)
+POSITION_METHODS = (
+    "create_position", "upsert_positions", "get_positions", "read_positions",
+    "read_positions_raw", "update_position", "update_position_size",
+    "delete_position", "delete_all_positions", "delete_positions_for_wallet",
+    "read_position_models", "read_position_book", "sync_calc_services",
+    "portfolio_totals",
+)
+ALERT_METHODS = (
+    "create_alert", "get_alerts", "update_alert_status", "delete_alert", "read_alert_models",
+)
+SYSTEM_METHODS = (
+    "read_api_counters", "reset_api_counters", "increment_api_report_counter",
+    "get_balance_vars", "set_balance_vars",
+    "get_last_update_times", "set_last_update_times",
+    "read_wallets", "get_wallet_by_name", "read_brokers",
+    "read_wallet_models", "read_broker_models",
+)
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(db_path: str) -> ThreadPoolExecutor:
+    """
+    One DB thread per database file, shared by every AsyncDataLocker on it.
+    A single worker means calls run (and commit) in submission order.
+    """
+    key = os.path.abspath(db_path)
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix=f"DataLocker-{os.path.basename(db_path)}"
+            )
+            _executors[key] = executor
+        return executor
+
+
+def _offload(name: str) -> Callable:
+    async def method(self, *args, **kwargs):
+        return await self.run(getattr(self.data_locker, name), *args, **kwargs)
+    method.__name__ = name
+    method.__qualname__ = f"AsyncDataLocker.{name}"
+    method.__doc__ = f"Awaitable DataLocker.{name}, run on the DB thread."
+    return method
+
+
+class AsyncDataLocker:
+    """
+    Asyncio front for DataLocker.
+      - Every call runs on the database's dedicated executor thread (which
+        has its own pooled connection), so commits never block the loop.
+      - Calls are executed in the order they were submitted, across all
+        AsyncDataLocker instances on the same file.
+      - Each call returns an awaitable with the DataLocker result (or
+        raises its exception).
+    """
+
+    def __init__(self, data_locker: DataLocker):
+        self.data_locker = data_locker
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Looked up per call so a forked child gets its own DB thread.
+        return _get_executor(self.data_locker.db_path)
+
+    @classmethod
+    def for_path(cls, db_path: str, **kwargs) -> 'AsyncDataLocker':
+        return cls(DataLocker.get_instance(db_path, **kwargs))
+
+    def submit(self, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        """
+        Queues fn(*args, **kwargs) on the DB thread right away and returns
+        an awaitable for its result. Use this to fire a write without
+        awaiting it; later submissions still run after it.
+        """
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Runs any DataLocker call (or function of one) on the DB thread.
+        """
+        return await self.submit(fn, *args, **kwargs)
+
+    async def flush(self):
+        """
+        Waits until every call submitted so far has finished.
+        """
+        await self.submit(lambda: None)
+
+    def close(self, wait: bool = True):
+        """
+        Stops the DB thread for this file. Later AsyncDataLockers on the
+        same path start a fresh one.
+        """
+        key = os.path.abspath(self.data_locker.db_path)
+        with _executors_lock:
+            executor = _executors.pop(key, None)
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+for _name in PRICE_METHODS + POSITION_METHODS + ALERT_METHODS + SYSTEM_METHODS:
+    setattr(AsyncDataLocker, _name, _offload(_name))
+del _name
+
+
+def _executors_after_fork():
+    # The parent's DB threads don't exist in a forked child.
+    global _executors_lock
+    _executors.clear()
+    _executors_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_executors_after_fork)
+
+
@@ -0,0 +1,1472 @@
+#!/usr/bin/env python3
+"""
+Ad-hoc benchmarks for the DataLocker / CalcServices stack.
+
+Every benchmark works on a scratch copy of mother_brain.db in a temp dir,
+so the real database is never touched.
+
+Usage:
+    python benchmarks.py                # run everything
+    python benchmarks.py route_connects # run one benchmark by name
+"""
+import os
+import json
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+SOURCE_DB = os.path.join(BASE_DIR, "mother_brain.db")
+
+
+def _scratch_db(name: str = "bench.db") -> str:
+    """
+    Copies mother_brain.db into a fresh temp dir and returns the copy's path.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="sonic_bench_")
+    path = os.path.join(tmp_dir, name)
+    shutil.copyfile(SOURCE_DB, path)
+    return path
+
+
+class _ConnectCounter:
+    """
+    Wraps sqlite3.connect so we can count how many connections get opened.
+    """
+    def __init__(self):
+        self.count = 0
+        self._real_connect = sqlite3.connect
+
+    def __enter__(self):
+        def counting_connect(*args, **kwargs):
+            self.count += 1
+            return self._real_connect(*args, **kwargs)
+        sqlite3.connect = counting_connect
+        return self
+
+    def __exit__(self, *exc):
+        sqlite3.connect = self._real_connect
+
+
+def _in_new_thread(fn):
+    """
+    Runs fn in its own thread, like a threaded Flask server does per request.
+    """
+    result = {}
+    t = threading.Thread(target=lambda: result.setdefault("value", fn()))
+    t.start()
+    t.join()
+    return result.get("value")
+
+
+# ----------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------
+
+def bench_route_connects():
+    """
+    sqlite3.connect calls per route render, first hit vs. steady state.
+    """
+    db_path = _scratch_db()
+    os.environ["SONIC_DB_PATH"] = db_path
+    with _ConnectCounter() as counter:
+        import flask_app
+        flask_app.DB_PATH = db_path
+        client = flask_app.app.test_client()
+
+        routes = [
+            "/positions", "/api/positions_data", "/alerts", "/prices",
+            "/heat", "/assets", "/exchanges", "/database-viewer",
+        ]
+        print(f"{'route':<22}{'first':>8}{'warm':>8}{'warm ms':>10}")
+        for route in routes:
+            before = counter.count
+            _in_new_thread(lambda: client.get(route))
+            first = counter.count - before
+
+            before = counter.count
+            start = time.perf_counter()
+            runs = 20
+            for _ in range(runs):
+                _in_new_thread(lambda: client.get(route))
+            warm = (counter.count - before) / runs
+            elapsed_ms = (time.perf_counter() - start) * 1000 / runs
+            print(f"{route:<22}{first:>8}{warm:>8.1f}{elapsed_ms:>10.2f}")
+
+
+def bench_wal_concurrency(seconds: float = 3.0, readers: int = 4):
+    """
+    Concurrency stress test: one thread ingests prices in batches while
+    reader threads render positions. Compares reader latency and lock
+    errors under the 'safe' (rollback journal) and 'balanced' (WAL) profiles.
+    """
+    from data_locker import DataLocker
+
+    print(f"{'profile':<10}{'reads':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'locked':>8}{'writes':>8}")
+    for profile in ("safe", "balanced"):
+        db_path = _scratch_db(f"stress_{profile}.db")
+        locker = DataLocker(db_path, db_profile={"profile": profile, "busy_timeout": 2000})
+        stop = threading.Event()
+        latencies = []
+        errors = {"locked": 0}
+        writes = {"rows": 0}
+
+        def writer():
+            conn = locker.conn
+            while not stop.is_set():
+                try:
+                    with conn:
+                        for _ in range(500):
+                            conn.execute(
+                                "INSERT INTO prices (id, asset_type, current_price, previous_price, "
+                                "last_update_time, previous_update_time, source) "
+                                "VALUES (lower(hex(randomblob(16))), 'BTC', 100000.0, 0.0, "
+                                "strftime('%Y-%m-%dT%H:%M:%f','now'), NULL, 'Stress')"
+                            )
+                    writes["rows"] += 500
+                except sqlite3.OperationalError:
+                    errors["locked"] += 1
+
+        def reader():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    locker.read_positions()
+                    locker.get_latest_price("BTC")
+                except sqlite3.OperationalError:
+                    errors["locked"] += 1
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        threads = [threading.Thread(target=writer)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        latencies.sort()
+        n = len(latencies) or 1
+        p50 = latencies[n // 2] if latencies else 0.0
+        p99 = latencies[min(n - 1, int(n * 0.99))] if latencies else 0.0
+        worst = latencies[-1] if latencies else 0.0
+        print(f"{profile:<10}{len(latencies):>8}{p50:>9.2f}{p99:>9.2f}{worst:>9.2f}"
+              f"{errors['locked']:>8}{writes['rows']:>8}")
+
+
+def _grow_prices(conn: sqlite3.Connection, rows: int, assets=("BTC", "ETH", "SOL")):
+    """
+    Appends `rows` synthetic ticks (round-robin over assets, one per second).
+    """
+    start = conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+    with conn:
+        conn.execute("""
+            WITH RECURSIVE seq(n) AS (
+                SELECT ? UNION ALL SELECT n + 1 FROM seq WHERE n < ?
+            )
+            INSERT INTO prices (id, asset_type, current_price, previous_price,
+                                last_update_time, previous_update_time, source)
+            SELECT 'bench-' || n,
+                   CASE n % 3 WHEN 0 THEN ? WHEN 1 THEN ? ELSE ? END,
+                   1000.0 + (n % 500), 0.0,
+                   strftime('%Y-%m-%dT%H:%M:%S', '2020-01-01', '+' || n || ' seconds'),
+                   NULL, 'Bench'
+              FROM seq
+        """, (start, start + rows - 1) + tuple(assets))
+
+
+def _time_ms(fn, runs: int = 200) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def bench_latest_price():
+    """
+    Latest-price lookup cost as the prices table grows: the old
+    ORDER BY ... LIMIT 1 scan, the same query on the new index, and the
+    latest_prices table DataLocker.get_latest_price now reads.
+    """
+    from data_locker import DataLocker
+
+    locker = DataLocker(_scratch_db())
+    conn = locker.conn
+    old_sql = ("SELECT * FROM prices NOT INDEXED WHERE asset_type=? "
+               "ORDER BY last_update_time DESC LIMIT 1")
+    indexed_sql = ("SELECT * FROM prices WHERE asset_type=? "
+                   "ORDER BY last_update_time DESC LIMIT 1")
+
+    print(f"{'rows':>10}{'scan ms':>12}{'index ms':>12}{'latest ms':>12}")
+    total = 0
+    for target in (10_000, 100_000, 1_000_000, 3_000_000):
+        _grow_prices(conn, target - total)
+        total = target
+        with conn:
+            locker._rebuild_latest_prices()
+        scan = _time_ms(lambda: conn.execute(old_sql, ("BTC",)).fetchone(), runs=3)
+        indexed = _time_ms(lambda: conn.execute(indexed_sql, ("BTC",)).fetchone())
+        latest = _time_ms(lambda: locker.get_latest_price("BTC"))
+        print(f"{total:>10}{scan:>12.3f}{indexed:>12.4f}{latest:>12.4f}")
+
+
+def _fake_jupiter_positions(count: int, wallet: str = "BenchVault") -> list:
+    assets = ("BTC", "ETH", "SOL")
+    return [{
+        "asset_type": assets[i % 3],
+        "position_type": "Long" if i % 2 else "Short",
+        "entry_price": 1000.0 + i,
+        "liquidation_price": 800.0 + i,
+        "collateral": 100.0 + i,
+        "size": 1000.0 + i * 3,
+        "leverage": 10.0,
+        "value": 100.0 + i,
+        "last_updated": f"2025-01-01T00:{(i // 60) % 60:02d}:{i % 60:02d}.{i:06d}",
+        "wallet_name": wallet,
+    } for i in range(count)]
+
+
+def bench_position_import(count: int = 5000):
+    """
+    Jupiter import of `count` positions: the old duplicate probe +
+    create_position per item vs. one upsert_positions batch. Each path is
+    run twice, a fresh import and a re-import of the same positions.
+    """
+    from data_locker import DataLocker
+
+    print(f"{'profile':<10}{'path':<20}{'fresh ms':>12}{'re-import ms':>14}")
+    for profile in ("safe", "balanced"):
+        locker = DataLocker(_scratch_db(f"import_{profile}.db"), db_profile=profile)
+        _time_position_import(locker, profile, count)
+
+
+def _time_position_import(locker, profile: str, count: int):
+    conn = locker.conn
+
+    def probe_and_create(batch):
+        for p in batch:
+            dup = conn.execute("""
+                SELECT COUNT(*) FROM positions
+                 WHERE wallet_name = ? AND asset_type = ? AND position_type = ?
+                   AND ABS(size - ?) < 0.000001 AND ABS(collateral - ?) < 0.000001
+                   AND last_updated = ?
+            """, (p["wallet_name"], p["asset_type"], p["position_type"],
+                  p["size"], p["collateral"], p["last_updated"])).fetchone()
+            if dup[0] == 0:
+                locker.create_position(p)
+
+    for label, fn in (("probe + create", probe_and_create), ("upsert_positions", locker.upsert_positions)):
+        locker.delete_all_positions()
+        start = time.perf_counter()
+        fn(_fake_jupiter_positions(count))
+        fresh = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        fn(_fake_jupiter_positions(count))
+        again = (time.perf_counter() - start) * 1000
+        print(f"{profile:<10}{label:<20}{fresh:>12.1f}{again:>14.1f}")
+
+
+def bench_price_rollups(rows: int = 1_000_000):
+    """
+    Hourly BTC chart over the whole history: grouping raw ticks vs. reading
+    the 1h rollups. Also checks that rollups maintained tick by tick match a
+    full rebuild from the raw rows.
+    """
+    from data_locker import DataLocker
+
+    locker = DataLocker(_scratch_db())
+    conn = locker.conn
+    _grow_prices(conn, rows)
+
+    start = time.perf_counter()
+    written = locker.rebuild_price_rollups()
+    print(f"backfill of {rows} ticks: {written} rollup rows in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    raw_sql = """
+        SELECT substr(last_update_time, 1, 13) AS bucket,
+               MAX(current_price), MIN(current_price), COUNT(*)
+          FROM prices WHERE asset_type = 'BTC'
+         GROUP BY bucket ORDER BY bucket
+    """
+    raw = _time_ms(lambda: conn.execute(raw_sql).fetchall(), runs=3)
+    series = _time_ms(lambda: locker.get_price_series("BTC", "1h"), runs=20)
+    points = len(locker.get_price_series("BTC", "1h"))
+    print(f"{'raw ticks ms':>14}{'rollup ms':>12}{'points':>8}")
+    print(f"{raw:>14.2f}{series:>12.3f}{points:>8}")
+
+    # Incremental vs. rebuilt, on ticks arriving in shuffled order.
+    import random
+    locker.delete_all_prices()
+    ticks = [{"asset_type": "ETH", "current_price": 2000.0 + random.random() * 100,
+              "last_update_time": f"2025-01-01T{h:02d}:{m:02d}:{s:02d}"}
+             for h in range(3) for m in range(60) for s in range(0, 60, 15)]
+    random.shuffle(ticks)
+    start = time.perf_counter()
+    for i in range(0, len(ticks), 50):
+        locker.insert_prices_bulk(ticks[i:i + 50])
+    ingest = (time.perf_counter() - start) * 1000
+    incremental = conn.execute("SELECT * FROM price_rollups ORDER BY 1, 2, 3").fetchall()
+    locker.rebuild_price_rollups()
+    rebuilt = conn.execute("SELECT * FROM price_rollups ORDER BY 1, 2, 3").fetchall()
+    same = [tuple(r) for r in incremental] == [tuple(r) for r in rebuilt]
+    print(f"{len(ticks)} shuffled ticks ingested in {ingest:.1f} ms; "
+          f"incremental == rebuild: {same}")
+
+
+def bench_price_retention(rows: int = 1_000_000, raw_days: int = 5):
+    """
+    Retention pass over ~11 days of 1s ticks keeping `raw_days`, while a
+    writer thread keeps inserting prices. Reports what was reclaimed and
+    the worst insert latency seen during the pass (the chunked deletes
+    should keep it far below the whole pass).
+    """
+    from datetime import datetime, timedelta
+    from data_locker import DataLocker
+    from price_retention import PriceRetention, convert_auto_vacuum
+
+    locker = DataLocker(_scratch_db(), db_profile="balanced")
+    _grow_prices(locker.conn, rows)
+    locker.rebuild_price_rollups()
+    retention = PriceRetention(locker, {"enabled": True, "raw_days": raw_days})
+    # Convert to auto_vacuum=INCREMENTAL up front (the explicit CLI step)
+    # so the pass below only measures pruning.
+    convert_auto_vacuum(locker)
+    size_before = os.path.getsize(locker.db_path)
+    series_before = locker.get_price_series("BTC", "1d")
+
+    stop = threading.Event()
+    latencies = []
+
+    def writer():
+        w = DataLocker(locker.db_path)
+        while not stop.is_set():
+            start = time.perf_counter()
+            w.insert_price({"asset_type": "BTC", "current_price": 1.0,
+                            "last_update_time": "2030-01-01T00:00:00"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.005)
+
+    t = threading.Thread(target=writer)
+    t.start()
+    report = retention.run(now=datetime(2020, 1, 1) + timedelta(days=11))
+    stop.set()
+    t.join()
+
+    kept = locker.conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+    series_after = locker.get_price_series("BTC", "1d")
+    print(report)
+    print(f"rows kept: {kept}; file {size_before} -> {os.path.getsize(locker.db_path)} bytes")
+    print(f"writer inserts: {len(latencies)}, max latency {max(latencies or [0]):.1f} ms, "
+          f"pass took {report['seconds'] * 1000:.0f} ms")
+    print(f"daily rollups unchanged: {series_before == series_after[:len(series_before)]}")
+
+
+def bench_price_archive(rows: int = 1_000_000, archive_ticks: int = 10_000_000):
+    """
+    Long-history reads: DataLocker.get_prices (a dict per row) vs. the
+    memory-mapped archive, then a volatility scan over `archive_ticks`
+    ticks straight off the archive files.
+    """
+    import numpy as np
+    from data_locker import DataLocker
+
+    db_path = _scratch_db()
+    locker = DataLocker(db_path)
+    _grow_prices(locker.conn, rows)
+
+    start = time.perf_counter()
+    locker.attach_archive(os.path.join(os.path.dirname(db_path), "archive"))
+    print(f"mirrored {locker.archive.count('BTC') + locker.archive.count('ETH') + locker.archive.count('SOL')} "
+          f"ticks in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    dicts = _time_ms(lambda: locker.get_prices("BTC"), runs=1)
+    views = _time_ms(lambda: locker.read_price_archive("BTC"), runs=20)
+    ts, px = locker.read_price_archive("BTC")
+    print(f"{'BTC ticks':>10}{'get_prices ms':>16}{'archive ms':>12}")
+    print(f"{len(px):>10}{dicts:>16.1f}{views:>12.3f}")
+
+    locker.insert_price({"asset_type": "BTC", "current_price": 1.0})
+    print(f"mirror after insert_price: {len(locker.read_price_archive('BTC')[1]) == len(px) + 1}")
+
+    # Synthetic years of 1s ticks, appended straight to the archive.
+    archive = locker.archive
+    base = int(np.datetime64("2021-01-01T00:00:00", "us").astype(np.int64))
+    step = 1_000_000
+    for i in range(0, archive_ticks, 1_000_000):
+        n = min(1_000_000, archive_ticks - i)
+        t = base + (np.arange(i, i + n, dtype=np.int64) * step)
+        p = 30000.0 * np.exp(np.cumsum(np.random.normal(0, 1e-4, n)))
+        archive.append("BENCH", t, p)
+
+    def volatility():
+        _, p = archive.read_range("BENCH")
+        r = np.diff(np.log(p))
+        return float(r.std())
+
+    day = _time_ms(lambda: archive.read_range("BENCH", "2021-03-01", "2021-03-02"), runs=200)
+    peak = _time_ms(lambda: archive.read_range("BENCH")[1].max(), runs=5)
+    scan = _time_ms(volatility, runs=5)
+    print(f"{archive.count('BENCH')} archived ticks: 1-day range read {day:.3f} ms, "
+          f"full max {peak:.1f} ms, full log-return std {scan:.1f} ms")
+
+
+def bench_async_locker(ticks: int = 200):
+    """
+    Event-loop stalls while a monitor writes price ticks: a heartbeat
+    coroutine sleeps 1 ms in a loop next to the writer, and we report its
+    worst gap with inline DataLocker calls vs. AsyncDataLocker. Uses the
+    'safe' profile so every commit fsyncs.
+    """
+    import asyncio
+    from data_locker import DataLocker
+    from async_data_locker import AsyncDataLocker
+
+    locker = DataLocker(_scratch_db(), db_profile="safe")
+    async_locker = AsyncDataLocker(locker)
+    batch = [{"asset_type": a, "current_price": 100.0} for a in ("BTC", "ETH", "SOL")]
+
+    async def heartbeat(stop, gaps):
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        while not stop.is_set():
+            await asyncio.sleep(0.001)
+            now = loop.time()
+            gaps.append((now - last) * 1000)
+            last = now
+
+    async def scenario(write):
+        stop, gaps = asyncio.Event(), []
+        beat = asyncio.create_task(heartbeat(stop, gaps))
+        start = time.perf_counter()
+        for _ in range(ticks):
+            await write()
+            await asyncio.sleep(0)
+        elapsed = (time.perf_counter() - start) * 1000
+        stop.set()
+        await beat
+        return elapsed, max(gaps or [0]), len(gaps)
+
+    async def inline():
+        locker.insert_prices_bulk(batch)
+
+    async def offloaded():
+        await async_locker.insert_prices_bulk(batch)
+
+    print(f"{'path':<16}{'total ms':>10}{'max gap ms':>12}{'beats':>8}")
+    for label, write in (("inline", inline), ("AsyncDataLocker", offloaded)):
+        elapsed, worst, beats = asyncio.run(scenario(write))
+        print(f"{label:<16}{elapsed:>10.1f}{worst:>12.2f}{beats:>8}")
+
+
+def bench_write_behind(threads: int = 8, writes: int = 300):
+    """
+    `threads` writers (Flask requests, the monitor, ...) each making
+    `writes` small mutations, direct vs. write-behind, under the 'safe'
+    profile where every commit fsyncs. Reports wall time, per-call
+    latency, lock errors and the queue's batch metrics.
+    """
+    from data_locker import DataLocker
+    from write_behind import start_write_behind, stop_write_behind
+
+    print(f"{'mode':<14}{'wall ms':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'rows ok':>9}")
+    for mode in ("direct", "write-behind"):
+        db_path = _scratch_db(f"wb_{mode}.db")
+        locker = DataLocker(db_path, db_profile={"profile": "safe", "busy_timeout": 5000})
+        if mode == "write-behind":
+            wb = start_write_behind(db_path, {"max_batch": 500, "max_delay_ms": 20})
+        before = locker.conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+        latencies, errors = [], []
+
+        def worker(n):
+            w = DataLocker(db_path)
+            for i in range(writes):
+                start = time.perf_counter()
+                try:
+                    w.insert_price({"asset_type": "BTC", "current_price": float(i),
+                                    "last_update_time": f"2030-01-01T{n:02d}:{i // 60:02d}:{i % 60:02d}"})
+                    w.increment_api_report_counter(f"Bench{n}")
+                except sqlite3.OperationalError as e:
+                    errors.append(e)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        locker.flush()
+        wall = (time.perf_counter() - start) * 1000
+
+        rows = locker.conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0] - before
+        latencies.sort()
+        print(f"{mode:<14}{wall:>9.0f}{latencies[len(latencies) // 2]:>9.2f}"
+              f"{latencies[int(len(latencies) * 0.99)]:>9.2f}{len(errors):>8}{rows:>9}")
+        if mode == "write-behind":
+            print(f"  {wb.metrics()}")
+            stop_write_behind(db_path)
+
+
+def bench_schema_startup(runs: int = 500):
+    """
+    What opening a DataLocker costs: the one-off migration at startup,
+    then per construction (what every Flask request pays) with schema
+    work cached vs. re-running every schema step like the old
+    _initialize_database did. Also load_config with and without the
+    per-call ensure_overrides_table.
+    """
+    from data_locker import DataLocker
+    from migrations import MIGRATIONS
+    from config_manager import load_config, ensure_overrides_table
+
+    db_path = _scratch_db()
+    start = time.perf_counter()
+    locker = DataLocker(db_path)
+    startup = (time.perf_counter() - start) * 1000
+    applied = locker.conn.execute("SELECT version, name, duration_ms FROM schema_version").fetchall()
+
+    def every_step():
+        conn = locker.conn
+        conn.execute("BEGIN IMMEDIATE")
+        for _, _, step in MIGRATIONS:
+            step(locker)
+        conn.commit()
+
+    cached = _time_ms(lambda: DataLocker(db_path), runs) * 1000
+    rerun = _time_ms(every_step, runs) * 1000
+    conn = locker.conn
+    config_path = os.path.join(BASE_DIR, "sonic_config.json")
+    lazy = _time_ms(lambda: load_config(config_path, conn), runs) * 1000
+    eager = _time_ms(lambda: (ensure_overrides_table(conn), load_config(config_path, conn)), runs) * 1000
+
+    print(f"startup migration: {startup:.1f} ms for {[tuple(r) for r in applied]}")
+    print(f"DataLocker() per request: {cached:.1f} us cached vs {rerun:.1f} us re-running schema steps")
+    print(f"load_config: {lazy:.1f} us lazy vs {eager:.1f} us with ensure_overrides_table")
+
+
+def bench_shared_locker(runs: int = 2000):
+    """
+    Per-request locker cost: a fresh DataLocker() vs. the shared one from
+    get_instance. Then forks (where available) to check the child opens
+    its own connections and write-behind restarts via startup().
+    """
+    from data_locker import DataLocker
+    from write_behind import get_write_behind
+
+    db_path = _scratch_db()
+    config_path = os.path.join(BASE_DIR, "sonic_config.json")
+    DataLocker.startup(db_path, config_path)
+    fresh = _time_ms(lambda: DataLocker(db_path), runs) * 1000
+    shared = _time_ms(lambda: DataLocker.get_instance(db_path), runs) * 1000
+    print(f"locker per request: {fresh:.2f} us DataLocker() vs {shared:.2f} us get_instance")
+
+    if not hasattr(os, "fork"):
+        return
+    locker = DataLocker.get_instance(db_path)
+    parent_conn = locker.conn
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            child = DataLocker.startup(db_path, config_path)
+            child.insert_price({"asset_type": "FORK", "current_price": 1.0})
+            child.flush()
+            status = 0 if child is locker and child.conn is not parent_conn else 2
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    row = locker.get_latest_price("FORK")
+    print(
+        f"fork: child exit {os.waitstatus_to_exitcode(status)}, parent sees child's write: {bool(row)}, "
+        f"parent conn still usable: {parent_conn.execute('SELECT 1').fetchone()[0] == 1}, "
+        f"write-behind {'on' if get_write_behind(db_path) else 'off'}"
+    )
+    DataLocker.shutdown(db_path)
+
+
+def bench_latest_price_cache(runs: int = 2000, alerts: int = 50):
+    """
+    Latest-price lookups with the in-process cache vs. straight from
+    latest_prices: the BTC/ETH/SOL header strip and one lookup per price
+    alert, as the routes and AlertManager do them. Also checks
+    write-through: a new tick is visible from the cache right away.
+    """
+    from data_locker import DataLocker
+
+    db_path = _scratch_db()
+    locker = DataLocker(db_path)
+    conn = locker.conn
+    assets = ["BTC", "ETH", "SOL"]
+
+    def strip_db():
+        return [conn.execute("SELECT * FROM latest_prices WHERE asset_type=?", (a,)).fetchone() for a in assets]
+
+    def alerts_db():
+        for i in range(alerts):
+            conn.execute("SELECT * FROM latest_prices WHERE asset_type=?", (assets[i % 3],)).fetchone()
+
+    def alerts_cached():
+        latest = locker.get_latest_prices([assets[i % 3] for i in range(alerts)])
+        for i in range(alerts):
+            latest.get(assets[i % 3])
+
+    locker.price_cache.ttl = 3600
+    print(f"header strip: {_time_ms(strip_db, runs) * 1000:.1f} us db vs "
+          f"{_time_ms(lambda: locker.get_latest_prices(assets), runs) * 1000:.1f} us cached")
+    print(f"{alerts} price alerts: {_time_ms(alerts_db, runs) * 1000:.1f} us db vs "
+          f"{_time_ms(alerts_cached, runs) * 1000:.1f} us cached")
+
+    locker.insert_price({"asset_type": "BTC", "current_price": 123.45})
+    before = locker.price_cache.stats()
+    fresh = locker.get_latest_price("BTC")["current_price"]
+    after = locker.price_cache.stats()
+    print(f"write-through: {fresh} served with {after['misses'] - before['misses']} misses; {after}")
+
+
+def bench_position_models(count: int = 10_000, runs: int = 10):
+    """
+    Reading `count` positions as dict(row) vs. Position.from_rows: decode
+    time, decode + the float() pass a route does over the numeric fields,
+    and memory held by the decoded list (tracemalloc).
+    """
+    import tracemalloc
+    from data_locker import DataLocker
+    from models import Position
+
+    locker = DataLocker(_scratch_db())
+    locker.delete_all_positions()
+    locker.upsert_positions(_fake_jupiter_positions(count))
+    rows = locker.conn.execute("SELECT * FROM positions").fetchall()
+    fields = ("entry_price", "liquidation_price", "collateral", "size", "leverage", "value")
+
+    def dicts_and_floats():
+        total = 0.0
+        for d in [dict(r) for r in rows]:
+            for f in fields:
+                total += float(d.get(f) or 0.0)
+        return total
+
+    def models_and_floats():
+        total = 0.0
+        for m in Position.from_rows(rows):
+            for f in fields:
+                total += getattr(m, f)
+        return total
+
+    def held_kib(build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        decoded = build()
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del decoded
+        return held / 1024
+
+    print(f"{'path':<14}{'decode ms':>11}{'+ floats ms':>13}{'held KiB':>10}")
+    for label, decode, consume in (
+            ("dict(row)", lambda: [dict(r) for r in rows], dicts_and_floats),
+            ("from_rows", lambda: Position.from_rows(rows), models_and_floats),
+    ):
+        print(f"{label:<14}{_time_ms(decode, runs):>11.1f}{_time_ms(consume, runs):>13.1f}{held_kib(decode):>10.0f}")
+    print(f"typed read via DataLocker: {_time_ms(locker.read_position_models, runs):.1f} ms "
+          f"vs read_positions {_time_ms(locker.read_positions, runs):.1f} ms")
+
+
+def bench_position_book(count: int = 100_000, runs: int = 5):
+    """
+    `count` positions held as a PositionBook vs. a list of dicts: load
+    from the db, memory held, and repricing every position from a new
+    set of latest prices.
+    """
+    import tracemalloc
+    from data_locker import DataLocker
+
+    locker = DataLocker(_scratch_db())
+    locker.delete_all_positions()
+    locker.upsert_positions(_fake_jupiter_positions(count))
+    prices = {"BTC": 97000.0, "ETH": 3100.0, "SOL": 240.0}
+
+    def held_mib(build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        built = build()
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del built
+        return held / (1024 * 1024)
+
+    dicts = locker.read_positions()
+    book = locker.read_position_book()
+
+    def reprice_dicts():
+        for pos in dicts:
+            pos["current_price"] = prices[pos["asset_type"].upper()]
+
+    print(f"{'path':<16}{'load ms':>10}{'held MiB':>10}{'reprice ms':>12}")
+    print(f"{'list of dicts':<16}{_time_ms(locker.read_positions, runs):>10.1f}"
+          f"{held_mib(locker.read_positions):>10.1f}{_time_ms(reprice_dicts, runs):>12.2f}")
+    print(f"{'PositionBook':<16}{_time_ms(locker.read_position_book, runs):>10.1f}"
+          f"{held_mib(locker.read_position_book):>10.1f}{_time_ms(lambda: book.set_prices(prices), runs):>12.2f}")
+
+
+def _random_positions(count: int, seed: int = 7) -> list:
+    """
+    Positions with the awkward cases mixed in: zero / negative prices,
+    entry == liquidation, price at entry, no collateral, .xx5 rounding
+    ties and position types each side rule reads differently.
+    """
+    import random
+    rng = random.Random(seed)
+    positions = []
+    for i in range(count):
+        entry = rng.choice([0.0, -1.0, 100.0, 1.005, rng.uniform(0.01, 1e5)])
+        positions.append({
+            "id": f"p{i}",
+            "asset_type": rng.choice(["BTC", "ETH", "SOL"]),
+            "position_type": rng.choice(["Long", "Short", "LONG", "short", "Perp short", "Perp", None]),
+            "entry_price": entry,
+            "liquidation_price": rng.choice([0.0, entry, 50.0, rng.uniform(0.01, 1e5)]),
+            "current_price": rng.choice([entry, 0.0, 1.015, rng.uniform(0.01, 1e5)]),
+            "collateral": rng.choice([0.0, -5.0, 3.0, rng.uniform(0.01, 1e4)]),
+            "size": rng.choice([0.0, 10.0, rng.uniform(0, 1e5)]),
+        })
+    return positions
+
+
+def _scalar_valuation(calc, pos: dict, travel_mode: str, side_rule) -> dict:
+    """
+    One position's valuation fields the old per-dict way, from the scalar
+    CalcServices methods; the baseline the vectorized paths are timed
+    against.
+    """
+    from position_book import LONG
+    from valuation import TRAVEL_PROFIT
+
+    position_type = "LONG" if side_rule(pos.get("position_type")) == LONG else "SHORT"
+    entry_price = float(pos.get("entry_price") or 0.0)
+    current_price = float(pos.get("current_price") or 0.0)
+    liquidation_price = float(pos.get("liquidation_price") or 0.0)
+    collateral = float(pos.get("collateral") or 0.0)
+    size = float(pos.get("size") or 0.0)
+
+    travel = calc.calculate_travel_percent if travel_mode == TRAVEL_PROFIT else calc.calculate_travel_percent_no_profit
+    if entry_price > 0:
+        token_count = size / entry_price
+        pnl = (current_price - entry_price if position_type == "LONG" else entry_price - current_price) * token_count
+    else:
+        pnl = 0.0
+    leverage = round(size / collateral, 2) if collateral > 0 else 0.0
+    return {
+        "travel_percent": travel(position_type, entry_price, current_price, liquidation_price),
+        "pnl": pnl,
+        "value": round(collateral + pnl, 2),
+        "leverage": leverage,
+        "heat_index": calc.calculate_heat_index(
+            {"size": size, "leverage": leverage, "collateral": collateral}) or 0.0,
+        "liquidation_distance": calc.calculate_liquid_distance(current_price, liquidation_price),
+    }
+
+
+def bench_valuation(count: int = 10_000, runs: int = 50):
+    """
+    Timing for the vectorized valuation kernel over a `count` PositionBook
+    vs. the scalar loop (test_valuation.py checks they agree exactly).
+    """
+    from calc_services import CalcServices
+    from position_book import PositionBook, side_of_strict
+    from valuation import TRAVEL_NO_PROFIT, value_book
+
+    calc = CalcServices()
+    positions = _random_positions(count)
+
+    # Realistic book (Jupiter-shaped positions, price 3% off entry) and the
+    # _random_positions edge-case mix, where many values sit on .xx5 rounding ties.
+    realistic = [dict(p, id=str(i), current_price=p["entry_price"] * 1.03)
+                 for i, p in enumerate(_fake_jupiter_positions(count))]
+    print(f"{count} positions   {'kernel ms':>10}{'from dicts ms':>15}{'scalar loop ms':>16}")
+    for label, sample in (("realistic", realistic), ("edge cases", positions)):
+        book = PositionBook.from_positions(sample, side_of_strict)
+        kernel = _time_ms(lambda: value_book(book, TRAVEL_NO_PROFIT), runs)
+        dicts = _time_ms(lambda: calc.value_positions(sample, TRAVEL_NO_PROFIT, side_of_strict), 10)
+        scalar = _time_ms(
+            lambda: [_scalar_valuation(calc, p, TRAVEL_NO_PROFIT, side_of_strict) for p in sample], 5
+        )
+        print(f"{label:<18}{kernel:>10.3f}{dicts:>15.1f}{scalar:>16.1f}")
+
+
+def bench_derived_fields(count: int = 5000, views: int = 20):
+    """
+    Positions page views before/after derived fields moved to
+    sync_calc_services: commits seen by another connection
+    (PRAGMA data_version) and time per view, then how many rows a sync
+    writes right after a tick, again with nothing changed, and after a
+    BTC-only tick.
+    """
+    from calc_services import CalcServices
+    from data_locker import DataLocker
+
+    db_path = _scratch_db()
+    locker = DataLocker(db_path)
+    locker.delete_all_positions()
+    locker.upsert_positions(_fake_jupiter_positions(count))
+    locker.insert_prices_bulk([{"asset_type": a, "current_price": p}
+                               for a, p in (("BTC", 1500.0), ("ETH", 1600.0), ("SOL", 1700.0))])
+    calc = CalcServices()
+    observer = sqlite3.connect(db_path)
+
+    def commits_during(fn):
+        before = observer.execute("PRAGMA data_version").fetchone()[0]
+        start = time.perf_counter()
+        for _ in range(views):
+            fn()
+        elapsed = (time.perf_counter() - start) * 1000 / views
+        return observer.execute("PRAGMA data_version").fetchone()[0] != before, elapsed
+
+    def view(aggregate):
+        return lambda: aggregate(locker.fill_missing_prices(locker.read_positions()))
+
+    for label, aggregate in (
+            ("aggregator_positions (old GET)", lambda ps: calc.aggregator_positions(ps, db_path)),
+            ("aggregate_positions (GET now)", calc.aggregate_positions),
+    ):
+        wrote, ms = commits_during(view(aggregate))
+        print(f"{label:<32} {ms:7.1f} ms/view, wrote to DB: {wrote}")
+
+    locker.conn.execute("UPDATE positions SET current_travel_percent=0, liquidation_distance=0, heat_index=0")
+    locker.conn.commit()
+    print(f"sync after tick: {locker.sync_calc_services()} of {count} rows updated")
+    print(f"sync, nothing changed: {locker.sync_calc_services()} rows updated")
+    locker.insert_price({"asset_type": "BTC", "current_price": 1550.0})
+    print(f"sync after BTC tick: {locker.sync_calc_services()} rows updated")
+    observer.close()
+
+
+def bench_portfolio_totals(count: int = 20_000, steps: int = 300, runs: int = 20):
+    """
+    Running portfolio totals vs. calculate_totals over a fresh scan:
+      - after a random mix of creates, deletes, edits and price ticks
+        through DataLocker, every field of read_portfolio().totals()
+        (overall and per asset / side / wallet) must match a rescan to
+        1e-9 relative;
+      - time to get the totals per request, and to apply one tick.
+    """
+    import random
+    from calc_services import CalcServices
+    from data_locker import DataLocker
+
+    rng = random.Random(3)
+    db_path = _scratch_db()
+    locker = DataLocker(db_path)
+    locker.delete_all_positions()
+    locker.upsert_positions(_fake_jupiter_positions(count))
+    locker.insert_prices_bulk([{"asset_type": a, "current_price": p}
+                               for a, p in (("BTC", 1500.0), ("ETH", 1600.0), ("SOL", 1700.0))])
+    calc = CalcServices()
+
+    def rescan(**match):
+        positions = calc.aggregate_positions(locker.fill_missing_prices(locker.read_positions()))
+        return calc.calculate_totals([p for p in positions if all(
+            (p[k] or "").upper() == v.upper() if k != "position_type" else
+            ("LONG" if (p[k] or "LONG").upper() == "LONG" else "SHORT") == v
+            for k, v in match.items())])
+
+    def worst(a: dict, b: dict) -> float:
+        return max(abs(a[k] - b[k]) / max(1.0, abs(b[k])) for k in b)
+
+    locker.read_portfolio()
+    ids = [r["id"] for r in locker.conn.execute("SELECT id FROM positions").fetchall()]
+    for step in range(steps):
+        op = rng.random()
+        if op < 0.3:
+            pos = dict(_fake_jupiter_positions(1, wallet=rng.choice(("BenchVault", "Other")))[0],
+                       asset_type=rng.choice(("BTC", "ETH", "SOL")), last_updated=f"step-{step}")
+            locker.create_position(pos)
+            ids.append(pos["id"])
+        elif op < 0.5:
+            locker.delete_position(ids.pop(rng.randrange(len(ids))))
+        elif op < 0.7:
+            locker.update_position(rng.choice(ids), rng.uniform(100, 5000), rng.uniform(10, 500))
+        else:
+            locker.insert_price({"asset_type": rng.choice(("BTC", "ETH", "SOL")),
+                                 "current_price": round(rng.uniform(900, 2500), 2)})
+    portfolio = locker.read_portfolio()
+    checks = [({}, {})] + [({"asset_type": a}, {"asset_type": a}) for a in ("BTC", "ETH", "SOL")]
+    checks += [({"side": s}, {"position_type": s}) for s in ("LONG", "SHORT")]
+    checks += [({"wallet_name": w}, {"wallet_name": w}) for w in ("BenchVault", "Other")]
+    err = max(worst(portfolio.totals(**mine), rescan(**theirs)) for mine, theirs in checks)
+    print(f"{steps} random ops over {count} positions: {len(checks)} total sets, "
+          f"max relative diff {err:.2e} ({'OK' if err < 1e-9 else 'MISMATCH'})")
+
+    sol = portfolio.apply_ticks([{"asset_type": "SOL", "current_price": 1.0, "last_update_time": "9999"}])
+    rescan_ms = _time_ms(lambda: rescan(), 3)
+    running_us = _time_ms(locker.portfolio_totals, runs) * 1000
+    tick_ms = _time_ms(lambda: portfolio.apply_ticks([{
+        "asset_type": "SOL", "current_price": rng.uniform(900, 2500), "last_update_time": "9999"
+    }]), runs)
+    print(f"totals per request: rescan {rescan_ms:.1f} ms vs running {running_us:.1f} us")
+    print(f"one SOL tick revalues {sol} positions in {tick_ms:.1f} ms")
+
+
+def bench_liquidation_index(sizes=(1_000, 10_000, 100_000), moves: int = 300):
+    """
+    Travel% band tracking for one asset under a random walk (0.3% steps):
+    LiquidationIndex.move vs. re-evaluating every position, per move,
+    with the crossings per move. Every band the index holds must equal
+    the full re-evaluation after every move.
+    """
+    import random
+    from calc_services import CalcServices
+    from liquidation_index import LiquidationIndex, liquid_band
+
+    ranges = {"low": -25.0, "medium": -50.0, "high": -75.0}
+    calc = CalcServices()
+    print(f"{'positions':>10}{'index us/move':>15}{'rescan us/move':>16}{'crossings/move':>16}"
+          f"{'index us/crossing':>19}{'mismatches':>12}")
+    for count in sizes:
+        rng = random.Random(count)
+        positions = []
+        for i in range(count):
+            entry = rng.uniform(900, 1100)
+            long = rng.random() < 0.5
+            liq = entry * (1 - rng.uniform(0.02, 0.5)) if long else entry * (1 + rng.uniform(0.02, 0.5))
+            positions.append({"id": str(i), "asset_type": "BTC", "position_type": "LONG" if long else "SHORT",
+                              "entry_price": entry, "liquidation_price": liq})
+        price = 1000.0
+        index = LiquidationIndex.build(positions, ranges, {"BTC": price})
+
+        def rescan(p):
+            return {pos["id"]: band for pos in positions
+                    if (band := liquid_band(calc.calculate_travel_percent_no_profit(
+                        pos["position_type"], pos["entry_price"], p, pos["liquidation_price"]), ranges))}
+
+        index_s = rescan_s = 0.0
+        crossings = mismatches = 0
+        for _ in range(moves):
+            price *= 1 + rng.uniform(-0.003, 0.003)
+            start = time.perf_counter()
+            crossings += len(index.move("BTC", price))
+            index_s += time.perf_counter() - start
+            start = time.perf_counter()
+            expected = rescan(price)
+            rescan_s += time.perf_counter() - start
+            held = {pid: band for pid, (_, band, _) in index.in_band().items()}
+            mismatches += len(set(held.items()) ^ set(expected.items()))
+        print(f"{count:>10}{index_s / moves * 1e6:>15.1f}{rescan_s / moves * 1e6:>16.1f}"
+              f"{crossings / moves:>16.1f}{index_s / max(crossings, 1) * 1e6:>19.2f}{mismatches:>12}")
+
+
+def bench_stress(count: int = 10_000, checked: int = 20):
+    """
+    Price-shock grid over a `count` position book:
+      - stress_book over ~10k scenarios vs. the per-position scalar path
+        (_scalar_valuation at each hypothetical price), timed on
+        `checked` scenarios spread over the grid and compared there;
+      - StressEngine.run through DataLocker, cold and cached.
+    """
+    from calc_services import CalcServices
+    from data_locker import DataLocker
+    from position_book import PositionBook, side_of
+    from stress_engine import StressEngine, scenario_grid, stress_book
+    from valuation import TRAVEL_NO_PROFIT
+
+    calc = CalcServices()
+    prices = {"BTC": 1050.0, "ETH": 1000.0, "SOL": 950.0}
+    positions = [dict(p, id=str(i), current_price=prices[p["asset_type"]])
+                 for i, p in enumerate(_fake_jupiter_positions(count))]
+    book = PositionBook.from_positions(positions, side_of)
+    factors = {"BTC": [x / 2 for x in range(-40, 41)], "ETH": range(-20, 21), "SOL": (-10, -5, 0)}
+    moves = scenario_grid(factors, book.assets)
+
+    start = time.perf_counter()
+    results = stress_book(book, moves)
+    vector_s = time.perf_counter() - start
+
+    def scalar(move_row):
+        value, liquidated = 0.0, 0
+        for pos in positions:
+            price = pos["current_price"] * (1 + move_row[book.assets.index(pos["asset_type"])])
+            liq = pos["liquidation_price"]
+            long = side_of(pos["position_type"]) > 0
+            if liq > 0 and (price <= liq if long else price >= liq):
+                liquidated += 1
+                continue
+            value += _scalar_valuation(calc, dict(pos, current_price=price), TRAVEL_NO_PROFIT, side_of)["pnl"] \
+                + pos["collateral"]
+        return value, liquidated
+
+    start = time.perf_counter()
+    sample = [round(i * (len(moves) - 1) / (checked - 1)) for i in range(checked)]
+    expected = [scalar(moves[i]) for i in sample]
+    scalar_s = (time.perf_counter() - start) / checked * len(moves)
+    err = max(abs(results["total_value"][i] - b[0]) / max(1.0, abs(b[0])) for i, b in zip(sample, expected))
+    counts_off = sum(results["liquidated"][i] != b[1] for i, b in zip(sample, expected))
+    print(f"{len(moves)} scenarios x {count} positions: vectorized {vector_s * 1000:.1f} ms, "
+          f"scalar ~{scalar_s:.1f} s (extrapolated from {checked})")
+    print(f"checked {checked} scenarios: max relative value diff {err:.1e}, "
+          f"{counts_off} liquidation counts off, {sum(b[1] for b in expected)} liquidations")
+
+    locker = DataLocker(_scratch_db())
+    locker.delete_all_positions()
+    locker.upsert_positions(_fake_jupiter_positions(count))
+    locker.insert_prices_bulk([{"asset_type": a, "current_price": p} for a, p in prices.items()])
+    engine = StressEngine(locker)
+    cold = _time_ms(lambda: engine._compute(factors), 1)
+    engine.run(factors)
+    warm = _time_ms(lambda: engine.run(factors), 50)
+    print(f"StressEngine.run: {cold:.1f} ms cold (with JSON rows), {warm * 1000:.1f} us cached; {engine.stats()}")
+
+
+def _seed_price_history(locker, days: int = 30, seed: int = 11, step_minutes: int = 60) -> dict:
+    """
+    Correlated random-walk ticks for BTC / ETH / SOL every step_minutes
+    over `days`, ending now (hourly volatility as given below); returns
+    the last price per asset.
+    """
+    import math
+    import random
+    from datetime import datetime, timedelta
+
+    rng = random.Random(seed)
+    prices = {"BTC": 1050.0, "ETH": 1000.0, "SOL": 950.0}
+    scale = math.sqrt(step_minutes / 60)
+    vols = {"BTC": 0.008 * scale, "ETH": 0.011 * scale, "SOL": 0.015 * scale}
+    now = datetime.now()
+    batch = []
+    for step in range(days * 24 * 60 // step_minutes, -1, -1):
+        common = rng.gauss(0, 1)
+        for asset in prices:
+            shock = 0.7 * common + 0.71 * rng.gauss(0, 1)
+            prices[asset] *= 1 + vols[asset] * shock
+            batch.append({"asset_type": asset, "current_price": prices[asset],
+                          "timestamp": now - timedelta(minutes=step * step_minutes)})
+    locker.insert_prices_bulk(batch)
+    return prices
+
+
+def bench_liquidation_risk(count: int = 10_000, paths=(20_000, 200_000)):
+    """
+    Monte Carlo liquidation probabilities on a `count` position book with
+    30 days of hourly history:
+      - per-position probabilities from searchsorted over sorted path
+        extremes must equal a brute-force paths x positions check;
+      - the same seed gives identical results inline and on a process pool;
+      - simulate + score time per path count, inline vs. pool, and the
+        cached LiquidationRisk.run.
+    """
+    import numpy as np
+    from data_locker import DataLocker
+    from liquidation_risk import LiquidationRisk, LONG, liquidation_probabilities, simulate
+
+    locker = DataLocker(_scratch_db())
+    locker.delete_all_positions()
+    locker.delete_all_prices()
+    locker.upsert_positions(_fake_jupiter_positions(count))
+    _seed_price_history(locker)
+    risk = LiquidationRisk(locker)
+    book, _ = locker.read_priced_position_book()
+    model = risk.fit(book.assets)
+    print(f"model: {model.describe(1.0)}")
+
+    lows, highs = simulate(model.chol, 24, 5000, 7, 1000)
+    prob, portfolio = liquidation_probabilities(book, model, lows, highs)
+    threshold = np.log(book.liquidation_price / book.current_price)
+    column = np.array([model.assets.index(a) for a in book.assets])[book.asset]
+    brute = np.where(book.side == LONG, lows[:, column] <= threshold, highs[:, column] >= threshold)
+    print(f"searchsorted vs brute force: max diff {np.abs(brute.mean(axis=0) - prob).max():.1e}, "
+          f"P(any) {portfolio['any']:.4f} vs {brute.any(axis=1).mean():.4f}")
+
+    workers = max(2, os.cpu_count() or 1)  # always exercise the pool path
+    for n in paths:
+        start = time.perf_counter()
+        inline = simulate(model.chol, 24, n, 7, 10_000, 1)
+        inline_s = time.perf_counter() - start
+        start = time.perf_counter()
+        pooled = simulate(model.chol, 24, n, 7, 10_000, workers)
+        pooled_s = time.perf_counter() - start
+        same = all(np.array_equal(a, b) for a, b in zip(inline, pooled))
+        start = time.perf_counter()
+        liquidation_probabilities(book, model, *inline)
+        score_s = time.perf_counter() - start
+        print(f"{n:>8} paths: simulate {inline_s * 1000:.0f} ms inline / {pooled_s * 1000:.0f} ms on "
+              f"{workers} workers (identical: {same}); score {count} positions {score_s * 1000:.1f} ms")
+
+    cold = _time_ms(risk.run, 1)
+    warm = _time_ms(risk.run, 50)
+    print(f"LiquidationRisk.run: {cold:.1f} ms cold, {warm * 1000:.1f} us cached")
+
+
+def bench_replay(count: int = 1000, days: int = 30, checked: int = 40):
+    """
+    Replay of a `count` position book over `days` of minute ticks:
+      - total_value, avg travel % and band counts at `checked` steps vs.
+        _scalar_valuation / liquid_band per position;
+      - travel% and price alert firings over a 6h window vs. a scalar
+        loop with AlertManager's cooldown rule;
+      - full replay time from raw ticks and from 1m / 1h rollups, vs. the
+        scalar loop extrapolated.
+    """
+    import math
+    from datetime import datetime, timedelta
+    from calc_services import CalcServices
+    from data_locker import DataLocker
+    from liquidation_index import liquid_band
+    from position_book import side_of_strict
+    from replay import ReplayEngine, alert_rows, to_json
+    from valuation import TRAVEL_NO_PROFIT
+
+    locker = DataLocker(_scratch_db())
+    locker.delete_all_positions()
+    locker.delete_all_prices()
+    locker.upsert_positions(_fake_jupiter_positions(count))
+    start = time.perf_counter()
+    _seed_price_history(locker, days=days, step_minutes=1)
+    locker.flush()
+    print(f"seeded {days} days of minute ticks in {time.perf_counter() - start:.1f} s")
+    for asset, condition, trigger in (("BTC", "BELOW", 1000.0), ("SOL", "ABOVE", 1000.0)):
+        locker.create_alert({
+            "alert_type": "PRICE_THRESHOLD", "asset_type": asset, "trigger_value": trigger,
+            "condition": condition, "notification_type": "SMS", "last_triggered": None,
+            "status": "Active", "frequency": 1, "counter": 0, "liquidation_distance": 0.0,
+            "target_travel_percent": 0.0, "liquidation_price": 0.0, "notes": "",
+            "position_reference_id": None,
+        })
+    locker.flush()
+
+    ranges = {"low": -25.0, "medium": -50.0, "high": -75.0}
+    engine = ReplayEngine(locker, ranges, cooldown_seconds=900)
+    calc = CalcServices()
+    positions = locker.read_positions()
+    price_alerts = [a for a in locker.get_alerts() if a["alert_type"] == "PRICE_THRESHOLD"]
+
+    def scalar_step(prices):
+        value, travel_x_size, bands = [], 0.0, {}
+        for pos in positions:
+            price = prices[pos["asset_type"]]
+            priced = dict(pos, current_price=pos["entry_price"] if math.isnan(price) else price)
+            v = _scalar_valuation(calc, priced, TRAVEL_NO_PROFIT, side_of_strict)
+            value.append(v["value"])
+            travel_x_size += v["travel_percent"] * pos["size"]
+            bands[pos["id"]] = (liquid_band(v["travel_percent"], ranges), v["travel_percent"])
+        return math.fsum(value), travel_x_size, bands
+
+    start = time.perf_counter()
+    result = engine.run()
+    ticks_s = time.perf_counter() - start
+    steps = result["steps"]
+    sample = [round(i * (steps - 1) / (checked - 1)) for i in range(checked)]
+    total_size = sum(p["size"] for p in positions)
+    value_err = travel_err = 0.0
+    counts_off = 0
+    start = time.perf_counter()
+    for i in sample:
+        value, travel_x_size, bands = scalar_step({a: px[i] for a, px in result["prices"].items()})
+        value_err = max(value_err, abs(result["series"]["total_value"][i] - value) / max(1.0, abs(value)))
+        travel_err = max(travel_err, abs(result["series"]["avg_travel_percent"][i] - travel_x_size / total_size))
+        for band, field in (("LOW", "in_low"), ("MEDIUM", "in_medium"), ("HIGH", "in_high")):
+            counts_off += result["series"][field][i] != sum(b == band for b, _ in bands.values())
+    scalar_s = (time.perf_counter() - start) / checked * steps
+    print(f"checked {checked} of {steps} steps: max relative value diff {value_err:.1e}, "
+          f"avg travel diff {travel_err:.1e}, {counts_off} band counts off")
+
+    # Alerts over a 6h window, scalar loop with AlertManager's rule.
+    window_end = datetime.now() - timedelta(days=days / 2)
+    window_start = window_end - timedelta(hours=6)
+    window = engine.run(window_start, window_end)
+    cooldown = 900 * 1_000_000
+    last, expected = {}, set()
+    for i, t in enumerate(window["times"]):
+        prices = {a: px[i] for a, px in window["prices"].items()}
+        for pid, (band, travel) in scalar_step(prices)[2].items():
+            if band and t - last.get((pid, band), -cooldown) >= cooldown:
+                last[(pid, band)] = t
+                expected.add(("travel_percent", int(t), pid, band))
+        for alert in price_alerts:
+            price = prices[alert["asset_type"]]
+            met = price >= alert["trigger_value"] if alert["condition"] == "ABOVE" else price <= alert["trigger_value"]
+            if met and t - last.get(alert["id"], -cooldown) >= cooldown:
+                last[alert["id"]] = t
+                expected.add(("price", int(t), alert["id"], None))
+    got = {(a["kind"], a["time"], a.get("position_id") or a.get("alert_id"), a.get("band"))
+           for a in alert_rows(window)}
+    print(f"6h window ({window['steps']} steps): {len(got)} alerts replayed, {len(expected)} expected, "
+          f"{len(got ^ expected)} differ; summary {window['summary']}")
+
+    print(f"{'source':<14}{'steps':>8}{'replay ms':>12}{'json ms':>10}")
+    print(f"{'ticks':<14}{steps:>8}{ticks_s * 1000:>12.1f}{_time_ms(lambda: to_json(result), 3):>10.1f}")
+    for resolution in ("1m", "1h"):
+        start = time.perf_counter()
+        rolled = engine.run(source="rollups", resolution=resolution)
+        elapsed = time.perf_counter() - start
+        print(f"{'rollups ' + resolution:<14}{rolled['steps']:>8}{elapsed * 1000:>12.1f}"
+              f"{_time_ms(lambda: to_json(rolled), 3):>10.1f}")
+    print(f"scalar loop over {steps} steps: ~{scalar_s:.0f} s (extrapolated from {checked}); "
+          f"summary {result['summary']}")
+
+
+def bench_hedges(pairs: int = 5000, ticks: int = 200):
+    """
+    Hedge analytics over `pairs` long/short hedges (2 * pairs positions,
+    plus a few three-leg hedges and dangling links):
+      - exposure per (asset, wallet) and per hedge after `ticks` random
+        ticks vs. a plain-dict recomputation at the final prices;
+      - one tick through HedgeBook.set_price vs. rebuilding the book;
+      - HedgeEngine.report through DataLocker.
+    """
+    import math
+    import random
+    from data_locker import DataLocker
+    from hedge_engine import HedgeBook, HedgeEngine
+    from position_book import PositionBook, side_of_strict
+
+    rng = random.Random(5)
+    positions = [dict(p, id=f"p{i}", current_price=0.0, wallet_name=f"W{i % 7}")
+                 for i, p in enumerate(_fake_jupiter_positions(2 * pairs))]
+    # i and i + 3 share an asset and have opposite sides.
+    links = {}
+    for i in range(0, 2 * pairs - 3, 6):
+        links[f"p{i}"] = f"p{i + 3}"
+        links[f"p{i + 1}"] = f"p{i + 4}"
+        links[f"p{i + 2}"] = f"p{i + 5}"
+    links["p0"], links["p6"] = "p3", "p3"          # one three-leg hedge
+    links[f"p{2 * pairs - 1}"] = "nobody"          # dangling
+    book = PositionBook.from_positions(positions, side_of_strict)
+
+    start = time.perf_counter()
+    hedges = HedgeBook(book, links)
+    build_ms = (time.perf_counter() - start) * 1000
+    prices = {"BTC": 1050.0, "ETH": 1000.0, "SOL": 950.0}
+    hedges.apply_ticks([{"asset_type": a, "current_price": p, "last_update_time": "0"} for a, p in prices.items()])
+    start = time.perf_counter()
+    for _ in range(ticks):
+        asset = rng.choice(list(prices))
+        prices[asset] *= 1 + rng.gauss(0, 0.01)
+        hedges.set_price(asset, prices[asset])
+    tick_ms = (time.perf_counter() - start) * 1000 / ticks
+
+    # Plain-dict reference at the final prices.
+    by_key, by_hedge = {}, {}
+    group_of = {pid: int(g) for pid, g in zip(book.ids, hedges.group) if g >= 0}
+    for pos in positions:
+        price = prices[pos["asset_type"]]
+        tokens = pos["size"] / pos["entry_price"]
+        long = side_of_strict(pos["position_type"]) > 0
+        acc = by_key.setdefault((pos["asset_type"], pos["wallet_name"]), [0.0, 0.0])
+        acc[0 if long else 1] += tokens * price
+        if pos["id"] in group_of:
+            liq = pos["liquidation_price"]
+            distance = ((price - liq) if long else (liq - price)) / price * 100
+            h = by_hedge.setdefault(group_of[pos["id"]], [0.0, 0.0, math.inf])
+            h[0 if long else 1] += tokens * price
+            h[2] = min(h[2], distance)
+    exposure_err = max(
+        max(abs(row["long_usd"] - by_key[(row["asset"], row["wallet_name"])][0]),
+            abs(row["short_usd"] - by_key[(row["asset"], row["wallet_name"])][1]))
+        for row in hedges.exposure()
+    )
+    hedge_err = max(
+        max(abs(h["long_usd"] - by_hedge[h["hedge"]][0]), abs(h["short_usd"] - by_hedge[h["hedge"]][1]),
+            abs(h["liquidation_distance_percent"] - by_hedge[h["hedge"]][2]))
+        for h in hedges.hedges()
+    )
+    print(f"{hedges.groups} hedges over {len(book)} positions, {hedges.dangling} dangling; "
+          f"after {ticks} ticks: max exposure diff {exposure_err:.1e}, max hedge diff {hedge_err:.1e}")
+    rebuild_ms = _time_ms(lambda: HedgeBook(book, links).set_price("BTC", prices["BTC"]), 5)
+    print(f"build {build_ms:.1f} ms; one tick {tick_ms * 1000:.0f} us incremental vs {rebuild_ms:.1f} ms rebuilt; "
+          f"report(limit=200) {_time_ms(lambda: hedges.report(200), 20):.1f} ms, "
+          f"full report {_time_ms(lambda: hedges.report(), 3):.1f} ms")
+
+    locker = DataLocker(_scratch_db())
+    locker.delete_all_positions()
+    locker.upsert_positions(_fake_jupiter_positions(2 * pairs))
+    locker.insert_prices_bulk([{"asset_type": a, "current_price": p} for a, p in prices.items()])
+    locker.flush()
+    ids = [r["id"] for r in locker.conn.execute("SELECT id FROM positions ORDER BY entry_price").fetchall()]
+    with locker.conn:
+        locker.conn.executemany("UPDATE positions SET hedge_buddy_id = ? WHERE id = ?",
+                                [(ids[i + 3], ids[i]) for i in range(0, len(ids) - 3, 6)])
+    locker.portfolio.invalidate()
+    engine = HedgeEngine(locker)
+    cold = _time_ms(lambda: engine.report(200), 1)
+    warm = _time_ms(lambda: engine.report(200), 20)
+    report = engine.report(200)
+    print(f"HedgeEngine.report: {cold:.1f} ms first, {warm:.1f} ms after; "
+          f"{report['hedge_count']} hedges, by_asset {[(a, round(r['hedge_ratio'], 3)) for a, r in report['by_asset'].items()]}")
+
+
+def bench_hedge_pairing(count: int = 10_000, added: int = 60):
+    """
+    Automatic hedge pairing of `count` random-size positions on a scratch
+    DB: the first run, a re-run (nothing to write), a run after importing
+    `added` more positions and resizing a few hedged ones (only the new
+    rows are written, the resized hedges are left stale), then one with
+    clear_links (the stale links are cleared and matched again). Checks
+    every link: mutual, same asset, opposite sides, size ratio >=
+    min_size_ratio.
+    """
+    import random
+    from data_locker import DataLocker
+    from hedge_engine import HedgeEngine
+    from hedge_pairing import HedgePairing
+
+    rng = random.Random(9)
+
+    def fake(n, offset):
+        rows = _fake_jupiter_positions(n)
+        for i, pos in enumerate(rows):
+            pos["size"] = round(rng.lognormvariate(8, 1.2), 2)
+            pos["last_updated"] = f"2025-02-01T00:00:00.{offset + i:06d}"
+        return rows
+
+    locker = DataLocker(_scratch_db())
+    locker.delete_all_positions()
+    locker.upsert_positions(fake(count, 0))
+    pairing = HedgePairing(locker)
+    first = pairing.run()
+    again = pairing.run()
+    print(f"{count} positions: first run {first['ms']:.1f} ms ({first['paired']} pairs, "
+          f"{first['written']} rows written); re-run {again['ms']:.1f} ms, {again['written']} written")
+
+    hedged = list(locker.read_hedge_links())[:4]
+    with locker.conn:
+        locker.conn.executemany("UPDATE positions SET size = size * 50 WHERE id = ?", [(pid,) for pid in hedged])
+    locker.portfolio.invalidate()
+    locker.upsert_positions(fake(added, count))
+    third = pairing.run()
+    print(f"after {added} new positions and 4 resized legs: {third['ms']:.1f} ms, "
+          f"{third['paired']} new pairs, {third['stale']} stale, {third['cleared']} cleared, "
+          f"{third['written']} rows written")
+    fourth = pairing.run(clear_links=True)
+    print(f"with clear_links: {fourth['ms']:.1f} ms, {fourth['paired']} new pairs, "
+          f"{fourth['cleared']} cleared, {fourth['written']} rows written")
+
+    rows = {r["id"]: r for r in locker.conn.execute(
+        "SELECT id, asset_type, position_type, size, hedge_buddy_id FROM positions").fetchall()}
+    bad = 0
+    for pid, row in rows.items():
+        buddy = rows.get(row["hedge_buddy_id"]) if row["hedge_buddy_id"] else None
+        if row["hedge_buddy_id"] and (
+                buddy is None or buddy["hedge_buddy_id"] != pid
+                or buddy["asset_type"] != row["asset_type"]
+                or buddy["position_type"] == row["position_type"]
+                or min(row["size"], buddy["size"]) / max(row["size"], buddy["size"]) < 0.25):
+            bad += 1
+    linked = sum(1 for r in rows.values() if r["hedge_buddy_id"])
+    report = HedgeEngine(locker).report(5)
+    print(f"{linked} of {len(rows)} positions linked, {bad} bad links; HedgeEngine sees {report['hedge_count']} hedges")
+
+
+def bench_thresholds(count: int = 10_000, trials: int = 20):
+    """
+    Alert classes and colors for `count` positions: the old per-request
+    path (nested get_alert_class, eight calls per position) vs. one
+    ThresholdClassifier.label_positions, checking identical labels under
+    the shipped alert_ranges and random (unordered, null) ones; then
+    CalcServices.get_color vs. the old linear scan.
+    """
+    import random
+    from calc_services import COLOR_RANGES, CalcServices
+    from thresholds import ALERT_METRICS, ThresholdClassifier
+
+    rng = random.Random(13)
+
+    def old_class(value, low, med, high):
+        if high is None:
+            high = float('inf')
+        if med is None:
+            med = float('inf')
+        if low is None:
+            low = float('-inf')
+        if value >= high:
+            return "alert-high"
+        elif value >= med:
+            return "alert-medium"
+        elif value >= low:
+            return "alert-low"
+        return ""
+
+    def old_label(positions, alert_dict):
+        for field, key, source in ALERT_METRICS:
+            cfg = alert_dict.get(key, {})
+            low, med, high = cfg.get("low", 0.0), cfg.get("medium", 0.0), cfg.get("high", None)
+            for pos in positions:
+                pos[field] = old_class(float(pos.get(source, 0.0)), low, med, high)
+
+    sources = {source for _, _, source in ALERT_METRICS}
+    positions = [{s: rng.choice([rng.uniform(-100, 20000), rng.uniform(-5, 5), 0.0]) for s in sources}
+                 for _ in range(count)]
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "sonic_config.json")) as f:
+        configs = [json.load(f)["alert_ranges"]]
+    for _ in range(trials):
+        configs.append({key: {k: rng.choice([None, round(rng.uniform(-50, 50), 1), 0.0])
+                              for k in ("low", "medium", "high") if rng.random() < 0.9}
+                        for _, key, _ in ALERT_METRICS})
+    mismatches = 0
+    for alert_dict in configs:
+        expected = [dict(p) for p in positions]
+        old_label(expected, alert_dict)
+        got = ThresholdClassifier(alert_dict).label_positions([dict(p) for p in positions])
+        mismatches += sum(e != g for e, g in zip(expected, got))
+    print(f"{len(configs)} alert_ranges x {count} positions: {mismatches} positions labelled differently")
+
+    shipped = configs[0]
+    old_ms = _time_ms(lambda: old_label(positions, shipped), 5)
+    classifier = ThresholdClassifier(shipped, COLOR_RANGES)
+    new_ms = _time_ms(lambda: classifier.label_positions(positions), 5)
+    compile_ms = _time_ms(lambda: ThresholdClassifier(shipped, COLOR_RANGES), 50)
+    print(f"label {count} positions: {old_ms:.1f} ms nested get_alert_class vs "
+          f"{new_ms:.1f} ms label_positions (compile {compile_ms * 1000:.0f} us, once per config change)")
+
+    def old_color(value, metric):
+        if metric not in COLOR_RANGES:
+            return "white"
+        for lower, upper, color in COLOR_RANGES[metric]:
+            if lower <= value < upper:
+                return color
+        return "red"
+
+    calc = CalcServices()
+    values = [(rng.choice([rng.uniform(-10, 11000), float(rng.randrange(0, 101, 5))]),
+               rng.choice(list(COLOR_RANGES) + ["other"])) for _ in range(count)]
+    color_diff = sum(old_color(v, m) != calc.get_color(v, m) for v, m in values)
+    print(f"get_color over {count} values: {color_diff} differ from the linear scan")
+
+
+BENCHMARKS = {
+    "route_connects": bench_route_connects,
+    "wal_concurrency": bench_wal_concurrency,
+    "latest_price": bench_latest_price,
+    "position_import": bench_position_import,
+    "price_rollups": bench_price_rollups,
+    "price_retention": bench_price_retention,
+    "price_archive": bench_price_archive,
+    "async_locker": bench_async_locker,
+    "write_behind": bench_write_behind,
+    "schema_startup": bench_schema_startup,
+    "shared_locker": bench_shared_locker,
+    "latest_price_cache": bench_latest_price_cache,
+    "position_models": bench_position_models,
+    "position_book": bench_position_book,
+    "valuation": bench_valuation,
+    "derived_fields": bench_derived_fields,
+    "portfolio_totals": bench_portfolio_totals,
+    "liquidation_index": bench_liquidation_index,
+    "stress": bench_stress,
+    "liquidation_risk": bench_liquidation_risk,
+    "replay": bench_replay,
+    "hedges": bench_hedges,
+    "hedge_pairing": bench_hedge_pairing,
+    "thresholds": bench_thresholds,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"\n=== {name} ===")
+        BENCHMARKS[name]()
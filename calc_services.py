@@ -1,8 +1,44 @@
 # calc_services.py
 
-from typing import Optional, List, Dict
+from typing import Callable, Optional, List, Dict
+import logging
 import sqlite3
 
+from write_behind import execute_write
+from position_book import PositionBook, side_of, side_of_strict
+from thresholds import ThresholdClassifier
+from valuation import TRAVEL_NO_PROFIT, TRAVEL_PROFIT, value_book
+
+logger = logging.getLogger("CalcServicesLogger")
+
+# positions columns computed from prices (aggregate_positions) and stored
+# by sync_derived_fields, in its UPDATE's order.
+DERIVED_FIELDS = ("current_travel_percent", "liquidation_distance", "heat_index")
+
+# Ranges for color coding (CalcServices.get_color), compiled once below.
+COLOR_RANGES = {
+    "travel_percent": [
+        (0, 25, "green"),
+        (25, 50, "yellow"),
+        (50, 75, "orange"),
+        (75, 100, "red")
+    ],
+    "heat_index": [
+        (0, 20, "blue"),
+        (20, 40, "green"),
+        (40, 60, "yellow"),
+        (60, 80, "orange"),
+        (80, 100, "red")
+    ],
+    "collateral": [
+        (0, 500, "lightgreen"),
+        (500, 1000, "yellow"),
+        (1000, 2000, "orange"),
+        (2000, 10000, "red")
+    ]
+}
+_COLORS = ThresholdClassifier(color_ranges=COLOR_RANGES)
+
 class CalcServices:
     """
     This class provides all aggregator/analytics logic for positions:
@@ -17,27 +53,8 @@ class CalcServices:
     def __init__(self):
         # Ranges for color coding (used by get_color).
         # Adjust as needed or remove if you don't want color-coded fields.
-        self.color_ranges = {
-            "travel_percent": [
-                (0, 25, "green"),
-                (25, 50, "yellow"),
-                (50, 75, "orange"),
-                (75, 100, "red")
-            ],
-            "heat_index": [
-                (0, 20, "blue"),
-                (20, 40, "green"),
-                (40, 60, "yellow"),
-                (60, 80, "orange"),
-                (80, 100, "red")
-            ],
-            "collateral": [
-                (0, 500, "lightgreen"),
-                (500, 1000, "yellow"),
-                (1000, 2000, "orange"),
-                (2000, 10000, "red")
-            ]
-        }
+        self.color_ranges = COLOR_RANGES
+        self._colors = _COLORS
 
     def calculate_value(self, position):
         # Since size is *already* in USD, just return it
@@ -105,92 +122,73 @@ class CalcServices:
             positions: List[dict],
             db_path: str
     ) -> List[dict]:
+        """
+        aggregate_positions, then persists the DERIVED_FIELDS that changed
+        (see sync_derived_fields). Returns the updated positions list.
+        Read-only views should call aggregate_positions instead.
+        """
+        self.sync_derived_fields(positions, db_path)
+        return positions
+
+    def aggregate_positions(self, positions: List[dict]) -> List[dict]:
         """
         1) For each position in `positions`, we compute Travel Percent WITHOUT a profit_price.
         2) Overwrite pos["current_travel_percent"] with the new value.
-        3) Update the DB so 'current_travel_percent' is persisted.
-        4) (Optionally) do basic PnL => 'value' = collateral + (pnl),
+        3) (Optionally) do basic PnL => 'value' = collateral + (pnl),
            and set pos["leverage"] = size/collateral,
            pos["heat_index"] = ...
-        5) Return the updated positions list.
+        4) Return the updated positions list.
+        Nothing is written to the DB; steps 1-3 run over the whole list at
+        once (see value_positions).
         """
-
-        import sqlite3
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        for pos in positions:
-            # 1) Basic fields
-            position_type = (pos.get("position_type") or "LONG").upper()
-            entry_price = float(pos.get("entry_price", 0.0))
-            current_price = float(pos.get("current_price", 0.0))
-            liquidation_price = float(pos.get("liquidation_price", 0.0))
-            collateral = float(pos.get("collateral", 0.0))
-            size = float(pos.get("size", 0.0))
-
-            # 2) Calculate Travel % (no profit anchor)
-            travel_percent = self.calculate_travel_percent_no_profit(
-                position_type,
-                entry_price,
-                current_price,
-                liquidation_price
-            )
+        valuation = self.value_positions(positions, TRAVEL_NO_PROFIT, side_of_strict)
+        for pos, travel_percent, liquidation_distance, value, leverage, heat_index in zip(
+                positions, valuation["travel_percent"], valuation["liquidation_distance"],
+                valuation["value"], valuation["leverage"], valuation["heat_index"]
+        ):
             pos["current_travel_percent"] = travel_percent
-
-            pos["liquidation_distance"] = self.calculate_liquid_distance(
-                current_price=pos.get("current_price", 0.0),
-                liquidation_price=pos.get("liquidation_price", 0.0)
-            )
-
-            # 3) Update DB
-            try:
-                cursor.execute("""
-                    UPDATE positions
-                       SET current_travel_percent = ?
-                     WHERE id = ?
-                """, (travel_percent, pos["id"]))
-            except Exception as e:
-                print(f"Error updating travel_percent for position {pos['id']}: {e}")
-
-            try:
-                cursor.execute(
-                    """
-                    UPDATE positions
-                       SET liquidation_distance = ?
-                     WHERE id = ?
-                    """,
-                    (pos["liquidation_distance"], pos["id"])
-                )
-            except Exception as e:
-                print(f"Error updating liquidation_distance for position {pos['id']}: {e}")
-
-
-            # (Optional) Basic PnL => Value
-            # Just an example:
-            if entry_price > 0:
-                token_count = size / entry_price
-                if position_type == "LONG":
-                    pnl = (current_price - entry_price) * token_count
-                else:
-                    pnl = (entry_price - current_price) * token_count
-            else:
-                pnl = 0.0
-            pos["value"] = round(collateral + pnl, 2)
-
-            # (Optional) Leverage = size / collateral
-            if collateral > 0:
-                pos["leverage"] = round(size / collateral, 2)
-            else:
-                pos["leverage"] = 0.0
-
-            # (Optional) Heat Index
-            pos["heat_index"] = self.calculate_heat_index(pos) or 0.0
-
-        conn.commit()
-        conn.close()
-
+            pos["liquidation_distance"] = liquidation_distance
+            pos["value"] = value
+            pos["leverage"] = leverage
+            pos["heat_index"] = heat_index
         return positions
 
+    def sync_derived_fields(self, positions: List[dict], db_path: str) -> int:
+        """
+        Runs aggregate_positions over positions as read from the DB and
+        writes back DERIVED_FIELDS for only the rows whose values changed,
+        in one executemany. Call it after prices or positions change.
+        Returns how many rows were updated; a failed write is logged and
+        re-raised.
+        """
+        stored = [tuple(pos.get(field) for field in DERIVED_FIELDS) for pos in positions]
+        self.aggregate_positions(positions)
+
+        updates = []
+        for pos, before in zip(positions, stored):
+            after = tuple(pos[field] for field in DERIVED_FIELDS)
+            if after != before:
+                updates.append((*after, pos["id"]))
+        if not updates:
+            return 0
+
+        def write(conn):
+            conn.executemany("""
+                UPDATE positions
+                   SET current_travel_percent = ?,
+                       liquidation_distance = ?,
+                       heat_index = ?
+                 WHERE id = ?
+            """, updates)
+
+        try:
+            # Waits in write-behind mode too, so the count is what committed.
+            execute_write(db_path, write, wait=True)
+        except Exception as e:
+            logger.error(f"Error updating derived fields for {len(updates)} positions: {e}", exc_info=True)
+            raise
+        return len(updates)
+
     def calculate_liquid_distance(self, current_price: float, liquidation_price: float) -> float:
         """
         Absolute difference between current_price and liquidation_price.
@@ -274,78 +272,40 @@ class CalcServices:
         return travel_percent
 
     def prepare_positions_for_display(self, positions: List[dict]) -> List[dict]:
+        """
+        Sets current_travel_percent (profit-anchored, see
+        calculate_travel_percent), value, leverage and heat_index on every
+        position for the templates. Anything with "short" in its
+        position_type is a short.
+        """
+        valuation = self.value_positions(positions, TRAVEL_PROFIT, side_of)
         processed_positions = []
-
-        for idx, pos in enumerate(positions, start=1):
-            print(f"\n[DEBUG] Position #{idx} BEFORE aggregator => {pos}")
-
-            # 1) Position type logic
-            raw_ptype = pos.get("position_type", "LONG")
-            ptype_lower = raw_ptype.strip().lower()
-            if "short" in ptype_lower:
-                position_type = "SHORT"
-            else:
-                position_type = "LONG"
-
-            # 2) Grab fields
-            entry_price = float(pos.get("entry_price", 0.0))
-            current_price = float(pos.get("current_price", 0.0))
-            collateral = float(pos.get("collateral", 0.0))
-            size = float(pos.get("size", 0.0))
-            liquidation_price = float(pos.get("liquidation_price", 0.0))
-
-            # 3) Calculate 'calculate_travel_percent'
-            pos["current_travel_percent"] = self.calculate_travel_percent(
-                position_type,
-                entry_price,
-                current_price,
-                liquidation_price
-            )
-
-            # ---------------------------
-            # NEW CODE HERE
-            # Overwrite current_travel_percent with that newly computed value:
-            # ---------------------------
-            pos["current_travel_percent"] = self.calculate_travel_percent(
-                position_type,
-                entry_price,
-                current_price,
-                liquidation_price
-            )
-            # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-            # This is the missing link: now 'current_travel_percent' won't stay at zero!
-            # ---------------------------
-
-            print(f"[DEBUG] Normalized => type={position_type}, "
-                  f"entry={entry_price}, current={current_price}, "
-                  f"collat={collateral}, size={size}, "
-                  f"travel_percent={pos['current_travel_percent']}")
-
-            # (rest of aggregator logic)...
-            # PnL, value, leverage, heat_index, etc.
-            if entry_price <= 0:
-                pnl = 0.0
-            else:
-                token_count = size / entry_price
-                if position_type == "LONG":
-                    pnl = (current_price - entry_price) * token_count
-                else:
-                    pnl = (entry_price - current_price) * token_count
-
-            pos["value"] = round(collateral + pnl, 2)
-            if collateral > 0:
-                pos["leverage"] = round(size / collateral, 2)
-            else:
-                pos["leverage"] = 0.0
-
-            pos["heat_index"] = self.calculate_heat_index(pos) or 0.0
-
-            print(f"[DEBUG] Position #{idx} AFTER aggregator => {pos}")
-
+        for pos, travel_percent, value, leverage, heat_index in zip(
+                positions, valuation["travel_percent"], valuation["value"],
+                valuation["leverage"], valuation["heat_index"]
+        ):
+            pos["current_travel_percent"] = travel_percent
+            pos["value"] = value
+            pos["leverage"] = leverage
+            pos["heat_index"] = heat_index
             processed_positions.append(pos)
 
         return processed_positions
 
+    def value_positions(
+            self,
+            positions: List[dict],
+            travel_mode: str = TRAVEL_NO_PROFIT,
+            side_rule: Callable[[Optional[str]], int] = side_of
+    ) -> Dict[str, list]:
+        """
+        Travel %, PnL, value, leverage, heat index and liquidation distance
+        for every position, as {field: list in positions order}. Runs the
+        NumPy kernel in valuation.py over a PositionBook.
+        """
+        book = PositionBook.from_positions(positions, side_rule)
+        return {field: column.tolist() for field, column in value_book(book, travel_mode).items()}
+
     def calculate_totals(self, positions: List[dict]) -> dict:
         """
         Aggregates totals/averages across all positions, e.g. sum of size/value,
@@ -409,15 +369,13 @@ class CalcServices:
     def get_color(self, value: float, metric: str) -> str:
         """
         Returns a color string based on the metric's predefined ranges in self.color_ranges.
-        If the metric isn't found, defaults to "white".
+        If the metric isn't found, defaults to "white"; outside every range
+        it is "red". Ranges swapped in after construction are compiled on
+        first use.
         """
-        if metric not in self.color_ranges:
-            return "white"
-        for (lower, upper, color) in self.color_ranges[metric]:
-            if lower <= value < upper:
-                return color
-        # If it exceeds all upper bounds, default to the last color or "red"
-        return "red"
+        if self._colors.color_ranges is not self.color_ranges:
+            self._colors = ThresholdClassifier(color_ranges=self.color_ranges)
+        return self._colors.color(value, metric)
 
     def get_alert_class(value: float, low_thresh: float, med_thresh: float, high_thresh: float):
         """
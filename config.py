@@ -1,4 +1,5 @@
 import json
+import sqlite3
 import logging
 from typing import Any, Dict
 
@@ -82,10 +83,15 @@ def ensure_overrides_table(db_conn):
 def load_overrides_from_db(db_conn) -> Dict[str, Any]:
     """
     Safely queries the DB for config overrides, returns them as a dict.
+    The table comes with the schema migrations; it is only (re)created
+    here if it has gone missing.
     """
     try:
-        ensure_overrides_table(db_conn)
-        row = db_conn.execute("SELECT overrides FROM config_overrides WHERE id=1").fetchone()
+        try:
+            row = db_conn.execute("SELECT overrides FROM config_overrides WHERE id=1").fetchone()
+        except sqlite3.OperationalError:
+            ensure_overrides_table(db_conn)
+            row = db_conn.execute("SELECT overrides FROM config_overrides WHERE id=1").fetchone()
         if row and row[0]:
             return json.loads(row[0])
         return {}
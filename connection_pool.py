@@ -0,0 +1,325 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger("ConnectionPoolLogger")
+
+DEFAULT_POOL_SIZE = 5
+
+# Named durability/performance profiles, picked with
+# system_config["db_profile"] and tweaked with system_config["db_pragmas"].
+#   - safe:     rollback journal, fsync on every commit (sqlite defaults).
+#   - balanced: WAL so readers never wait on the price monitor's writes,
+#               fsync only at checkpoints.
+#   - fast:     WAL without fsync; a power cut can lose the last commits.
+DB_PROFILES: Dict[str, Dict[str, Any]] = {
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+        "mmap_size": 0,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "mmap_size": 64 * 1024 * 1024,
+    },
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "busy_timeout": 10000,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+        "mmap_size": 256 * 1024 * 1024,
+    },
+}
+DEFAULT_DB_PROFILE = "balanced"
+
+# Pragmas that only last for one connection, so every pooled connection
+# gets them on open. journal_mode is stored in the file itself and is set
+# once by DataLocker._apply_journal_mode.
+PER_CONNECTION_PRAGMAS = ("synchronous", "busy_timeout", "cache_size", "temp_store", "mmap_size")
+
+
+def resolve_db_profile(profile: Union[str, Dict[str, Any], None]) -> Optional[Dict[str, Any]]:
+    """
+    Turns a profile name (or a dict of pragmas) into a full pragma dict.
+    A dict may carry a "profile" key naming the base profile to extend.
+    """
+    if profile is None:
+        return None
+    if isinstance(profile, str):
+        profile = {"profile": profile}
+    name = profile.get("profile", DEFAULT_DB_PROFILE)
+    if name not in DB_PROFILES:
+        logger.warning(f"Unknown db_profile '{name}', using '{DEFAULT_DB_PROFILE}'.")
+        name = DEFAULT_DB_PROFILE
+    resolved = dict(DB_PROFILES[name])
+    resolved.update({k: v for k, v in profile.items() if k != "profile"})
+    return resolved
+
+
+def read_db_profile(config_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Reads db_profile / db_pragmas from system_config in the JSON config.
+    Returns None if the file has no db_profile, leaving sqlite defaults alone.
+    """
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            system_config = json.load(f).get("system_config", {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read db profile from '{config_path}': {e}")
+        return None
+
+    name = system_config.get("db_profile")
+    if name is None:
+        return None
+    return resolve_db_profile(dict(system_config.get("db_pragmas") or {}, profile=name))
+
+
+def _pragma_value(value: Any) -> str:
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"Unsupported pragma value: {value!r}")
+    if isinstance(value, str) and not value.isalnum():
+        raise ValueError(f"Unsupported pragma value: {value!r}")
+    return str(value)
+
+
+def apply_connection_pragmas(conn: sqlite3.Connection, profile: Optional[Dict[str, Any]]):
+    """
+    Applies the per-connection part of a profile to one connection.
+    """
+    if not profile:
+        return
+    for name in PER_CONNECTION_PRAGMAS:
+        if name in profile:
+            conn.execute(f"PRAGMA {name}={_pragma_value(profile[name])}")
+
+
+def apply_journal_mode(conn: sqlite3.Connection, profile: Optional[Dict[str, Any]]) -> Optional[tuple]:
+    """
+    Sets the profile's journal_mode if the file isn't already using it.
+    Returns (old_mode, new_mode) when it changed, else None.
+    """
+    wanted = (profile or {}).get("journal_mode")
+    if not wanted:
+        return None
+    current = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if current.upper() == str(wanted).upper():
+        return None
+    new_mode = conn.execute(f"PRAGMA journal_mode={_pragma_value(wanted)}").fetchone()[0]
+    return current, new_mode
+
+
+class _Lease:
+    """
+    Holds the connection checked out by one thread.
+    Lives in the pool's threading.local, so when the thread finishes
+    (e.g. a Flask request thread) the lease is dropped and the
+    connection goes back to the idle list instead of leaking.
+    """
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        self.pool = pool
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.pid = os.getpid()
+
+    def __del__(self):
+        if self.pid != os.getpid():
+            return  # inherited across fork; see ConnectionPool._after_fork
+        try:
+            self.pool._release(self.conn)
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Thread-aware pool of sqlite3 connections for a single database file.
+      - Each thread gets one connection, reused for every call it makes.
+      - When a thread is done, its connection is parked in an idle list
+        (up to `size` connections) for the next thread to pick up.
+      - Every connection uses sqlite3.Row as row_factory.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        size: int = DEFAULT_POOL_SIZE,
+        timeout: float = 30.0,
+        profile: Optional[Dict[str, Any]] = None
+    ):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.profile = profile
+        self._local = threading.local()
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {"connects": 0, "reuses": 0, "closes": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        apply_connection_pragmas(conn, self.profile)
+        return conn
+
+    def _lease(self) -> _Lease:
+        lease = getattr(self._local, "lease", None)
+        if lease is not None:
+            return lease
+
+        conn = None
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+                self._stats["reuses"] += 1
+            else:
+                self._stats["connects"] += 1
+        if conn is None:
+            conn = self._connect()
+            logger.debug(f"Opened new pooled connection to {self.db_path}")
+
+        lease = _Lease(self, conn)
+        self._local.lease = lease
+        return lease
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns the calling thread's connection, checking one out if needed.
+        """
+        return self._lease().conn
+
+    def cursor(self) -> sqlite3.Cursor:
+        """
+        Returns the calling thread's shared cursor.
+        """
+        return self._lease().cursor
+
+    def release(self):
+        """
+        Hands the calling thread's connection back to the pool early.
+        """
+        lease = getattr(self._local, "lease", None)
+        if lease is not None:
+            self._local.lease = None
+
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if not self._closed and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+            self._stats["closes"] += 1
+        conn.close()
+
+    def configure(self, profile: Optional[Dict[str, Any]]):
+        """
+        Switches the pool to a new pragma profile. Idle connections and the
+        caller's own connection are updated now; connections leased by other
+        threads pick it up the next time they are opened.
+        """
+        with self._lock:
+            self.profile = profile
+            idle = list(self._idle)
+        for conn in idle:
+            apply_connection_pragmas(conn, profile)
+        apply_connection_pragmas(self.connection(), profile)
+
+    def resize(self, size: int):
+        """
+        Changes how many idle connections are kept around.
+        """
+        with self._lock:
+            self.size = size
+            surplus = self._idle[size:]
+            del self._idle[size:]
+            self._stats["closes"] += len(surplus)
+        for conn in surplus:
+            conn.close()
+
+    def close_all(self):
+        """
+        Closes every idle connection; leased ones are closed when returned.
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._stats["closes"] += len(idle)
+        for conn in idle:
+            conn.close()
+        self.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, idle=len(self._idle), size=self.size)
+
+    def _after_fork(self):
+        """
+        Runs in a forked child. sqlite connections must not cross a fork,
+        so the inherited ones are abandoned (not closed: closing could
+        touch the parent's journal/WAL) and the child opens its own.
+        """
+        _inherited.append((self._local, self._idle))
+        self._local = threading.local()
+        self._idle = []
+        self._lock = threading.Lock()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_key(db_path: str) -> str:
+    if db_path == ":memory:":
+        return db_path
+    return os.path.abspath(db_path)
+
+
+def get_pool(
+    db_path: str,
+    size: Optional[int] = None,
+    profile: Optional[Dict[str, Any]] = None
+) -> ConnectionPool:
+    """
+    Returns the process-wide pool for db_path, creating it on first use.
+    Passing `size` resizes an existing pool; passing `profile` reconfigures it.
+    """
+    key = _pool_key(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(key, size or DEFAULT_POOL_SIZE, profile=profile)
+            _pools[key] = pool
+            return pool
+    if size is not None and size != pool.size:
+        pool.resize(size)
+    if profile is not None and profile != pool.profile:
+        pool.configure(profile)
+    return pool
+
+
+# Connections inherited from the parent process, kept referenced so they
+# are never closed (and never finalized) in the child.
+_inherited: list = []
+
+
+def _pools_after_fork():
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in _pools.values():
+        pool._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_pools_after_fork)
@@ -1,9 +1,39 @@
+import os
 import sqlite3
 import logging
-from typing import List, Dict, Optional
+import threading
+from typing import Any, Callable, List, Dict, Optional, Tuple, Union
 from datetime import datetime
 from uuid import uuid4
 
+import numpy as np
+
+from connection_pool import get_pool, resolve_db_profile, apply_journal_mode, read_db_profile
+from config_manager import load_config
+from price_rollups import ROLLUP_RESOLUTIONS, rollup_rows, day_bounds
+from price_archive import get_archive, to_micros
+from latest_price_cache import LatestPriceCache
+from models import Alert, Broker, CryptoWallet, Position, Price
+from position_book import BOOK_COLUMNS, PositionBook, side_of
+from calc_services import CalcServices
+from portfolio_aggregator import PortfolioAggregator
+from write_behind import (
+    execute_write, get_write_behind, wait_for_own_writes,
+    configure_write_behind, stop_write_behind
+)
+from migrations import ensure_schema
+
+# Shared DataLockers, one per database file (see DataLocker.get_instance).
+_lockers: Dict[str, 'DataLocker'] = {}
+_lockers_lock = threading.Lock()
+# db paths whose startup() hook has run in this process.
+_started = set()
+
+
+def _locker_key(db_path: str) -> str:
+    return db_path if db_path == ":memory:" else os.path.abspath(db_path)
+
+
 class DataLocker:
     """
     A synchronous DataLocker that manages database interactions using sqlite3.
@@ -14,93 +44,187 @@ class DataLocker:
       - 'system_vars' (for timestamps & sources of last updates).
     """
 
-    _instance: Optional['DataLocker'] = None
 
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        pool_size: Optional[int] = None,
+        db_profile: Union[str, dict, None] = None,
+        archive_dir: Optional[str] = None
+    ):
+        """
+        db_profile is a name from connection_pool.DB_PROFILES ("safe",
+        "balanced", "fast") or a dict of pragmas, usually from
+        connection_pool.read_db_profile(config_path). None keeps whatever
+        profile the shared pool already has.
+        archive_dir, if set, turns on the price_archive mirror.
+        """
         self.db_path = db_path
         self.logger = logging.getLogger("DataLockerLogger")
-        self.conn = None
-        self.cursor = None
+        self.db_profile = resolve_db_profile(db_profile)
+        # Connections come from a process-wide pool shared by every
+        # DataLocker on this db_path, one reusable connection per thread.
+        self.pool = get_pool(db_path, pool_size, self.db_profile)
+        self.archive = None
+        self.price_cache = LatestPriceCache(self._load_latest_prices)
+        # Running portfolio totals, fed by the commit hooks; see read_portfolio.
+        self.portfolio = PortfolioAggregator()
+        # Bumped whenever set_hedge_buddies commits (see HedgeEngine).
+        self.hedge_version = 0
         self._initialize_database()
+        if archive_dir:
+            self.attach_archive(archive_dir)
 
-    def _initialize_database(self):
-        try:
-            self._init_sqlite_if_needed()
-
-            # ... (existing CREATE TABLE statements) ...
-
-            # SYSTEM_VARS table
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS system_vars (
-                    id INTEGER PRIMARY KEY,
-                    last_update_time_positions DATETIME,
-                    last_update_positions_source TEXT,
-                    last_update_time_prices DATETIME,
-                    last_update_prices_source TEXT
-                )
-            """)
-            self.cursor.execute("""
-                INSERT OR IGNORE INTO system_vars (
-                    id,
-                    last_update_time_positions,
-                    last_update_positions_source,
-                    last_update_time_prices,
-                    last_update_prices_source
-                )
-                VALUES (1, NULL, NULL, NULL, NULL)
-            """)
-
-            # -- NEW: Check if total_brokerage_balance, total_wallet_balance, total_balance exist
-            self.cursor.execute("PRAGMA table_info(system_vars)")
-            existing_cols = [row[1] for row in self.cursor.fetchall()]
-
-            # If missing, add them:
-            if "total_brokerage_balance" not in existing_cols:
-                self.cursor.execute("""
-                    ALTER TABLE system_vars
-                    ADD COLUMN total_brokerage_balance REAL DEFAULT 0.0
-                """)
-                self.logger.info("Added 'total_brokerage_balance' column to 'system_vars' table.")
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        The calling thread's pooled connection. In write-behind mode this
+        first waits for the thread's own queued writes (read-your-writes).
+        """
+        wait_for_own_writes()
+        return self.pool.connection()
 
-            if "total_wallet_balance" not in existing_cols:
-                self.cursor.execute("""
-                    ALTER TABLE system_vars
-                    ADD COLUMN total_wallet_balance REAL DEFAULT 0.0
-                """)
-                self.logger.info("Added 'total_wallet_balance' column to 'system_vars' table.")
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """
+        The calling thread's shared cursor on its pooled connection.
+        """
+        wait_for_own_writes()
+        return self.pool.cursor()
 
-            if "total_balance" not in existing_cols:
-                self.cursor.execute("""
-                    ALTER TABLE system_vars
-                    ADD COLUMN total_balance REAL DEFAULT 0.0
-                """)
-                self.logger.info("Added 'total_balance' column to 'system_vars' table.")
+    @property
+    def write_behind(self):
+        """
+        The running write-behind queue for this database, or None.
+        """
+        return get_write_behind(self.db_path)
 
-            self.conn.commit()
-            self.logger.debug("Database initialization complete.")
+    def _execute_write(
+            self,
+            fn: Callable[[sqlite3.Connection], Any],
+            wait: bool = False,
+            after: Optional[Callable[[], None]] = None
+    ):
+        """
+        Every mutation goes through here as fn(conn), which must not commit.
+        Normally it runs at once in its own transaction and fn's result is
+        returned. With write-behind on it is queued for the writer thread
+        and a Future comes back instead (fn's result if wait=True).
+        `after` runs once the write is committed.
+        """
+        return execute_write(self.db_path, fn, wait=wait, after=after)
 
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Barrier for write-behind mode: returns once every write queued so
+        far (by any thread) is committed. A no-op otherwise.
+        """
+        wb = self.write_behind
+        if wb is not None:
+            wb.flush(timeout)
+
+    def _initialize_database(self):
+        """
+        Applies the profile's journal_mode and brings the schema up to date
+        (see migrations.py). Migrations run once per db_path per process,
+        so every later DataLocker on the same file skips straight past.
+        """
+        try:
+            self._apply_journal_mode()
+            ensure_schema(self)
         except sqlite3.Error as e:
             self.logger.error(f"Error initializing database: {e}", exc_info=True)
             raise
 
-    @classmethod
-    def get_instance(cls, db_path: str) -> 'DataLocker':
+    def _apply_journal_mode(self):
         """
-        Returns a singleton-ish instance of DataLocker.
+        journal_mode is persisted in the database file, so it only needs
+        setting when the profile asks for something different.
         """
-        if cls._instance is None:
-            cls._instance = cls(db_path)
-        return cls._instance
+        changed = apply_journal_mode(self.conn, self.db_profile)
+        if changed:
+            self.logger.info(f"journal_mode changed from {changed[0]} to {changed[1]}.")
+
+    # ----------------------------------------------------------------
+    # SHARED INSTANCES
+    # ----------------------------------------------------------------
+
+    @classmethod
+    def get_instance(cls, db_path: str, **kwargs) -> 'DataLocker':
+        """
+        Returns the process-wide DataLocker for db_path, creating it on
+        first use (kwargs only apply then). The Flask routes, AlertManager
+        and PriceMonitor all share it instead of building their own.
+        """
+        key = _locker_key(db_path)
+        locker = _lockers.get(key)
+        if locker is not None:
+            return locker
+        with _lockers_lock:
+            locker = _lockers.get(key)
+            if locker is None:
+                locker = cls(db_path, **kwargs)
+                _lockers[key] = locker
+            return locker
+
+    @classmethod
+    def startup(cls, db_path: str, config_path: str = "sonic_config.json") -> 'DataLocker':
+        """
+        Process start hook. Returns the shared locker for db_path with the
+        config's db profile applied, and turns on write-behind and the
+        price archive if system_config asks for them. Every component
+        calls it; the work is only done once per db_path per process (and
+        once more in a forked child, whose writer threads are gone).
+        """
+        key = _locker_key(db_path)
+        with _lockers_lock:
+            locker = _lockers.get(key)
+            if key in _started:
+                return locker
+            profile = read_db_profile(config_path)
+            if locker is None:
+                locker = cls(db_path, db_profile=profile)
+                _lockers[key] = locker
+            elif profile is not None:
+                locker.db_profile = profile
+                locker.pool = get_pool(db_path, None, profile)
+                locker._apply_journal_mode()
+
+            config = load_config(config_path, locker.conn)
+            configure_write_behind(db_path, config)
+            system_config = config.get("system_config", {})
+            archive_dir = system_config.get("price_archive_dir")
+            if archive_dir and locker.archive is None:
+                locker.attach_archive(archive_dir)
+            if system_config.get("latest_price_cache_ttl") is not None:
+                locker.price_cache.ttl = float(system_config["latest_price_cache_ttl"])
+            _started.add(key)
+            locker.logger.info(f"DataLocker started for {key}.")
+            return locker
+
+    @classmethod
+    def shutdown(cls, db_path: Optional[str] = None):
+        """
+        Process exit hook: drains write-behind, closes the pooled
+        connections and drops the shared locker for db_path (or for every
+        database if db_path is None). A later get_instance starts over.
+        """
+        with _lockers_lock:
+            keys = list(_lockers) if db_path is None else [_locker_key(db_path)]
+            lockers = [(key, _lockers.pop(key, None)) for key in keys]
+            _started.difference_update(keys)
+        for key, locker in lockers:
+            if locker is None:
+                continue
+            stop_write_behind(key)
+            locker.pool.close_all()
+            locker.logger.info(f"DataLocker shut down for {key}.")
 
     def _init_sqlite_if_needed(self):
         """
-        Ensures self.conn and self.cursor are available.
+        Ensures this thread has a pooled connection checked out.
         """
-        if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
-        if self.cursor is None:
-            self.cursor = self.conn.cursor()
+        self.pool.connection()
 
     def get_db_connection(self) -> sqlite3.Connection:
         """
@@ -134,108 +258,40 @@ class DataLocker:
         return results
 
     def reset_api_counters(self):
-        self._init_sqlite_if_needed()
-        self.cursor.execute("UPDATE api_status_counters SET total_reports = 0")
-        self.conn.commit()
+        def write(conn):
+            conn.execute("UPDATE api_status_counters SET total_reports = 0")
+        self._execute_write(write)
 
     def increment_api_report_counter(self, api_name: str) -> None:
         """
         Increments total_reports for api_name by 1, sets last_updated to now.
         """
-        self._init_sqlite_if_needed()
-        self.cursor.execute(
-            "SELECT total_reports FROM api_status_counters WHERE api_name = ?",
-            (api_name,)
-        )
-        row = self.cursor.fetchone()
         now_str = datetime.now().isoformat()
-        old_count = row["total_reports"] if row else 0
-        self.logger.debug(f"Previous total_reports for {api_name}={old_count}")
-
-        if row is None:
-            self.cursor.execute("""
-                INSERT INTO api_status_counters (api_name, total_reports, last_updated)
-                VALUES (?, 1, ?)
-            """, (api_name, now_str))
-        else:
-            self.cursor.execute("""
-                UPDATE api_status_counters
-                   SET total_reports = total_reports + 1,
-                       last_updated = ?
-                 WHERE api_name = ?
-            """, (now_str, api_name))
-
-        self.conn.commit()
-        self.logger.debug(
-            f"Incremented API report counter for {api_name}, last_updated={now_str}."
-        )
-
-    def get_balance_vars(self) -> dict:
-        """
-        Return a dict with the 3 columns:
-          "total_brokerage_balance",
-          "total_wallet_balance",
-          "total_balance"
-        from system_vars where id=1
-        """
-        self._init_sqlite_if_needed()
-
-        # Attempt to fetch the single system_vars row with id=1
-        row = self.cursor.execute("""
-            SELECT
-              total_brokerage_balance,
-              total_wallet_balance,
-              total_balance
-            FROM system_vars
-            WHERE id=1
-        """).fetchone()
-
-        # If row not found, return default zeros
-        if not row:
-            return {
-                "total_brokerage_balance": 0.0,
-                "total_wallet_balance": 0.0,
-                "total_balance": 0.0
-            }
-
-        # Return them as floats (in case they're None, fallback to 0.0)
-        return {
-            "total_brokerage_balance": row["total_brokerage_balance"] or 0.0,
-            "total_wallet_balance": row["total_wallet_balance"] or 0.0,
-            "total_balance": row["total_balance"] or 0.0
-        }
-
-    def set_balance_vars(
-            self,
-            brokerage_balance: float = None,
-            wallet_balance: float = None,
-            total_balance: float = None
-    ):
-        """
-        Update any of the 3 columns in system_vars (id=1).
-        Pass None if you don't want to change that field.
-        """
-        self._init_sqlite_if_needed()
-
-        # Get existing values so we can preserve anything not being updated
-        current = self.get_balance_vars()
-
-        new_brokerage = brokerage_balance if brokerage_balance is not None else current["total_brokerage_balance"]
-        new_wallet = wallet_balance if wallet_balance is not None else current["total_wallet_balance"]
-        new_total = total_balance if total_balance is not None else current["total_balance"]
-
-        self.cursor.execute("""
-            UPDATE system_vars
-               SET total_brokerage_balance=?,
-                   total_wallet_balance=?,
-                   total_balance=?
-             WHERE id=1
-        """, (new_brokerage, new_wallet, new_total))
-        self.conn.commit()
 
+        def write(conn):
+            row = conn.execute(
+                "SELECT total_reports FROM api_status_counters WHERE api_name = ?",
+                (api_name,)
+            ).fetchone()
+            old_count = row["total_reports"] if row else 0
+            self.logger.debug(f"Previous total_reports for {api_name}={old_count}")
+
+            if row is None:
+                conn.execute("""
+                    INSERT INTO api_status_counters (api_name, total_reports, last_updated)
+                    VALUES (?, 1, ?)
+                """, (api_name, now_str))
+            else:
+                conn.execute("""
+                    UPDATE api_status_counters
+                       SET total_reports = total_reports + 1,
+                           last_updated = ?
+                     WHERE api_name = ?
+                """, (now_str, api_name))
+
+        self._execute_write(write)
         self.logger.debug(
-            f"Updated system_vars => total_brokerage_balance={new_brokerage}, "
-            f"total_wallet_balance={new_wallet}, total_balance={new_total}"
+            f"Incremented API report counter for {api_name}, last_updated={now_str}."
         )
 
     def insert_price(self, price_dict: dict):
@@ -258,38 +314,63 @@ class DataLocker:
             if "source" not in price_dict:
                 price_dict["source"] = "Manual"
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO prices (
-                    id,
-                    asset_type,
-                    current_price,
-                    previous_price,
-                    last_update_time,
-                    previous_update_time,
-                    source
-                )
-                VALUES (
-                    :id, :asset_type, :current_price, :previous_price,
-                    :last_update_time, :previous_update_time, :source
-                )
-            """, price_dict)
-            conn.commit()
-            conn.close()
+            def write(conn):
+                conn.execute(self._INSERT_PRICE_SQL, price_dict)
+                conn.execute(self._UPSERT_LATEST_PRICE_SQL, price_dict)
+                conn.executemany(self._UPSERT_ROLLUP_SQL, rollup_rows([price_dict]))
+
+            self._execute_write(write, after=lambda: self._prices_committed([price_dict]))
             self.logger.debug(f"Inserted price row with ID={price_dict['id']}")
         except Exception as e:
             self.logger.exception(f"Unexpected error in insert_price: {e}")
             raise
 
+    def insert_prices_bulk(self, batch: List[dict]) -> int:
+        """
+        Inserts a whole batch of price rows (e.g. every symbol of one
+        monitor tick) with executemany in a single transaction, updating
+        latest_prices alongside. Each item needs asset_type and
+        current_price; a datetime under "timestamp" sets last_update_time,
+        and any other missing field gets the same default as insert_price.
+        Returns the number of rows inserted.
+        """
+        if not batch:
+            return 0
+
+        now_str = datetime.now().isoformat()
+        rows = []
+        for item in batch:
+            timestamp = item.get("timestamp")
+            rows.append({
+                "id": item.get("id") or str(uuid4()),
+                "asset_type": item.get("asset_type", "BTC"),
+                "current_price": item.get("current_price", 1.0),
+                "previous_price": item.get("previous_price", 0.0),
+                "last_update_time": item.get("last_update_time")
+                    or (timestamp.isoformat() if timestamp else now_str),
+                "previous_update_time": item.get("previous_update_time"),
+                "source": item.get("source", "Manual"),
+            })
+
+        try:
+            def write(conn):
+                conn.executemany(self._INSERT_PRICE_SQL, rows)
+                conn.executemany(self._UPSERT_LATEST_PRICE_SQL, rows)
+                conn.executemany(self._UPSERT_ROLLUP_SQL, rollup_rows(rows))
+
+            self._execute_write(write, after=lambda: self._prices_committed(rows))
+            self.logger.debug(f"Bulk inserted {len(rows)} price rows.")
+            return len(rows)
+        except sqlite3.Error as e:
+            self.logger.error(f"Database error in insert_prices_bulk: {e}", exc_info=True)
+            raise
+
     def get_prices(self, asset_type: Optional[str] = None) -> List[dict]:
         """
         Returns rows from 'prices' as a list of dicts. Can filter by asset_type.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+            cursor = self.conn.cursor()
             if asset_type:
                 cursor.execute("""
                     SELECT *
@@ -304,7 +385,6 @@ class DataLocker:
                      ORDER BY last_update_time DESC
                 """)
             rows = cursor.fetchall()
-            conn.close()
 
             price_list = [dict(row) for row in rows]
             self.logger.debug(f"Retrieved {len(price_list)} price rows.")
@@ -317,44 +397,26 @@ class DataLocker:
             return []
 
     def read_positions(self) -> List[dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM positions")
-        rows = cur.fetchall()
-        conn.close()
+        rows = self.conn.execute("SELECT * FROM positions").fetchall()
         return [dict(r) for r in rows]
 
     def read_prices(self) -> List[dict]:
         """
         Returns all rows from 'prices' as plain dicts.
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM prices ORDER BY last_update_time DESC")
-        rows = cur.fetchall()
-        conn.close()
+        rows = self.conn.execute(
+            "SELECT * FROM prices ORDER BY last_update_time DESC"
+        ).fetchall()
         return [dict(r) for r in rows]
 
     def get_latest_price(self, asset_type: str) -> Optional[dict]:
         """
         Returns the newest price row for this asset_type or None.
+        Served from price_cache; see get_latest_prices.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT *
-                  FROM prices
-                 WHERE asset_type=?
-                 ORDER BY last_update_time DESC
-                 LIMIT 1
-            """, (asset_type,))
-            row = cur.fetchone()
-            conn.close()
-            return dict(row) if row else None
+            wait_for_own_writes()
+            return self.price_cache.get(asset_type)
         except sqlite3.Error as e:
             self.logger.error(f"Database error in get_latest_price: {e}", exc_info=True)
             return None
@@ -362,16 +424,43 @@ class DataLocker:
             self.logger.exception(f"Unexpected error in get_latest_price: {ex}")
             return None
 
+    def get_latest_prices(self, assets: List[str]) -> Dict[str, dict]:
+        """
+        Newest price row per asset, {asset_type: row}, for the assets that
+        have one. Cache misses are read in one query.
+        """
+        try:
+            wait_for_own_writes()
+            return self.price_cache.get_many(assets)
+        except sqlite3.Error as e:
+            self.logger.error(f"Database error in get_latest_prices: {e}", exc_info=True)
+            return {}
+
     def delete_price(self, price_id: str):
         """
         Delete a price row by ID.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cur = conn.cursor()
-            cur.execute("DELETE FROM prices WHERE id=?", (price_id,))
-            conn.commit()
-            conn.close()
+            def write(conn):
+                row = conn.execute(
+                    "SELECT asset_type, last_update_time FROM prices WHERE id=?", (price_id,)
+                ).fetchone()
+                latest = conn.execute(
+                    "SELECT asset_type FROM latest_prices WHERE id=?", (price_id,)
+                ).fetchone()
+                conn.execute("DELETE FROM prices WHERE id=?", (price_id,))
+                if latest:
+                    self._refresh_latest_price(latest["asset_type"])
+                if row:
+                    ts = row["last_update_time"]
+                    self._rebuild_rollups(row["asset_type"], *day_bounds(ts, ts))
+                return latest
+
+            latest = self._execute_write(write, wait=True)
+            if latest:
+                # The asset's latest price steps back to an older tick.
+                self.price_cache.invalidate([latest["asset_type"]])
+                self.portfolio.invalidate()
             self.logger.debug(f"Deleted price row ID={price_id}")
         except sqlite3.Error as e:
             self.logger.error(f"Database error in delete_price: {e}", exc_info=True)
@@ -380,6 +469,339 @@ class DataLocker:
             self.logger.exception(f"Unexpected error in delete_price: {ex}")
             raise
 
+    def delete_all_prices(self):
+        """
+        Delete every price row (and the latest-price snapshot with them).
+        """
+        try:
+            def write(conn):
+                conn.execute("DELETE FROM prices")
+                conn.execute("DELETE FROM latest_prices")
+                conn.execute("DELETE FROM price_rollups")
+
+            self._execute_write(write, after=self._prices_deleted)
+            self.logger.debug("Deleted all prices.")
+        except sqlite3.Error as e:
+            self.logger.error(f"Database error in delete_all_prices: {e}", exc_info=True)
+            raise
+
+    # ----------------------------------------------------------------
+    # LATEST PRICES
+    # ----------------------------------------------------------------
+
+    _INSERT_PRICE_SQL = """
+        INSERT INTO prices (
+            id,
+            asset_type,
+            current_price,
+            previous_price,
+            last_update_time,
+            previous_update_time,
+            source
+        )
+        VALUES (
+            :id, :asset_type, :current_price, :previous_price,
+            :last_update_time, :previous_update_time, :source
+        )
+    """
+
+    # Keeps latest_prices pointing at the newest row per asset; an older
+    # (late-arriving) tick never replaces a newer one.
+    _UPSERT_LATEST_PRICE_SQL = """
+        INSERT INTO latest_prices (
+            asset_type, id, current_price, previous_price,
+            last_update_time, previous_update_time, source
+        )
+        VALUES (
+            :asset_type, :id, :current_price, :previous_price,
+            :last_update_time, :previous_update_time, :source
+        )
+        ON CONFLICT(asset_type) DO UPDATE SET
+            id = excluded.id,
+            current_price = excluded.current_price,
+            previous_price = excluded.previous_price,
+            last_update_time = excluded.last_update_time,
+            previous_update_time = excluded.previous_update_time,
+            source = excluded.source
+        WHERE excluded.last_update_time >= latest_prices.last_update_time
+    """
+
+    _LATEST_PRICE_COLUMNS = (
+        "asset_type", "id", "current_price", "previous_price",
+        "last_update_time", "previous_update_time", "source",
+    )
+
+    def _load_latest_prices(self, assets: List[str]) -> Dict[str, dict]:
+        """
+        price_cache loader: latest_prices rows for the given assets.
+        """
+        placeholders = ",".join("?" * len(assets))
+        rows = self.conn.execute(
+            f"SELECT * FROM latest_prices WHERE asset_type IN ({placeholders})", assets
+        ).fetchall()
+        return {row["asset_type"]: dict(row) for row in rows}
+
+    def _prices_committed(self, rows: List[dict]):
+        """
+        Runs once new price rows are committed: writes them through to
+        price_cache, reprices the portfolio totals and mirrors them into
+        the archive.
+        """
+        self.price_cache.put({c: r[c] for c in self._LATEST_PRICE_COLUMNS} for r in rows)
+        self.portfolio.apply_ticks(rows)
+        self._mirror_to_archive([r["asset_type"] for r in rows])
+
+    def _prices_deleted(self):
+        self.price_cache.invalidate()
+        self.portfolio.invalidate()
+
+    def _refresh_latest_price(self, asset_type: str):
+        """
+        Re-reads the newest prices row for one asset into latest_prices.
+        Runs inside the caller's transaction.
+        """
+        conn = self.conn
+        conn.execute("DELETE FROM latest_prices WHERE asset_type=?", (asset_type,))
+        conn.execute("""
+            INSERT INTO latest_prices (
+                asset_type, id, current_price, previous_price,
+                last_update_time, previous_update_time, source
+            )
+            SELECT asset_type, id, current_price, previous_price,
+                   last_update_time, previous_update_time, source
+              FROM prices
+             WHERE asset_type=?
+             ORDER BY last_update_time DESC
+             LIMIT 1
+        """, (asset_type,))
+
+    def _rebuild_latest_prices(self):
+        """
+        Rebuilds latest_prices from the full prices history.
+        Runs inside the caller's transaction.
+        """
+        conn = self.conn
+        conn.execute("DELETE FROM latest_prices")
+        # SQLite returns the other columns from the row holding MAX().
+        conn.execute("""
+            INSERT INTO latest_prices (
+                asset_type, id, current_price, previous_price,
+                last_update_time, previous_update_time, source
+            )
+            SELECT asset_type, id, current_price, previous_price,
+                   MAX(last_update_time), previous_update_time, source
+              FROM prices
+             GROUP BY asset_type
+        """)
+        self.logger.debug("Rebuilt latest_prices from prices history.")
+
+    # ----------------------------------------------------------------
+    # PRICE ROLLUPS
+    # ----------------------------------------------------------------
+
+    # Folds one tick into its bucket. Open/close follow the tick times, so
+    # late-arriving ticks still land in the right place.
+    _UPSERT_ROLLUP_SQL = """
+        INSERT INTO price_rollups (
+            asset_type, resolution, bucket_start,
+            open, high, low, close, count, first_time, last_time
+        )
+        VALUES (
+            :asset_type, :resolution, :bucket_start,
+            :price, :price, :price, :price, 1, :ts, :ts
+        )
+        ON CONFLICT(asset_type, resolution, bucket_start) DO UPDATE SET
+            open = CASE WHEN excluded.first_time < price_rollups.first_time
+                        THEN excluded.open ELSE price_rollups.open END,
+            close = CASE WHEN excluded.last_time >= price_rollups.last_time
+                         THEN excluded.close ELSE price_rollups.close END,
+            high = MAX(price_rollups.high, excluded.high),
+            low = MIN(price_rollups.low, excluded.low),
+            count = price_rollups.count + 1,
+            first_time = MIN(price_rollups.first_time, excluded.first_time),
+            last_time = MAX(price_rollups.last_time, excluded.last_time)
+    """
+
+    def _rebuild_rollups(
+            self,
+            asset_type: Optional[str] = None,
+            start: Optional[str] = None,
+            end: Optional[str] = None
+    ) -> int:
+        """
+        Recomputes rollups from raw prices in [start, end) (all raw history if
+        omitted), optionally for one asset. Pass day-aligned bounds so every
+        bucket in the range is rebuilt from all of its ticks. Buckets older
+        than the oldest raw tick are kept, since retention may have pruned
+        the ticks behind them.
+        Runs inside the caller's transaction; returns rows written.
+        """
+        conn = self.conn
+        asset_filter = "" if asset_type is None else "AND asset_type = :asset"
+        if start is None:
+            oldest = conn.execute(
+                f"SELECT MIN(last_update_time) FROM prices WHERE 1=1 {asset_filter}",
+                {"asset": asset_type}
+            ).fetchone()[0]
+            if oldest is None:
+                return 0
+            start = day_bounds(oldest, oldest)[0]
+        # Filters are spliced in rather than written as "(:x IS NULL OR ...)"
+        # so sqlite can still use idx_prices_asset_time for the range.
+        end_filter = "" if end is None else "AND {col} < :end"
+        params = {"asset": asset_type, "start": start, "end": end}
+        conn.execute(f"""
+            DELETE FROM price_rollups
+             WHERE bucket_start >= :start
+               {asset_filter}
+               {end_filter.format(col="bucket_start")}
+        """, params)
+
+        written = 0
+        for resolution, (keep, pad) in ROLLUP_RESOLUTIONS.items():
+            # Open/close come from the rows holding the bucket's first/last
+            # timestamp (cheap lookups on idx_prices_asset_time).
+            written += conn.execute(f"""
+                INSERT INTO price_rollups (
+                    asset_type, resolution, bucket_start,
+                    open, high, low, close, count, first_time, last_time
+                )
+                SELECT g.asset_type, :resolution, g.bucket,
+                       (SELECT current_price FROM prices
+                         WHERE asset_type = g.asset_type AND last_update_time = g.first_time
+                         LIMIT 1),
+                       g.high, g.low,
+                       (SELECT current_price FROM prices
+                         WHERE asset_type = g.asset_type AND last_update_time = g.last_time
+                         LIMIT 1),
+                       g.n, g.first_time, g.last_time
+                  FROM (
+                    SELECT asset_type,
+                           substr(last_update_time, 1, :keep) || :pad AS bucket,
+                           MAX(current_price) AS high,
+                           MIN(current_price) AS low,
+                           COUNT(*) AS n,
+                           MIN(last_update_time) AS first_time,
+                           MAX(last_update_time) AS last_time
+                      FROM prices
+                     WHERE last_update_time >= :start
+                       {asset_filter}
+                       {end_filter.format(col="last_update_time")}
+                     GROUP BY asset_type, bucket
+                  ) AS g
+            """, dict(params, resolution=resolution, keep=keep, pad=pad)).rowcount
+        return written
+
+    def rebuild_price_rollups(
+            self,
+            asset_type: Optional[str] = None,
+            start: Optional[datetime] = None,
+            end: Optional[datetime] = None
+    ) -> int:
+        """
+        Backfills rollups from the raw prices table, either for the whole
+        history or for the days spanning [start, end]. Returns rows written.
+        """
+        bounds = (None, None)
+        if start is not None or end is not None:
+            bounds = day_bounds(start or datetime.min, end or datetime.now())
+        try:
+            written = self._execute_write(
+                lambda conn: self._rebuild_rollups(asset_type, *bounds), wait=True
+            )
+            self.logger.info(f"Rebuilt {written} price rollup rows.")
+            return written
+        except sqlite3.Error as e:
+            self.logger.error(f"Database error in rebuild_price_rollups: {e}", exc_info=True)
+            raise
+
+    def get_price_series(
+            self,
+            asset_type: str,
+            resolution: str = "1h",
+            start: Optional[datetime] = None,
+            end: Optional[datetime] = None
+    ) -> List[dict]:
+        """
+        Returns OHLC buckets for one asset at '1m', '1h' or '1d', oldest
+        first, with bucket_start in [start, end).
+        """
+        if resolution not in ROLLUP_RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}', use one of {list(ROLLUP_RESOLUTIONS)}")
+        start_str = start.isoformat() if isinstance(start, datetime) else start
+        end_str = end.isoformat() if isinstance(end, datetime) else end
+        rows = self.conn.execute("""
+            SELECT bucket_start, open, high, low, close, count
+              FROM price_rollups
+             WHERE asset_type = ?
+               AND resolution = ?
+               AND (? IS NULL OR bucket_start >= ?)
+               AND (? IS NULL OR bucket_start < ?)
+             ORDER BY bucket_start
+        """, (asset_type, resolution, start_str, start_str, end_str, end_str)).fetchall()
+        return [dict(r) for r in rows]
+
+    # ----------------------------------------------------------------
+    # PRICE ARCHIVE
+    # ----------------------------------------------------------------
+
+    def attach_archive(self, archive_dir: str):
+        """
+        Starts mirroring price inserts into the columnar archive in
+        archive_dir, catching it up with any ticks it is missing.
+        The archive is optional: if it cannot be opened that is just logged.
+        """
+        try:
+            self.archive = get_archive(archive_dir)
+            synced = self.archive.sync(self.conn)
+            self.logger.info(f"Price archive at {archive_dir} attached ({synced} ticks caught up).")
+        except (ValueError, OSError) as e:
+            self.archive = None
+            self.logger.error(f"Price archive disabled: {e}")
+
+    def _mirror_to_archive(self, assets: List[str]):
+        """
+        Appends newly committed ticks to the archive. Runs after the commit
+        and never fails the insert; a tick older than the archive end is
+        skipped until `python price_archive.py --rebuild`.
+        """
+        if self.archive is None:
+            return
+        try:
+            self.archive.sync(self.conn, assets)
+        except (ValueError, OSError) as e:
+            self.logger.warning(f"Price archive mirror skipped: {e}")
+
+    def read_price_archive(self, asset_type: str, start=None, end=None):
+        """
+        (timestamps, prices) NumPy views for asset_type with start <= t < end,
+        read zero-copy from the archive. See PriceArchive.read_range.
+        """
+        if self.archive is None:
+            raise RuntimeError("No price archive attached; pass archive_dir or call attach_archive().")
+        return self.archive.read_range(asset_type, start, end)
+
+    def read_price_ticks(self, asset_type: str, start=None, end=None):
+        """
+        (timestamps, prices) for asset_type with start <= t < end, oldest
+        first, timestamps as int64 microseconds: from the archive when one
+        is attached, otherwise from the prices table.
+        """
+        if self.archive is not None:
+            return self.read_price_archive(asset_type, start, end)
+        start_str = start.isoformat() if isinstance(start, datetime) else start
+        end_str = end.isoformat() if isinstance(end, datetime) else end
+        rows = self.conn.execute("""
+            SELECT last_update_time, current_price
+              FROM prices
+             WHERE asset_type = ?
+               AND (? IS NULL OR last_update_time >= ?)
+               AND (? IS NULL OR last_update_time < ?)
+             ORDER BY last_update_time
+        """, (asset_type, start_str, start_str, end_str, end_str)).fetchall()
+        stamps = [r[0] for r in rows]
+        return to_micros(stamps), np.array([r[1] for r in rows], dtype=np.float64)
+
     # ----------------------------------------------------------------
     # ALERTS
     # ----------------------------------------------------------------
@@ -391,35 +813,34 @@ class DataLocker:
         try:
             if not alert_dict.get("id"):
                 alert_dict["id"] = str(uuid4())
-            conn = sqlite3.connect(self.db_path)
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO alerts (
-                    id,
-                    alert_type,
-                    asset_type,
-                    trigger_value,
-                    condition,
-                    notification_type,
-                    last_triggered,
-                    status,
-                    frequency,
-                    counter,
-                    liquidation_distance,
-                    target_travel_percent,
-                    liquidation_price,
-                    notes,
-                    position_reference_id
-                ) VALUES (
-                    :id, :alert_type, :asset_type,
-                    :trigger_value, :condition, :notification_type,
-                    :last_triggered, :status, :frequency, :counter,
-                    :liquidation_distance, :target_travel_percent,
-                    :liquidation_price, :notes, :position_reference_id
-                )
-            """, alert_dict)
-            conn.commit()
-            conn.close()
+            def write(conn):
+                conn.execute("""
+                    INSERT INTO alerts (
+                        id,
+                        alert_type,
+                        asset_type,
+                        trigger_value,
+                        condition,
+                        notification_type,
+                        last_triggered,
+                        status,
+                        frequency,
+                        counter,
+                        liquidation_distance,
+                        target_travel_percent,
+                        liquidation_price,
+                        notes,
+                        position_reference_id
+                    ) VALUES (
+                        :id, :alert_type, :asset_type,
+                        :trigger_value, :condition, :notification_type,
+                        :last_triggered, :status, :frequency, :counter,
+                        :liquidation_distance, :target_travel_percent,
+                        :liquidation_price, :notes, :position_reference_id
+                    )
+                """, alert_dict)
+
+            self._execute_write(write)
             self.logger.debug(f"Created alert ID={alert_dict['id']}")
         except sqlite3.IntegrityError as ie:
             self.logger.error(f"IntegrityError creating alert: {ie}", exc_info=True)
@@ -435,12 +856,7 @@ class DataLocker:
         Return all alerts as a list of dictionaries.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM alerts")
-            rows = cur.fetchall()
-            conn.close()
+            rows = self.conn.execute("SELECT * FROM alerts").fetchall()
             alert_list = [dict(r) for r in rows]
             self.logger.debug(f"Fetched {len(alert_list)} alerts.")
             return alert_list
@@ -456,15 +872,14 @@ class DataLocker:
         Update 'status' field of an alert by ID.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cur = conn.cursor()
-            cur.execute("""
-                UPDATE alerts
-                   SET status=?
-                 WHERE id=?
-            """, (new_status, alert_id))
-            conn.commit()
-            conn.close()
+            def write(conn):
+                conn.execute("""
+                    UPDATE alerts
+                       SET status=?
+                     WHERE id=?
+                """, (new_status, alert_id))
+
+            self._execute_write(write)
             self.logger.debug(f"Alert {alert_id} => status={new_status}")
         except sqlite3.Error as e:
             self.logger.error(f"DB error update_alert_status: {e}", exc_info=True)
@@ -478,11 +893,9 @@ class DataLocker:
         Delete alert by ID
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cur = conn.cursor()
-            cur.execute("DELETE FROM alerts WHERE id=?", (alert_id,))
-            conn.commit()
-            conn.close()
+            self._execute_write(
+                lambda conn: conn.execute("DELETE FROM alerts WHERE id=?", (alert_id,))
+            )
             self.logger.debug(f"Deleted alert ID={alert_id}")
         except sqlite3.Error as e:
             self.logger.error(f"DB error in delete_alert: {e}", exc_info=True)
@@ -522,9 +935,60 @@ class DataLocker:
     # POSITIONS
     # ----------------------------------------------------------------
 
-    def create_position(self, pos_dict: dict):
+    _INSERT_POSITION_SQL = """
+        INSERT INTO positions (
+            id, asset_type, position_type,
+            entry_price, liquidation_price, current_travel_percent,
+            value, collateral, size, wallet_name, leverage, last_updated,
+            alert_reference_id, hedge_buddy_id, current_price,
+            liquidation_distance, heat_index, current_heat_index
+        ) VALUES (
+            :id, :asset_type, :position_type,
+            :entry_price, :liquidation_price, :current_travel_percent,
+            :value, :collateral, :size, :wallet_name, :leverage, :last_updated,
+            :alert_reference_id, :hedge_buddy_id, :current_price,
+            :liquidation_distance, :heat_index, :current_heat_index
+        )
+    """
+
+    # A position is identified by wallet + market + side + size + collateral
+    # + Jupiter's updatedTime (idx_positions_natural_key), the same fields
+    # the old duplicate check compared. Re-importing the same one refreshes
+    # its numbers instead of adding a duplicate row. Unlike the old check
+    # (and _REFRESH_POSITION_SQL), the unique index compares the REAL size
+    # and collateral exactly, not within 0.000001: a re-import whose size
+    # or collateral differs in the last digits is stored as a new row.
+    _UPSERT_POSITION_SQL = _INSERT_POSITION_SQL + """
+        ON CONFLICT(wallet_name, asset_type, position_type, size, collateral, last_updated) DO UPDATE SET
+            entry_price = excluded.entry_price,
+            liquidation_price = excluded.liquidation_price,
+            value = excluded.value,
+            leverage = excluded.leverage
+        WHERE entry_price IS NOT excluded.entry_price
+           OR liquidation_price IS NOT excluded.liquidation_price
+           OR value IS NOT excluded.value
+           OR leverage IS NOT excluded.leverage
+    """
+
+    # Used while idx_positions_natural_key is missing (see migrations):
+    # refreshes the stored copies, if any, matched as the old import did.
+    _REFRESH_POSITION_SQL = """
+        UPDATE positions SET
+            entry_price = :entry_price,
+            liquidation_price = :liquidation_price,
+            value = :value,
+            leverage = :leverage
+         WHERE wallet_name IS :wallet_name
+           AND asset_type = :asset_type
+           AND position_type = :position_type
+           AND ABS(size - :size) < 0.000001
+           AND ABS(collateral - :collateral) < 0.000001
+           AND last_updated IS :last_updated
+    """
+
+    def _apply_position_defaults(self, pos_dict: dict) -> dict:
         """
-        Insert new position row. Provides defaults if fields missing.
+        Fills in any missing position fields (in place) and returns the dict.
         """
         if "id" not in pos_dict:
             pos_dict["id"] = str(uuid4())
@@ -538,49 +1002,74 @@ class DataLocker:
         pos_dict.setdefault("size", 0.0)
         pos_dict.setdefault("leverage", 0.0)
         pos_dict.setdefault("wallet_name", "Default")
-        pos_dict.setdefault("last_updated", datetime.now().isoformat())
+        if "last_updated" not in pos_dict:
+            pos_dict["last_updated"] = datetime.now().isoformat()
         pos_dict.setdefault("alert_reference_id", None)
         pos_dict.setdefault("hedge_buddy_id", None)
         pos_dict.setdefault("current_price", 0.0)
         pos_dict.setdefault("liquidation_distance", None)
         pos_dict.setdefault("heat_index", 0.0)
         pos_dict.setdefault("current_heat_index", 0.0)
+        return pos_dict
 
+    def create_position(self, pos_dict: dict):
+        """
+        Insert new position row. Provides defaults if fields missing.
+        """
+        self._apply_position_defaults(pos_dict)
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    INSERT INTO positions (
-                        id, asset_type, position_type,
-                        entry_price, liquidation_price, current_travel_percent,
-                        value, collateral, size, wallet_name, leverage, last_updated,
-                        alert_reference_id, hedge_buddy_id, current_price,
-                        liquidation_distance, heat_index, current_heat_index
-                    ) VALUES (
-                        :id, :asset_type, :position_type,
-                        :entry_price, :liquidation_price, :current_travel_percent,
-                        :value, :collateral, :size, :wallet_name, :leverage, :last_updated,
-                        :alert_reference_id, :hedge_buddy_id, :current_price,
-                        :liquidation_distance, :heat_index, :current_heat_index
-                    )
-                """, pos_dict)
-                conn.commit()
+            self._execute_write(
+                lambda conn: conn.execute(self._INSERT_POSITION_SQL, pos_dict),
+                after=lambda: self.portfolio.add(pos_dict)
+            )
             self.logger.debug(f"Created position ID={pos_dict['id']}")
         except Exception as ex:
             self.logger.exception(f"Error creating position: {ex}")
             raise
 
+    def upsert_positions(self, positions: List[dict]) -> int:
+        """
+        Inserts or refreshes a batch of positions (e.g. one wallet's Jupiter
+        import) in a single transaction, matching existing rows on the
+        natural key. Returns how many of them were new rows.
+        """
+        if not positions:
+            return 0
+        rows = [self._apply_position_defaults(p) for p in positions]
+        try:
+            def write(conn):
+                before = conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+                has_key = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_positions_natural_key'"
+                ).fetchone()
+                if has_key:
+                    conn.executemany(self._UPSERT_POSITION_SQL, rows)
+                else:
+                    # No unique key (duplicates still in the table):
+                    # refresh what is stored, insert the rest.
+                    for row in rows:
+                        if conn.execute(self._REFRESH_POSITION_SQL, row).rowcount == 0:
+                            conn.execute(self._INSERT_POSITION_SQL, row)
+                after = conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+                return after - before
+
+            # The caller reports the count, so this one waits in write-behind mode.
+            # Refreshed rows keep their stored ids, so the totals reload.
+            inserted = self._execute_write(write, wait=True, after=self.portfolio.invalidate)
+            self.logger.debug(
+                f"Upserted {len(rows)} positions ({inserted} new, {len(rows) - inserted} refreshed)."
+            )
+            return inserted
+        except sqlite3.Error as ex:
+            self.logger.error(f"DB error in upsert_positions: {ex}", exc_info=True)
+            raise
+
     def get_positions(self) -> List[dict]:
         """
         Return all positions as dict.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM positions")
-            rows = cur.fetchall()
-            conn.close()
+            rows = self.conn.execute("SELECT * FROM positions").fetchall()
             results = [dict(r) for r in rows]
             self.logger.debug(f"Fetched {len(results)} positions.")
             return results
@@ -596,11 +1085,10 @@ class DataLocker:
         Delete a single position by ID.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cur = conn.cursor()
-            cur.execute("DELETE FROM positions WHERE id=?", (position_id,))
-            conn.commit()
-            conn.close()
+            self._execute_write(
+                lambda conn: conn.execute("DELETE FROM positions WHERE id=?", (position_id,)),
+                after=lambda: self.portfolio.remove(position_id)
+            )
             self.logger.debug(f"Deleted position ID={position_id}")
         except sqlite3.Error as e:
             self.logger.error(f"DB error delete_position: {e}", exc_info=True)
@@ -614,15 +1102,29 @@ class DataLocker:
         Delete all rows from 'positions'
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cur = conn.cursor()
-                cur.execute("DELETE FROM positions")
-                conn.commit()
+            self._execute_write(
+                lambda conn: conn.execute("DELETE FROM positions"),
+                after=self.portfolio.clear
+            )
             self.logger.debug("Deleted all positions.")
         except Exception as ex:
             self.logger.exception(f"Error in delete_all_positions: {ex}")
             raise
 
+    def delete_wallet_positions(self):
+        """
+        Delete every position that belongs to a wallet (the Jupiter imports).
+        """
+        try:
+            self._execute_write(
+                lambda conn: conn.execute("DELETE FROM positions WHERE wallet_name IS NOT NULL"),
+                after=self.portfolio.invalidate
+            )
+            self.logger.debug("Deleted all wallet positions.")
+        except Exception as ex:
+            self.logger.exception(f"Error in delete_wallet_positions: {ex}")
+            raise
+
     # ----------------------------------------------------------------
     # GET / SET last update times (system_vars table)
     # with sources included
@@ -675,42 +1177,24 @@ class DataLocker:
         Writes the given datetimes + sources into system_vars row (id=1).
         Pass None if you don't want to update that field.
         """
-        self._init_sqlite_if_needed()
-
-        # Get existing row
-        current = self.get_last_update_times()
-
         # If caller gave new datetimes or source, use them; else keep old
-        new_positions_dt = (
-            positions_dt.isoformat()
-            if positions_dt
-            else current["last_update_time_positions"]
-        )
-        new_positions_src = (
-            positions_source
-            if positions_source
-            else current["last_update_positions_source"]
-        )
-        new_prices_dt = (
-            prices_dt.isoformat()
-            if prices_dt
-            else current["last_update_time_prices"]
-        )
-        new_prices_src = (
-            prices_source
-            if prices_source
-            else current["last_update_prices_source"]
-        )
-
-        self.cursor.execute("""
-            UPDATE system_vars
-               SET last_update_time_positions = ?,
-                   last_update_positions_source = ?,
-                   last_update_time_prices = ?,
-                   last_update_prices_source = ?
-             WHERE id=1
-        """, (new_positions_dt, new_positions_src, new_prices_dt, new_prices_src))
-        self.conn.commit()
+        # (NULL falls back to the stored value)
+        new_positions_dt = positions_dt.isoformat() if positions_dt else None
+        new_positions_src = positions_source or None
+        new_prices_dt = prices_dt.isoformat() if prices_dt else None
+        new_prices_src = prices_source or None
+
+        def write(conn):
+            conn.execute("""
+                UPDATE system_vars
+                   SET last_update_time_positions = COALESCE(?, last_update_time_positions),
+                       last_update_positions_source = COALESCE(?, last_update_positions_source),
+                       last_update_time_prices = COALESCE(?, last_update_time_prices),
+                       last_update_prices_source = COALESCE(?, last_update_prices_source)
+                 WHERE id=1
+            """, (new_positions_dt, new_positions_src, new_prices_dt, new_prices_src))
+
+        self._execute_write(write)
 
         self.logger.debug(
             "Updated system_vars =>"
@@ -724,26 +1208,12 @@ class DataLocker:
     # Wallet & Broker
     # ----------------------------------------------------------------
 
-    def read_wallets(self) -> List[dict]:
-        self._init_sqlite_if_needed()
-        self.cursor.execute("SELECT * FROM wallets")
-        rows = self.cursor.fetchall()
-        results = []
-        for row in rows:
-            results.append({
-                "name": row["name"],
-                "public_address": row["public_address"],
-                "private_address": row["private_address"],
-                "image_path": row["image_path"],
-                "balance": row["balance"]
-            })
-        return results
-
     def delete_positions_for_wallet(self, wallet_name: str):
-        self._init_sqlite_if_needed()
         self.logger.info(f"Deleting positions for wallet: {wallet_name}")
-        self.cursor.execute("DELETE FROM positions WHERE wallet_name=?", (wallet_name,))
-        self.conn.commit()
+        self._execute_write(
+            lambda conn: conn.execute("DELETE FROM positions WHERE wallet_name=?", (wallet_name,)),
+            after=lambda: self.portfolio.remove_wallet(wallet_name)
+        )
 
     def update_position(self, position_id: str, size: float, collateral: float):
         """
@@ -756,32 +1226,114 @@ class DataLocker:
                    collateral=?
              WHERE id=?
             """
-            self._init_sqlite_if_needed()
-            self.cursor.execute(query, (size, collateral, position_id))
-            self.conn.commit()
+            self._execute_write(
+                lambda conn: conn.execute(query, (size, collateral, position_id)),
+                after=lambda: self.portfolio.update(position_id, size=size, collateral=collateral)
+            )
         except Exception as ex:
             print(f"Error updating position {position_id}: {ex}")
             raise
 
+    def set_hedge_buddies(self, buddies: Dict[str, Optional[str]]) -> int:
+        """
+        Sets hedge_buddy_id for every {position_id: buddy id or None} in
+        one transaction. Returns the number of rows written.
+        """
+        if not buddies:
+            return 0
+        rows = [(buddy, pid) for pid, buddy in buddies.items()]
+
+        def bump():
+            self.hedge_version += 1
+
+        try:
+            self._execute_write(
+                lambda conn: conn.executemany("UPDATE positions SET hedge_buddy_id = ? WHERE id = ?", rows),
+                wait=True,
+                after=bump
+            )
+            self.logger.debug(f"Set hedge_buddy_id on {len(rows)} positions.")
+            return len(rows)
+        except sqlite3.Error as e:
+            self.logger.error(f"Database error in set_hedge_buddies: {e}", exc_info=True)
+            raise
+
+    def fill_missing_prices(self, positions: List[dict]) -> List[dict]:
+        """
+        Sets current_price from the latest price of its asset on every
+        position that has none (one get_latest_prices for all of them).
+        """
+        missing = [p for p in positions if not (p.get("current_price") or 0.0) > 0]
+        if not missing:
+            return positions
+        assets = {(p.get("asset_type") or "BTC").upper() for p in missing}
+        latest = self.get_latest_prices(list(assets))
+        for pos in missing:
+            row = latest.get((pos.get("asset_type") or "BTC").upper())
+            pos["current_price"] = float(row["current_price"]) if row else 0.0
+        return positions
+
+    def sync_calc_services(self) -> int:
+        """
+        Recomputes every position's derived fields (travel %, liquidation
+        distance, heat index) at the latest prices and stores the ones that
+        changed. Call after writing prices or positions; GET views only
+        read. Returns how many positions were updated.
+        """
+        positions = self.fill_missing_prices(self.read_positions())
+        updated = CalcServices().sync_derived_fields(positions, self.db_path)
+        self.logger.debug(f"sync_calc_services: {updated} of {len(positions)} positions changed.")
+        return updated
+
+    def read_portfolio(self) -> PortfolioAggregator:
+        """
+        The running portfolio totals (portfolio_aggregator.py), loaded on
+        first use and brought up to the latest prices, which also picks up
+        ticks written by another process:
+
+            totals = data_locker.read_portfolio().totals()
+        """
+        portfolio = self.portfolio
+        if not portfolio.loaded:
+            since = portfolio.version
+            rows = self.conn.execute(f"SELECT {', '.join(BOOK_COLUMNS)} FROM positions").fetchall()
+            positions = [dict(r) for r in rows]
+            assets = {(p["asset_type"] or "").upper() for p in positions}
+            portfolio.load(positions, self.get_latest_prices(list(assets)).values(), since)
+        else:
+            portfolio.apply_ticks(self.get_latest_prices(portfolio.assets).values())
+        return portfolio
+
+    def portfolio_totals(
+            self,
+            asset_type: Optional[str] = None,
+            side: Optional[str] = None,
+            wallet_name: Optional[str] = None
+    ) -> dict:
+        """
+        calculate_totals' dict from the running totals, optionally for one
+        asset / side / wallet only.
+        """
+        return self.read_portfolio().totals(asset_type, side, wallet_name)
+
     def create_wallet(self, wallet_dict: dict):
         """
         Insert new wallet row from dict.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO wallets (name, public_address, private_address, image_path, balance)
-                VALUES (?,?,?,?,?)
-            """, (
-                wallet_dict.get("name"),
-                wallet_dict.get("public_address"),
-                wallet_dict.get("private_address"),
-                wallet_dict.get("image_path"),
-                wallet_dict.get("balance", 0.0)
-            ))
-            conn.commit()
-            conn.close()
+            def write(conn):
+                conn.execute("""
+                    INSERT INTO wallets (name, public_address, private_address, image_path, balance)
+                    VALUES (?,?,?,?,?)
+                """, (
+                    wallet_dict.get("name"),
+                    wallet_dict.get("public_address"),
+                    wallet_dict.get("private_address"),
+                    wallet_dict.get("image_path"),
+                    wallet_dict.get("balance", 0.0)
+                ))
+
+            self._execute_write(write)
         except Exception as ex:
             self.logger.exception(f"Error creating wallet: {ex}")
             raise
@@ -790,38 +1342,48 @@ class DataLocker:
         """
         Insert or replace broker row from dict.
         """
-        self._init_sqlite_if_needed()
         try:
-            self.cursor.execute("""
-                INSERT OR REPLACE INTO brokers (name, image_path, web_address, total_holding)
-                VALUES (?,?,?,?)
-            """, (
-                broker_dict.get("name"),
-                broker_dict.get("image_path"),
-                broker_dict.get("web_address"),
-                broker_dict.get("total_holding", 0.0)
-            ))
-            self.conn.commit()
+            def write(conn):
+                conn.execute("""
+                    INSERT OR REPLACE INTO brokers (name, image_path, web_address, total_holding)
+                    VALUES (?,?,?,?)
+                """, (
+                    broker_dict.get("name"),
+                    broker_dict.get("image_path"),
+                    broker_dict.get("web_address"),
+                    broker_dict.get("total_holding", 0.0)
+                ))
+
+            self._execute_write(write)
         except sqlite3.Error as ex:
             self.logger.error(f"DB error create_broker: {ex}", exc_info=True)
             raise
 
-    def read_brokers(self) -> List[dict]:
+    def delete_wallet(self, wallet_name: str):
         """
-        Returns brokers as a list of dicts
+        Deletes the wallet row by name (its positions are left alone).
         """
-        self._init_sqlite_if_needed()
-        self.cursor.execute("SELECT * FROM brokers")
-        rows = self.cursor.fetchall()
-        results = []
-        for row in rows:
-            results.append({
-                "name": row["name"],
-                "image_path": row["image_path"],
-                "web_address": row["web_address"],
-                "total_holding": row["total_holding"]
-            })
-        return results
+        try:
+            self._execute_write(
+                lambda conn: conn.execute("DELETE FROM wallets WHERE name=?", (wallet_name,))
+            )
+            self.logger.debug(f"Deleted wallet {wallet_name}")
+        except sqlite3.Error as ex:
+            self.logger.error(f"DB error delete_wallet: {ex}", exc_info=True)
+            raise
+
+    def delete_broker(self, broker_name: str):
+        """
+        Deletes the broker row by name.
+        """
+        try:
+            self._execute_write(
+                lambda conn: conn.execute("DELETE FROM brokers WHERE name=?", (broker_name,))
+            )
+            self.logger.debug(f"Deleted broker {broker_name}")
+        except sqlite3.Error as ex:
+            self.logger.error(f"DB error delete_broker: {ex}", exc_info=True)
+            raise
 
     def read_positions_raw(self) -> List[Dict]:
         """
@@ -846,15 +1408,14 @@ class DataLocker:
         Update only the 'size' field of a position
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cur = conn.cursor()
-            cur.execute("""
-                UPDATE positions
-                   SET size=?
-                 WHERE id=?
-            """, (new_size, position_id))
-            conn.commit()
-            conn.close()
+            def write(conn):
+                conn.execute("""
+                    UPDATE positions
+                       SET size=?
+                     WHERE id=?
+                """, (new_size, position_id))
+
+            self._execute_write(write, after=lambda: self.portfolio.update(position_id, size=new_size))
             self.logger.debug(f"Updated position {position_id} => size={new_size}")
         except sqlite3.Error as ex:
             self.logger.error(f"DB error in update_position_size: {ex}", exc_info=True)
@@ -932,26 +1493,21 @@ class DataLocker:
         """
         Update any of the 3 columns in system_vars. Pass None if you don't want to change that value.
         """
-        self._init_sqlite_if_needed()
-
-        # Read old values
-        current = self.get_balance_vars()
-        new_brokerage = brokerage_balance if brokerage_balance is not None else current["total_brokerage_balance"]
-        new_wallet = wallet_balance if wallet_balance is not None else current["total_wallet_balance"]
-        new_total = total_balance if total_balance is not None else current["total_balance"]
+        # NULL keeps the stored value for anything not being updated
+        def write(conn):
+            conn.execute("""
+                UPDATE system_vars
+                   SET total_brokerage_balance=COALESCE(?, total_brokerage_balance),
+                       total_wallet_balance=COALESCE(?, total_wallet_balance),
+                       total_balance=COALESCE(?, total_balance)
+                 WHERE id=1
+            """, (brokerage_balance, wallet_balance, total_balance))
 
-        self.cursor.execute("""
-            UPDATE system_vars
-               SET total_brokerage_balance=?,
-                   total_wallet_balance=?,
-                   total_balance=?
-             WHERE id=1
-        """, (new_brokerage, new_wallet, new_total))
-        self.conn.commit()
+        self._execute_write(write)
 
         self.logger.debug(
-            f"Updated system_vars => total_brokerage_balance={new_brokerage}, "
-            f"total_wallet_balance={new_wallet}, total_balance={new_total}"
+            f"Updated system_vars => total_brokerage_balance={brokerage_balance}, "
+            f"total_wallet_balance={wallet_balance}, total_balance={total_balance}"
         )
 
 
@@ -959,10 +1515,7 @@ class DataLocker:
         """
         Returns a single wallet row (dict) by name or None.
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        row = cur.execute("""
+        row = self.conn.execute("""
             SELECT name,
                    public_address,
                    private_address,
@@ -972,7 +1525,6 @@ class DataLocker:
              WHERE name=?
              LIMIT 1
         """, (wallet_name,)).fetchone()
-        conn.close()
         if not row:
             return None
         return {
@@ -985,8 +1537,114 @@ class DataLocker:
 
     def close(self):
         """
-        Closes DB connection if opened.
+        Hands this thread's connection back to the pool.
+        """
+        self.pool.release()
+        self.logger.debug("Database connection released to pool.")
+
+    # ----------------------------------------------------------------
+    # TYPED READS
+    #
+    # Same rows as the dict readers, decoded straight into the __slots__
+    # models (see models.py): one float()/datetime conversion per field,
+    # validated once, no per-row dict.
+    # ----------------------------------------------------------------
+
+    def _decode_rows(self, model, rows) -> list:
+        try:
+            return model.from_rows(rows)
+        except ValueError:
+            # Keep the good rows; log each bad one instead of failing the read.
+            decoded = []
+            for row in rows:
+                try:
+                    decoded.append(model.from_row(row))
+                except ValueError as e:
+                    self.logger.warning(f"Skipping bad {model.__name__} row: {e}")
+            return decoded
+
+    def read_position_models(self) -> List[Position]:
+        rows = self.conn.execute("SELECT * FROM positions").fetchall()
+        return self._decode_rows(Position, rows)
+
+    def read_price_models(self, asset_type: Optional[str] = None) -> List[Price]:
+        """
+        Price rows newest first, optionally for one asset.
+        """
+        if asset_type:
+            rows = self.conn.execute(
+                "SELECT * FROM prices WHERE asset_type=? ORDER BY last_update_time DESC",
+                (asset_type,)
+            ).fetchall()
+        else:
+            rows = self.conn.execute("SELECT * FROM prices ORDER BY last_update_time DESC").fetchall()
+        return self._decode_rows(Price, rows)
+
+    def read_position_book(self, side_rule: Callable[[Optional[str]], int] = side_of) -> PositionBook:
+        """
+        Every position as NumPy columns (see position_book.py), in one
+        query. current_price is whatever the positions table holds; call
+        book.apply_latest_prices(self) for live prices.
+        """
+        rows = self.conn.execute(f"SELECT {', '.join(BOOK_COLUMNS)} FROM positions").fetchall()
+        return PositionBook.from_rows(rows, side_rule)
+
+    def read_priced_position_book(self) -> Tuple[PositionBook, Dict[str, float]]:
         """
-        if self.conn:
-            self.conn.close()
-            self.logger.debug("Database connection closed.")
+        read_position_book with every position that has no current_price of
+        its own priced at its asset's latest price (as fill_missing_prices
+        does for dicts). Returns (book, {asset: latest price used}).
+        """
+        book = self.read_position_book()
+        latest = self.get_latest_prices(book.assets)
+        prices = {asset: float(row["current_price"]) for asset, row in latest.items()}
+        unpriced = book.current_price <= 0
+        for asset, price in prices.items():
+            rows = book.rows_for(asset)
+            book.current_price[rows[unpriced[rows]]] = price
+        return book, prices
+
+    def read_hedge_links(self) -> Dict[str, str]:
+        """
+        {position_id: hedge_buddy_id} for every position that has one.
+        """
+        rows = self.conn.execute("""
+            SELECT id, hedge_buddy_id
+              FROM positions
+             WHERE hedge_buddy_id IS NOT NULL AND hedge_buddy_id != ''
+        """).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def snapshot_key(self) -> tuple:
+        """
+        Changes whenever a new tick lands for a held asset or this process
+        changes positions; derived results (stress runs, liquidation
+        risk) are cached under it.
+        """
+        latest = self.get_latest_prices(self.read_portfolio().assets)
+        ticks = tuple(sorted((a, row["current_price"], row["last_update_time"]) for a, row in latest.items()))
+        return self.portfolio.version, ticks
+
+    def read_alert_models(self) -> List[Alert]:
+        rows = self.conn.execute("SELECT * FROM alerts").fetchall()
+        return self._decode_rows(Alert, rows)
+
+    def read_wallet_models(self) -> List[CryptoWallet]:
+        rows = self.conn.execute("SELECT * FROM wallets").fetchall()
+        return self._decode_rows(CryptoWallet, rows)
+
+    def read_broker_models(self) -> List[Broker]:
+        rows = self.conn.execute("SELECT * FROM brokers").fetchall()
+        return self._decode_rows(Broker, rows)
+
+
+def _lockers_after_fork():
+    # Shared lockers stay usable in a forked child (their pools reset
+    # themselves), but startup() has to run again to restart write-behind.
+    global _lockers_lock
+    _lockers_lock = threading.Lock()
+    _started.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_lockers_after_fork)
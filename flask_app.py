@@ -1,15 +1,17 @@
 # Space Station - 1st Node
 
 import os
+import atexit
 import logging
 import json
 import sqlite3
 import asyncio
+import threading
 import pytz
 from datetime import datetime
 import requests
 from flask import Flask
-from typing import List
+from typing import List, Optional
 from uuid import uuid4
 
 from flask import (
@@ -27,11 +29,19 @@ from flask import (
 # Panda Stuff
 from models import Position
 from data_locker import DataLocker
+from connection_pool import get_pool
+from write_behind import get_write_behind
 from config_manager import load_config
 from config import AppConfig
-from calc_services import CalcServices
+from calc_services import COLOR_RANGES, CalcServices
 from price_monitor import PriceMonitor
 from alert_manager import AlertManager
+from stress_engine import StressEngine
+from liquidation_risk import LiquidationRisk
+from replay import ReplayEngine, to_json as replay_json
+from hedge_engine import HedgeEngine
+from hedge_pairing import HedgePairing
+from thresholds import ThresholdClassifier
 
 
 app = Flask(__name__)
@@ -42,7 +52,7 @@ app.secret_key = "i-like-lamp"
 
 # Build absolute paths
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DB_PATH = os.path.join(BASE_DIR, "mother_brain.db")
+DB_PATH = os.environ.get("SONIC_DB_PATH", os.path.join(BASE_DIR, "mother_brain.db"))
 CONFIG_PATH = os.path.join(BASE_DIR, "sonic_config.json")
 
 MINT_TO_ASSET = {
@@ -51,12 +61,34 @@ MINT_TO_ASSET = {
     "So11111111111111111111111111111111111111112": "SOL"
 }
 
+# One shared DataLocker for the whole process; routes fetch it with
+# DataLocker.get_instance(DB_PATH).
+DataLocker.startup(DB_PATH, CONFIG_PATH)
+atexit.register(DataLocker.shutdown)
+
 manager = AlertManager(
     db_path=DB_PATH,
     poll_interval=60,
     config_path=CONFIG_PATH
 )
 
+# Price-shock scenarios for /api/stress and liquidation probabilities for
+# /heat, both cached per price snapshot
+stress_engine = StressEngine(DataLocker.get_instance(DB_PATH))
+liquidation_risk = LiquidationRisk.from_config(
+    DataLocker.get_instance(DB_PATH),
+    load_config(CONFIG_PATH, DataLocker.get_instance(DB_PATH).get_db_connection())
+)
+# Historical replays for /api/replay, with the alert manager's rules
+replay_engine = ReplayEngine.from_config(DataLocker.get_instance(DB_PATH), manager.config)
+# Hedge exposure for /hedge-report, kept up to date tick by tick
+hedge_engine = HedgeEngine(DataLocker.get_instance(DB_PATH))
+# Links opposing positions (hedge_buddy_id) after every import
+hedge_pairing = HedgePairing.from_config(DataLocker.get_instance(DB_PATH), manager.config)
+# Alert classes / colors for the positions pages (get_threshold_classifier)
+_threshold_classifier = None
+_threshold_lock = threading.Lock()
+
 ##################################################
 # ROUTES
 ##################################################
@@ -65,45 +97,21 @@ manager = AlertManager(
 def index():
     return redirect(url_for("positions"))
 
-def get_alert_class(value, low_thresh, med_thresh, high_thresh):
-    if high_thresh is None:
-        high_thresh = float('inf')
-    if med_thresh is None:
-        med_thresh = float('inf')
-    if low_thresh is None:
-        low_thresh = float('-inf')
-
-    if value >= high_thresh:
-        return "alert-high"
-    elif value >= med_thresh:
-        return "alert-medium"
-    elif value >= low_thresh:
-        return "alert-low"
-    else:
-        return "alert-high"
-
-
 @app.route("/positions")
 def positions():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     calc_services = CalcServices()
 
     # 0) Gather mini_prices for BTC, ETH, SOL
-    mini_prices = []
-    for asset in ["BTC", "ETH", "SOL"]:
-        row = data_locker.get_latest_price(asset)
-        if row:
-            mini_prices.append({
-                "asset_type": row["asset_type"],
-                "current_price": float(row["current_price"])
-            })
+    mini_prices = get_mini_prices(data_locker)
 
     # 1) raw from DB
     positions_data = data_locker.read_positions()
     # 2) fill missing price
     positions_data = fill_positions_with_latest_price(positions_data)
-    # 3) aggregator => updated positions
-    updated_positions = calc_services.aggregator_positions(positions_data, DB_PATH)
+    # 3) aggregator => updated positions (read-only; stored fields are
+    #    refreshed by sync_calc_services when prices/positions change)
+    updated_positions = calc_services.aggregate_positions(positions_data)
 
     # Attach wallet info
     for pos in updated_positions:
@@ -115,92 +123,9 @@ def positions():
         else:
             pos["wallet_name"] = None
 
-    config_data = load_app_config()
-    alert_dict = config_data.alert_ranges or {}
-
-    def get_alert_class(value, low_thresh, med_thresh, high_thresh):
-        if high_thresh is None:
-            high_thresh = float('inf')
-        if med_thresh is None:
-            med_thresh = float('inf')
-        if low_thresh is None:
-            low_thresh = float('-inf')
-
-        if value >= high_thresh:
-            return "alert-high"
-        elif value >= med_thresh:
-            return "alert-medium"
-        elif value >= low_thresh:
-            return "alert-low"
-        else:
-            return ""
-
-    hi_cfg   = alert_dict.get("heat_index_ranges", {})
-    hi_low   = hi_cfg.get("low", 0.0)
-    hi_med   = hi_cfg.get("medium", 0.0)
-    hi_high  = hi_cfg.get("high", None)
-
-    coll_cfg = alert_dict.get("collateral_ranges", {})
-    coll_low   = coll_cfg.get("low", 0.0)
-    coll_med   = coll_cfg.get("medium", 0.0)
-    coll_high  = coll_cfg.get("high", None)
-
-    val_cfg = alert_dict.get("value_ranges", {})
-    val_low   = val_cfg.get("low", 0.0)
-    val_med   = val_cfg.get("medium", 0.0)
-    val_high  = val_cfg.get("high", None)
-
-    size_cfg = alert_dict.get("size_ranges", {})
-    size_low   = size_cfg.get("low", 0.0)
-    size_med   = size_cfg.get("medium", 0.0)
-    size_high  = size_cfg.get("high", None)
-
-    lev_cfg = alert_dict.get("leverage_ranges", {})
-    lev_low   = lev_cfg.get("low", 0.0)
-    lev_med   = lev_cfg.get("medium", 0.0)
-    lev_high  = lev_cfg.get("high", None)
-
-    liqd_cfg = alert_dict.get("liquidation_distance_ranges", {})
-    liqd_low   = liqd_cfg.get("low", 0.0)
-    liqd_med   = liqd_cfg.get("medium", 0.0)
-    liqd_high  = liqd_cfg.get("high", None)
-
-    tliq_cfg = alert_dict.get("travel_percent_liquid_ranges", {})
-    tliq_low   = tliq_cfg.get("low", 0.0)
-    tliq_med   = tliq_cfg.get("medium", 0.0)
-    tliq_high  = tliq_cfg.get("high", None)
-
-    tprof_cfg = alert_dict.get("travel_percent_profit_ranges", {})
-    tprof_low   = tprof_cfg.get("low", 0.0)
-    tprof_med   = tprof_cfg.get("medium", 0.0)
-    tprof_high  = tprof_cfg.get("high", None)
-
-    for pos in updated_positions:
-        heat_val = float(pos.get("heat_index", 0.0))
-        pos["heat_alert_class"] = get_alert_class(heat_val, hi_low, hi_med, hi_high)
-
-        coll_val = float(pos["collateral"])
-        pos["collateral_alert_class"] = get_alert_class(coll_val, coll_low, coll_med, coll_high)
+    get_threshold_classifier().label_positions(updated_positions)
 
-        val = float(pos.get("value", 0.0))
-        pos["value_alert_class"] = get_alert_class(val, val_low, val_med, val_high)
-
-        sz = float(pos.get("size", 0.0))
-        pos["size_alert_class"] = get_alert_class(sz, size_low, size_med, size_high)
-
-        lev = float(pos.get("leverage", 0.0))
-        pos["leverage_alert_class"] = get_alert_class(lev, lev_low, lev_med, lev_high)
-
-        liqd = float(pos.get("liquidation_distance", 0.0))
-        pos["liqdist_alert_class"] = get_alert_class(liqd, liqd_low, liqd_med, liqd_high)
-
-        tliq_val = float(pos.get("current_travel_percent", 0.0))
-        pos["travel_liquid_alert_class"] = get_alert_class(tliq_val, tliq_low, tliq_med, tliq_high)
-
-        tprof_val = float(pos.get("current_travel_percent", 0.0))
-        pos["travel_profit_alert_class"] = get_alert_class(tprof_val, tprof_low, tprof_med, tprof_high)
-
-    totals_dict = calc_services.calculate_totals(updated_positions)
+    totals_dict = data_locker.portfolio_totals()
 
     return render_template(
         "positions.html",
@@ -211,14 +136,14 @@ def positions():
 
 @app.route("/exchanges")
 def exchanges():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     brokers_data = data_locker.read_brokers()
     return render_template("exchanges.html", brokers=brokers_data)
 
 
 @app.route("/edit-position/<position_id>", methods=["POST"])
 def edit_position(position_id):
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     logger.debug(f"Editing position {position_id}.")
     try:
         size = float(request.form.get("size", 0.0))
@@ -233,11 +158,10 @@ def edit_position(position_id):
 
 @app.route("/delete-position/<position_id>", methods=["POST"])
 def delete_position(position_id):
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     logger.debug(f"Deleting position {position_id}")
     try:
-        data_locker.cursor.execute("DELETE FROM positions WHERE id = ?", (position_id,))
-        data_locker.conn.commit()
+        data_locker.delete_position(position_id)
         return redirect(url_for("positions"))
     except Exception as e:
         logger.error(f"Error deleting position {position_id}: {e}", exc_info=True)
@@ -246,7 +170,7 @@ def delete_position(position_id):
 
 @app.route("/delete-all-positions", methods=["POST"])
 def delete_all_positions():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     logger.debug("Deleting ALL positions")
     try:
         data_locker.delete_all_positions()
@@ -257,14 +181,13 @@ def delete_all_positions():
 
 @app.route("/delete-all-prices", methods=["POST"])
 def delete_all_prices():
-    data_locker = DataLocker(DB_PATH)
-    data_locker.cursor.execute("DELETE FROM prices")
-    data_locker.conn.commit()
+    data_locker = DataLocker.get_instance(DB_PATH)
+    data_locker.delete_all_prices()
     return redirect(url_for("database_viewer"))
 
 @app.route("/upload-positions", methods=["POST"])
 def upload_positions():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     try:
         if "file" not in request.files:
             return jsonify({"error": "No file part in request"}), 400
@@ -284,7 +207,10 @@ def upload_positions():
         for pos_dict in positions_list:
             if "wallet_name" in pos_dict:
                 pos_dict["wallet"] = pos_dict["wallet_name"]
-            data_locker.create_position(pos_dict)
+        # One transaction; rows already stored are refreshed, not duplicated.
+        data_locker.upsert_positions(positions_list)
+        data_locker.sync_calc_services()
+        run_hedge_pairing()
 
         return jsonify({"message": "Positions uploaded successfully"}), 200
     except Exception as e:
@@ -294,7 +220,7 @@ def upload_positions():
 
 @app.route("/prices", methods=["GET", "POST"])
 def prices():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     if request.method == "POST":
         asset = request.form.get("asset", "BTC")
         raw_price = request.form.get("price", "0.0")
@@ -305,6 +231,7 @@ def prices():
             source="Manual",
             timestamp=datetime.now()
         )
+        data_locker.sync_calc_services()
         return redirect(url_for("prices"))
 
     top_prices = _get_top_prices_for_assets(DB_PATH, ["BTC", "ETH", "SOL"])
@@ -333,7 +260,7 @@ def update_prices():
         asyncio.run(pm.update_prices())
 
         # We updated prices => store the last_update_time_prices + source
-        data_locker = DataLocker(db_path=DB_PATH)
+        data_locker = DataLocker.get_instance(DB_PATH)
         now = datetime.now()
         data_locker.set_last_update_times(
             prices_dt=now,
@@ -384,14 +311,14 @@ def alert_options():
 
 @app.route("/show-updates")
 def show_updates():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     times = data_locker.get_last_update_times()
     return render_template("some_template.html", update_times=times)
 
 
 @app.route("/system-options", methods=["GET", "POST"])
 def system_options():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
 
     if request.method == "POST":
         config = load_app_config()
@@ -436,29 +363,35 @@ def export_config():
 
 @app.route("/heat", methods=["GET"])
 def heat():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     calc_services = CalcServices()
 
     positions_data = data_locker.read_positions()
     positions_data = fill_positions_with_latest_price(positions_data)
     positions_data = calc_services.prepare_positions_for_display(positions_data)
 
-    heat_data = build_heat_data(positions_data)
-    return render_template("heat.html", heat_data=heat_data)
+    # Monte Carlo liquidation probability per position (cached per tick)
+    risk = liquidation_risk.run()
+    for pos in positions_data:
+        pos["liquidation_probability"] = risk.get("positions", {}).get(pos.get("id"))
+
+    heat_data = build_heat_data(positions_data, risk)
+    return render_template("heat.html", heat_data=heat_data, risk=risk)
+
+
+@app.route("/api/liquidation_risk", methods=["GET"])
+def liquidation_risk_api():
+    """
+    The /heat liquidation probabilities as JSON (see liquidation_risk.py).
+    """
+    return jsonify(liquidation_risk.run())
 
 
 @app.route("/alerts")
 def alerts():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
 
-    mini_prices = []
-    for asset in ["BTC", "ETH", "SOL"]:
-        row = data_locker.get_latest_price(asset)
-        if row:
-            mini_prices.append({
-                "asset_type": row["asset_type"],
-                "current_price": float(row["current_price"])
-            })
+    mini_prices = get_mini_prices(data_locker)
 
     positions = data_locker.read_positions()
     config_dict = load_config(CONFIG_PATH, data_locker.get_db_connection())
@@ -536,7 +469,7 @@ def alerts_create():
         "position_reference_id": position_ref
     }
 
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     data_locker.create_alert(new_alert)
 
     flash("New alert created successfully!", "success")
@@ -576,7 +509,7 @@ def update_jupiter_positions():
     then sums *ALL* positions in the DB for the 'brokerage' value,
     and updates system_vars accordingly.
     """
-    data_locker = DataLocker(db_path=DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     try:
         wallets_list = data_locker.read_wallets()
         if not wallets_list:
@@ -633,35 +566,21 @@ def update_jupiter_positions():
                         f"Skipping item for wallet {w['name']} due to mapping error: {map_err}"
                     )
 
-            # 3) Insert if not duplicate
-            for p in new_positions:
-                dup_count = data_locker.cursor.execute("""
-                    SELECT COUNT(*) FROM positions
-                     WHERE wallet_name = ?
-                       AND asset_type = ?
-                       AND position_type = ?
-                       AND ABS(size - ?) < 0.000001
-                       AND ABS(collateral - ?) < 0.000001
-                       AND last_updated = ?
-                """, (
-                    p["wallet_name"],
-                    p["asset_type"],
-                    p["position_type"],
-                    p["size"],
-                    p["collateral"],
-                    p["last_updated"]
-                )).fetchone()
-
-                if dup_count[0] == 0:
-                    data_locker.create_position(p)
-                    total_positions_imported += 1
-                else:
-                    app.logger.info(f"Skipping duplicate Jupiter position {p}")
+            # 3) Upsert the wallet's batch (duplicates just get refreshed)
+            imported = data_locker.upsert_positions(new_positions)
+            total_positions_imported += imported
+            app.logger.info(
+                f"Wallet {w['name']}: {imported} new, {len(new_positions) - imported} already stored."
+            )
+
+        # New/refreshed positions => store their travel % / heat index,
+        # then pair up any new opposing positions
+        data_locker.sync_calc_services()
+        run_hedge_pairing()
 
         # 4) Since all positions in the DB are from Jupiter,
-        #    sum the 'value' of ALL positions in 'positions' for total_brokerage_balance.
-        all_positions = data_locker.get_positions()  # read ALL from the DB
-        total_brokerage_value = sum(pos["value"] for pos in all_positions)
+        #    total_brokerage_balance is the value of ALL positions (running totals).
+        total_brokerage_value = data_locker.portfolio_totals()["total_value"]
 
         # 5) Read the existing wallet balance from system_vars
         balance_vars = data_locker.get_balance_vars()
@@ -690,15 +609,14 @@ def update_jupiter_positions():
 
 @app.route("/delete-all-jupiter-positions", methods=["POST"])
 def delete_all_jupiter_positions():
-    data_locker = DataLocker(DB_PATH)
-    data_locker.cursor.execute("DELETE FROM positions WHERE wallet_name IS NOT NULL")
-    data_locker.conn.commit()
+    data_locker = DataLocker.get_instance(DB_PATH)
+    data_locker.delete_wallet_positions()
     return jsonify({"message": "All Jupiter positions deleted."}), 200
 
 
 @app.route("/delete-alert/<alert_id>", methods=["POST"])
 def delete_alert(alert_id):
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     data_locker.delete_alert(alert_id)
     flash("Alert deleted!", "success")
     return redirect(url_for("alerts"))
@@ -716,7 +634,7 @@ def update_jupiter():
     # Read 'source' or default to "API"
     source = request.args.get("source") or request.form.get("source") or "API"
 
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
 
     # 1) Remove old positions
     delete_all_positions()  # or data_locker.delete_all_positions()
@@ -755,21 +673,14 @@ def audio_tester():
 
 @app.route("/api/positions_data", methods=["GET"])
 def positions_data_api():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
     calc_services = CalcServices()
 
-    mini_prices = []
-    for asset in ["BTC", "ETH", "SOL"]:
-        row = data_locker.get_latest_price(asset)
-        if row:
-            mini_prices.append({
-                "asset_type": row["asset_type"],
-                "current_price": float(row["current_price"])
-            })
+    mini_prices = get_mini_prices(data_locker)
 
     positions_data = data_locker.read_positions()
     positions_data = fill_positions_with_latest_price(positions_data)
-    updated_positions = calc_services.aggregator_positions(positions_data, DB_PATH)
+    updated_positions = calc_services.aggregate_positions(positions_data)
 
     for pos in updated_positions:
         pos["collateral"] = float(pos.get("collateral") or 0.0)
@@ -780,44 +691,9 @@ def positions_data_api():
         else:
             pos["wallet_name"] = None
 
-    config_data = load_app_config()
-    alert_dict = config_data.alert_ranges or {}
-
-    def get_alert_class(value, low, med, high):
-        if high is None:
-            high = float('inf')
-        if med is None:
-            med = float('inf')
-        if low is None:
-            low = float('-inf')
-
-        if value >= high:
-            return "alert-high"
-        elif value >= med:
-            return "alert-medium"
-        elif value >= low:
-            return "alert-low"
-        else:
-            return ""
-
-    hi_cfg   = alert_dict.get("heat_index_ranges", {})
-    hi_low   = hi_cfg.get("low", 0.0)
-    hi_med   = hi_cfg.get("medium", 0.0)
-    hi_high  = hi_cfg.get("high", None)
-
-    coll_cfg = alert_dict.get("collateral_ranges", {})
-    coll_low   = coll_cfg.get("low", 0.0)
-    coll_med   = coll_cfg.get("medium", 0.0)
-    coll_high  = coll_cfg.get("high", None)
+    get_threshold_classifier().label_positions(updated_positions)
 
-    for pos in updated_positions:
-        heat_val = float(pos.get("heat_index", 0.0))
-        pos["heat_alert_class"] = get_alert_class(heat_val, hi_low, hi_med, hi_high)
-
-        coll_val = float(pos.get("collateral", 0.0))
-        pos["collateral_alert_class"] = get_alert_class(coll_val, coll_low, coll_med, coll_high)
-
-    totals_dict = calc_services.calculate_totals(updated_positions)
+    totals_dict = data_locker.portfolio_totals()
 
     return jsonify({
         "mini_prices": mini_prices,
@@ -826,16 +702,120 @@ def positions_data_api():
     })
 
 
+@app.route("/api/price_series", methods=["GET"])
+def price_series_api():
+    """
+    OHLC series for one asset from the price rollups, e.g.
+    /api/price_series?asset=BTC&resolution=1h&start=2025-01-01T00:00:00
+    """
+    asset = request.args.get("asset", "BTC").upper()
+    resolution = request.args.get("resolution", "1h")
+    start = request.args.get("start")
+    end = request.args.get("end")
+
+    data_locker = DataLocker.get_instance(DB_PATH)
+    try:
+        series = data_locker.get_price_series(asset, resolution, start, end)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"asset": asset, "resolution": resolution, "series": series})
+
+
+@app.route("/api/write_behind_metrics", methods=["GET"])
+def write_behind_metrics_api():
+    wb = get_write_behind(DB_PATH)
+    if wb is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(wb.metrics(), enabled=True))
+
+
+@app.route("/api/stress", methods=["GET", "POST"])
+def stress_api():
+    """
+    Portfolio value / liquidations under a grid of price shocks (see
+    stress_engine.py). Factors are percent shocks per asset, assets joined
+    by commas move together:
+      GET  /api/stress?BTC=-20,-10,-5,0&ETH,SOL=-10,0,10
+      POST /api/stress  {"factors": {"BTC": [-20, -10], "ETH,SOL": [-10, 0]}}
+    With no factors every asset gets the default shocks on its own.
+    """
+    try:
+        if request.method == "POST":
+            body = request.get_json(silent=True) or {}
+            if not isinstance(body, dict):
+                return jsonify({"error": "Expected a JSON object with a 'factors' key"}), 400
+            factors = body.get("factors")
+            if factors is not None and not isinstance(factors, dict):
+                return jsonify({"error": "'factors' must be an object of asset: [shocks]"}), 400
+        else:
+            factors = {
+                key: [float(v) for v in value.split(",") if v.strip()]
+                for key, value in request.args.items()
+            } or None
+        return jsonify(stress_engine.run(factors))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/replay", methods=["GET"])
+def replay_api():
+    """
+    Today's positions and alerts replayed over stored prices (see
+    replay.py). Optional query args: days, start / end (ISO), source
+    (ticks | rollups), resolution, step_seconds, max_points, e.g.
+      GET /api/replay?days=7&source=rollups&resolution=1h
+    """
+    try:
+        args = request.args
+        overrides = {k: args[k] for k in ("source", "resolution") if k in args}
+        for key in ("days", "step_seconds"):
+            if key in args:
+                overrides[key] = float(args[key])
+        start = datetime.fromisoformat(args["start"]) if "start" in args else None
+        end = datetime.fromisoformat(args["end"]) if "end" in args else None
+        result = replay_engine.run(start, end, **overrides)
+        max_points = int(args.get("max_points", replay_engine.settings["max_points"]))
+        return jsonify(replay_json(result, max_points))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/hedges/pair", methods=["POST"])
+def hedge_pairing_api():
+    """
+    Runs the hedge pairing job now (see hedge_pairing.py) and returns its
+    counts: kept, cleared, paired, written.
+    """
+    return jsonify(hedge_pairing.run())
+
+
+@app.route("/api/latest_price_cache_metrics", methods=["GET"])
+def latest_price_cache_metrics_api():
+    return jsonify(DataLocker.get_instance(DB_PATH).price_cache.stats())
+
+
 @app.route("/hedge-report")
 def hedge_report():
     return render_template("hedge_report.html")
 
 
+@app.route("/api/hedges", methods=["GET"])
+def hedges_api():
+    """
+    Net delta / USD exposure / hedge ratio per asset and wallet and every
+    hedge_buddy_id hedge with its combined liquidation distance (see
+    hedge_engine.py); ?limit=N keeps the N hedges nearest liquidation.
+    """
+    try:
+        limit = request.args.get("limit")
+        return jsonify(hedge_engine.report(int(limit) if limit else None))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
 @app.route("/database-viewer")
 def database_viewer():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    cur = get_pool(DB_PATH).connection().cursor()
     cur.execute("""
         SELECT name 
           FROM sqlite_master
@@ -854,7 +834,6 @@ def database_viewer():
         rows = [dict(r) for r in rows_raw]
         db_data[table] = {"columns": columns, "rows": rows}
 
-    conn.close()
     return render_template("database_viewer.html", db_data=db_data)
 
 
@@ -884,34 +863,51 @@ def load_app_config() -> AppConfig:
         data = json.load(f)
     return AppConfig(**data)
 
+def get_threshold_classifier() -> ThresholdClassifier:
+    """
+    The alert / color classifier for the current sonic_config.json,
+    compiled again only when the file changes (mtime or size).
+    """
+    global _threshold_classifier
+    try:
+        st = os.stat(CONFIG_PATH)
+        version = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        version = None
+    with _threshold_lock:
+        if _threshold_classifier is None or _threshold_classifier[0] != version:
+            config = load_app_config()
+            _threshold_classifier = (version, ThresholdClassifier(config.alert_ranges, COLOR_RANGES))
+        return _threshold_classifier[1]
+
+def run_hedge_pairing() -> Optional[dict]:
+    """
+    Runs the hedge pairing job after an import. The positions are already
+    stored by then, so a failure is logged rather than failing the import.
+    """
+    try:
+        return hedge_pairing.run()
+    except Exception as e:
+        app.logger.error(f"Hedge pairing failed: {e}", exc_info=True)
+        return None
+
 def save_app_config(config: AppConfig):
     data = config.model_dump()
     with open(CONFIG_PATH, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4)
 
-def fill_positions_with_latest_price(positions: List[dict]) -> List[dict]:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    for pos in positions:
-        asset = pos.get("asset_type","BTC").upper()
-        if pos.get("current_price", 0.0) > 0:
-            continue
-        row = cursor.execute("""
-            SELECT current_price
-              FROM prices
-             WHERE asset_type = ?
-             ORDER BY last_update_time DESC
-             LIMIT 1
-        """, (asset,)).fetchone()
-
-        if row:
-            pos["current_price"] = float(row["current_price"])
-        else:
-            pos["current_price"] = 0.0
+def get_mini_prices(data_locker: DataLocker) -> List[dict]:
+    """
+    Latest BTC/ETH/SOL prices for the header strip.
+    """
+    latest = data_locker.get_latest_prices(["BTC", "ETH", "SOL"])
+    return [
+        {"asset_type": row["asset_type"], "current_price": float(row["current_price"])}
+        for row in latest.values()
+    ]
 
-    conn.close()
-    return positions
+def fill_positions_with_latest_price(positions: List[dict]) -> List[dict]:
+    return DataLocker.get_instance(DB_PATH).fill_missing_prices(positions)
 
 def _convert_iso_to_pst(iso_str):
     if not iso_str or iso_str == "N/A":
@@ -927,17 +923,13 @@ def _convert_iso_to_pst(iso_str):
 def _get_top_prices_for_assets(db_path, assets=None):
     if assets is None:
         assets = ["BTC", "ETH", "SOL"]
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    cur = get_pool(db_path).connection().cursor()
     results = []
     for asset in assets:
         row = cur.execute("""
             SELECT asset_type, current_price, last_update_time
-              FROM prices
+              FROM latest_prices
              WHERE asset_type = ?
-             ORDER BY last_update_time DESC
-             LIMIT 1
         """, (asset,)).fetchone()
         if row:
             iso = row["last_update_time"]
@@ -952,21 +944,26 @@ def _get_top_prices_for_assets(db_path, assets=None):
                 "current_price": 0.0,
                 "last_update_time_pst": "N/A"
             })
-    conn.close()
     return results
 
 def _get_recent_prices(db_path, limit=15):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute(f"""
-        SELECT asset_type, current_price, last_update_time
-          FROM prices
-         ORDER BY last_update_time DESC
-         LIMIT {limit}
-    """)
-    rows = cur.fetchall()
-    conn.close()
+    # The newest `limit` rows overall are among the newest `limit` of each
+    # asset, so take those per asset off idx_prices_asset_time and merge.
+    cur = get_pool(db_path).connection().cursor()
+    cur.execute("SELECT asset_type FROM latest_prices")
+    assets = [r["asset_type"] for r in cur.fetchall()]
+    rows = []
+    for asset in assets:
+        cur.execute("""
+            SELECT asset_type, current_price, last_update_time
+              FROM prices
+             WHERE asset_type = ?
+             ORDER BY last_update_time DESC
+             LIMIT ?
+        """, (asset, limit))
+        rows.extend(cur.fetchall())
+    rows.sort(key=lambda r: r["last_update_time"] or "", reverse=True)
+    rows = rows[:limit]
 
     results = []
     for r in rows:
@@ -978,7 +975,8 @@ def _get_recent_prices(db_path, limit=15):
         })
     return results
 
-def build_heat_data(positions: List[dict]) -> dict:
+def build_heat_data(positions: List[dict], risk: Optional[dict] = None) -> dict:
+    side_risk = (risk or {}).get("portfolio", {})
     structure = {
        "BTC":  {"short": {}, "long": {}},
        "ETH":  {"short": {}, "long": {}},
@@ -991,7 +989,8 @@ def build_heat_data(positions: List[dict]) -> dict:
            "leverage": 0.0,
            "travel_percent": 0.0,
            "heat_index": 0.0,
-           "size": 0.0
+           "size": 0.0,
+           "liquidation_probability": side_risk.get("short")
          },
          "long": {
            "asset": "Long",
@@ -1000,7 +999,8 @@ def build_heat_data(positions: List[dict]) -> dict:
            "leverage": 0.0,
            "travel_percent": 0.0,
            "heat_index": 0.0,
-           "size": 0.0
+           "size": 0.0,
+           "liquidation_probability": side_risk.get("long")
          }
        }
     }
@@ -1019,7 +1019,8 @@ def build_heat_data(positions: List[dict]) -> dict:
           "leverage": float(pos.get("leverage", 0.0)),
           "travel_percent": float(pos.get("current_travel_percent", 0.0)),
           "heat_index": float(pos.get("heat_index", 0.0)),
-          "size": float(pos.get("size", 0.0))
+          "size": float(pos.get("size", 0.0)),
+          "liquidation_probability": pos.get("liquidation_probability")
         }
         structure[asset][side] = row
 
@@ -1035,7 +1036,7 @@ def build_heat_data(positions: List[dict]) -> dict:
 @app.route("/assets")
 @app.route("/assets")
 def assets():
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
 
     # 1) Read brokers & sort descending
     brokers = data_locker.read_brokers()
@@ -1066,7 +1067,7 @@ def add_wallet():
     Reads form fields for a new wallet, then inserts a row via data_locker.create_wallet().
     Redirects back to /assets.
     """
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
 
     name = request.form.get("name", "").strip()
     public_addr = request.form.get("public_address", "").strip()
@@ -1098,7 +1099,7 @@ def add_broker():
     Reads form fields for a new broker, then inserts a row in 'brokers'.
     Redirects back to /assets.
     """
-    data_locker = DataLocker(DB_PATH)
+    data_locker = DataLocker.get_instance(DB_PATH)
 
     name = request.form.get("name", "").strip()
     image_path = request.form.get("image_path", "").strip()
@@ -1128,13 +1129,8 @@ def delete_wallet(wallet_name):
     Removes the given wallet row from DB by name.
     (If your 'wallets' table uses a different primary key, adjust accordingly.)
     """
-    data_locker = DataLocker(DB_PATH)
-    conn = data_locker.get_db_connection()
-    cursor = conn.cursor()
-
-    # If 'name' is the PK/unique:
-    cursor.execute("DELETE FROM wallets WHERE name = ?", (wallet_name,))
-    conn.commit()
+    data_locker = DataLocker.get_instance(DB_PATH)
+    data_locker.delete_wallet(wallet_name)
 
     flash(f"Deleted wallet '{wallet_name}'.", "info")
     return redirect(url_for("assets"))
@@ -1145,12 +1141,8 @@ def delete_broker(broker_name):
     """
     Removes the given broker row by its 'name' primary key.
     """
-    data_locker = DataLocker(DB_PATH)
-    conn = data_locker.get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("DELETE FROM brokers WHERE name = ?", (broker_name,))
-    conn.commit()
+    data_locker = DataLocker.get_instance(DB_PATH)
+    data_locker.delete_broker(broker_name)
 
     flash(f"Deleted broker '{broker_name}'.", "info")
     return redirect(url_for("assets"))
@@ -0,0 +1,377 @@
+"""
+Hedge analytics over positions linked by hedge_buddy_id.
+
+Positions joined by hedge_buddy_id form one hedge: a position pointing
+at another's id, or several positions sharing the same hedge_buddy_id
+value, end up in the same group (union-find over the links). A group
+needs two or more legs; a link to nothing is counted as dangling.
+
+Per (asset, wallet), per asset, per wallet and per hedge:
+
+    net_delta     long tokens - short tokens (size / entry_price), per asset
+    net_usd       long_usd - short_usd at current prices
+    hedge_ratio   min(long_usd, short_usd) / max(long_usd, short_usd):
+                  1.0 fully offset, 0.0 one-sided
+
+and per hedge its combined liquidation distance: the hedge breaks as soon
+as one leg liquidates, so it is the smallest of its legs' distances, in
+percent of price (long: (price - liquidation) / price, short the other
+way; negative once past it). safe_low / safe_high bound the price range
+in which no leg of a single-asset hedge liquidates.
+
+HedgeBook holds all of this as NumPy columns. A tick on one asset
+recomputes that asset's legs, its (asset, wallet) sums and only the
+hedges with a leg on it; positions with their own current_price keep it.
+HedgeEngine keeps one HedgeBook per DataLocker, rebuilt when positions
+or links change and moved to the latest prices on every report();
+/api/hedges serves the report to hedge_report.html. hedge_pairing.py
+sets the links automatically.
+"""
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from position_book import LONG, PositionBook, side_of_strict
+
+logger = logging.getLogger("HedgeEngineLogger")
+
+
+def hedge_groups(ids: List[str], links: Dict[str, str]) -> 'np.ndarray':
+    """
+    Group number per position (-1 if not hedged) from {position_id:
+    hedge_buddy_id}. Numbers run 0.. in order of each group's first leg.
+    """
+    parent: Dict[str, str] = {}
+
+    def find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while x != root:
+            parent[x], x = root, parent.get(x, x)
+        return root
+
+    for pid, buddy in links.items():
+        a, b = find(pid), find(buddy)
+        if a != b:
+            parent[a] = b
+
+    roots = [find(pid) for pid in ids]
+    legs = Counter(roots)
+    numbers: Dict[str, int] = {}
+    return np.fromiter(
+        (numbers.setdefault(r, len(numbers)) if legs[r] > 1 else -1 for r in roots),
+        dtype=np.int64, count=len(ids)
+    )
+
+
+def hedge_ratio(long_usd: float, short_usd: float) -> float:
+    big = max(long_usd, short_usd)
+    return min(long_usd, short_usd) / big if big > 0 else 0.0
+
+
+def _number(x: float) -> Optional[float]:
+    # JSON-safe float: NaN (no price) and inf (no liquidation price) -> None
+    return float(x) if math.isfinite(x) else None
+
+
+class HedgeBook:
+    """
+    Hedge sums for one PositionBook (side by side_of_strict).
+      - Leg columns (long_usd, short_usd, distance) are per position;
+        key_* columns per (asset, wallet) in self.keys; group_* columns per
+        hedge.
+      - Membership is fixed once built, as for PositionBook; rebuild after
+        positions or links change.
+    """
+
+    def __init__(self, book: PositionBook, links: Dict[str, str]):
+        self.book = book
+        n = len(book)
+        self.group = hedge_groups(book.ids, links)
+        self.groups = int(self.group.max()) + 1 if n else 0
+        self.dangling = sum(1 for pid in links if pid in book and self.group[book.index_of(pid)] < 0)
+
+        self.is_long = book.side == LONG
+        self.tokens = np.zeros(n)
+        np.divide(book.size, book.entry_price, out=self.tokens, where=book.entry_price > 0)
+        self.follow = book.current_price <= 0
+        self.price = np.where(self.follow, np.nan, book.current_price)
+        self.long_usd = np.zeros(n)
+        self.short_usd = np.zeros(n)
+        self.distance = np.full(n, np.nan)
+
+        # (asset, wallet) sums; token sums only change with positions.
+        keys: Dict[tuple, int] = {}
+        self.key = np.fromiter(
+            (keys.setdefault((book.assets[a], w), len(keys)) for a, w in zip(book.asset.tolist(), book.wallets)),
+            dtype=np.int64, count=n
+        )
+        self.keys = list(keys)
+        k = len(self.keys)
+        self.key_long_tokens = np.bincount(self.key, np.where(self.is_long, self.tokens, 0.0), k)
+        self.key_short_tokens = np.bincount(self.key, np.where(self.is_long, 0.0, self.tokens), k)
+        self.key_hedged_legs = np.bincount(self.key, self.group >= 0, k).astype(np.int64)
+        self.key_long_usd = np.zeros(k)
+        self.key_short_usd = np.zeros(k)
+
+        # Hedges: legs grouped through a CSR (order, bounds); constant
+        # per-hedge columns up front.
+        hedged = np.flatnonzero(self.group >= 0)
+        self._order = hedged[np.argsort(self.group[hedged], kind="stable")]
+        self._bounds = np.searchsorted(self.group[self._order], np.arange(self.groups + 1))
+        g = self.group[hedged]
+        signed = np.where(self.is_long, self.tokens, -self.tokens)[hedged]
+        liq = book.liquidation_price[hedged]
+        long_liq = np.where(self.is_long[hedged] & (liq > 0), liq, -np.inf)
+        short_liq = np.where(~self.is_long[hedged] & (liq > 0), liq, np.inf)
+        self.group_net_tokens = np.bincount(g, signed, self.groups)
+        self.group_safe_low = np.full(self.groups, -np.inf)
+        self.group_safe_high = np.full(self.groups, np.inf)
+        np.maximum.at(self.group_safe_low, g, long_liq)
+        np.minimum.at(self.group_safe_high, g, short_liq)
+        asset_lo = np.full(self.groups, np.iinfo(np.int64).max)
+        asset_hi = np.full(self.groups, -1)
+        np.minimum.at(asset_lo, g, book.asset[hedged].astype(np.int64))
+        np.maximum.at(asset_hi, g, book.asset[hedged].astype(np.int64))
+        self.group_asset = np.where(asset_lo == asset_hi, asset_hi, -1)   # -1: mixed assets
+        self.group_long_usd = np.zeros(self.groups)
+        self.group_short_usd = np.zeros(self.groups)
+        self.group_distance = np.full(self.groups, np.nan)
+        self.group_nearest = np.full(self.groups, -1, dtype=np.int64)
+
+        # Every leg of every hedge that has a leg on the asset.
+        self._hedge_rows: Dict[str, 'np.ndarray'] = {}
+        for asset in book.assets:
+            touched = np.unique(self.group[book.rows_for(asset)])
+            touched = touched[touched >= 0]
+            self._hedge_rows[asset] = np.concatenate(
+                [self._order[self._bounds[t]:self._bounds[t + 1]] for t in touched]
+            ) if len(touched) else np.empty(0, dtype=np.intp)
+
+        self._prices: Dict[str, float] = {}
+        self._stamps: Dict[str, str] = {}
+        everyone = np.arange(n)
+        self._refresh_legs(everyone)
+        self._refresh_keys(everyone)
+        self._refresh_hedges(hedged)
+        logger.debug(f"Built {self.groups} hedges over {n} positions ({self.dangling} dangling links).")
+
+    # ----------------------------------------------------------------
+    # Prices
+    # ----------------------------------------------------------------
+
+    @property
+    def assets(self) -> List[str]:
+        return self.book.assets
+
+    def set_price(self, asset_type: str, price: float) -> int:
+        """
+        Moves every position following asset_type to price and refreshes
+        what depends on them. Returns how many positions were repriced.
+        """
+        asset = asset_type.upper()
+        rows = self.book.rows_for(asset)
+        self._prices[asset] = float(price)
+        moved = rows[self.follow[rows]]
+        if not len(moved):
+            return 0
+        self.price[moved] = float(price)
+        self._refresh_legs(moved)
+        self._refresh_keys(rows)
+        self._refresh_hedges(self._hedge_rows[asset])
+        return len(moved)
+
+    def apply_ticks(self, rows: Iterable[dict]) -> int:
+        """
+        Price rows (asset_type, current_price, last_update_time), e.g.
+        get_latest_prices(...).values(); only assets whose price changed
+        are recomputed, and an older tick never replaces a newer one.
+        """
+        repriced = 0
+        for row in rows:
+            asset = (row["asset_type"] or "").upper()
+            stamp = str(row.get("last_update_time") or "")
+            if asset in self._stamps and stamp < self._stamps[asset]:
+                continue
+            self._stamps[asset] = stamp
+            price = float(row["current_price"] or 0.0)
+            if self._prices.get(asset) != price:
+                repriced += self.set_price(asset, price)
+        return repriced
+
+    def _refresh_legs(self, rows: 'np.ndarray'):
+        price = self.price[rows]
+        usd = self.tokens[rows] * price
+        longs = self.is_long[rows]
+        self.long_usd[rows] = np.where(longs, usd, 0.0)
+        self.short_usd[rows] = np.where(longs, 0.0, usd)
+        liq = self.book.liquidation_price[rows]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            gap = np.where(longs, price - liq, liq - price) / price * 100
+        self.distance[rows] = np.where(liq > 0, gap, np.inf)
+
+    def _refresh_keys(self, rows: 'np.ndarray'):
+        keys = np.unique(self.key[rows])
+        k = len(self.keys)
+        self.key_long_usd[keys] = np.bincount(self.key[rows], np.nan_to_num(self.long_usd[rows]), k)[keys]
+        self.key_short_usd[keys] = np.bincount(self.key[rows], np.nan_to_num(self.short_usd[rows]), k)[keys]
+
+    def _refresh_hedges(self, rows: 'np.ndarray'):
+        if not len(rows):
+            return
+        g = self.group[rows]
+        groups = np.unique(g)
+        self.group_long_usd[groups] = np.bincount(g, np.nan_to_num(self.long_usd[rows]), self.groups)[groups]
+        self.group_short_usd[groups] = np.bincount(g, np.nan_to_num(self.short_usd[rows]), self.groups)[groups]
+        # Nearest leg per hedge: sort by (hedge, distance), NaN last, take the first.
+        ranked = rows[np.lexsort((self.distance[rows], g))]
+        first = ranked[np.flatnonzero(np.diff(self.group[ranked], prepend=-1))]
+        self.group_nearest[self.group[first]] = first
+        self.group_distance[self.group[first]] = self.distance[first]
+
+    # ----------------------------------------------------------------
+    # Reading
+    # ----------------------------------------------------------------
+
+    def legs(self, group: int) -> 'np.ndarray':
+        return self._order[self._bounds[group]:self._bounds[group + 1]]
+
+    def exposure(self) -> List[dict]:
+        """
+        One dict per (asset, wallet): tokens, USD and hedge ratio.
+        """
+        return [
+            self._exposure_of(long_t, short_t, long_u, short_u, asset=asset, wallet_name=wallet, hedged_legs=int(legs))
+            for (asset, wallet), long_t, short_t, long_u, short_u, legs in zip(
+                self.keys, self.key_long_tokens.tolist(), self.key_short_tokens.tolist(),
+                self.key_long_usd.tolist(), self.key_short_usd.tolist(), self.key_hedged_legs.tolist())
+        ]
+
+    def breakdown(self, by: str) -> Dict[Optional[str], dict]:
+        """
+        exposure() summed per "asset" or per "wallet" (no net_delta per
+        wallet: its tokens are of different assets).
+        """
+        column = {"asset": 0, "wallet": 1}[by]
+        sums: Dict[Optional[str], list] = {}
+        for row in self.exposure():
+            key = row["asset"] if column == 0 else row["wallet_name"]
+            acc = sums.setdefault(key, [0.0, 0.0, 0.0, 0.0, 0])
+            for i, field in enumerate(("long_tokens", "short_tokens", "long_usd", "short_usd", "hedged_legs")):
+                acc[i] += row[field]
+        out = {}
+        for key, (long_t, short_t, long_u, short_u, legs) in sums.items():
+            row = self._exposure_of(long_t, short_t, long_u, short_u, hedged_legs=legs)
+            if column == 1:
+                for field in ("long_tokens", "short_tokens", "net_delta"):
+                    del row[field]
+            out[key] = row
+        return out
+
+    @staticmethod
+    def _exposure_of(long_tokens, short_tokens, long_usd, short_usd, **extra) -> dict:
+        return {
+            **extra,
+            "long_tokens": long_tokens,
+            "short_tokens": short_tokens,
+            "net_delta": long_tokens - short_tokens,
+            "long_usd": long_usd,
+            "short_usd": short_usd,
+            "net_usd": long_usd - short_usd,
+            "hedge_ratio": hedge_ratio(long_usd, short_usd),
+        }
+
+    def hedges(self, limit: Optional[int] = None) -> List[dict]:
+        """
+        Hedges closest to a liquidation first (unpriced ones last), with
+        their legs.
+        """
+        ranked = np.argsort(np.where(np.isnan(self.group_distance), np.inf, self.group_distance), kind="stable")
+        if limit is not None:
+            ranked = ranked[:limit]
+        book = self.book
+        out = []
+        for g in ranked.tolist():
+            legs = self.legs(g)
+            asset = self.group_asset[g]
+            nearest = int(self.group_nearest[g])
+            long_usd, short_usd = float(self.group_long_usd[g]), float(self.group_short_usd[g])
+            out.append({
+                "hedge": g,
+                "asset": book.assets[asset] if asset >= 0 else None,
+                "wallets": sorted({book.wallets[i] for i in legs.tolist()}, key=str),
+                "long_usd": long_usd,
+                "short_usd": short_usd,
+                "net_usd": long_usd - short_usd,
+                "net_delta": float(self.group_net_tokens[g]) if asset >= 0 else None,
+                "hedge_ratio": hedge_ratio(long_usd, short_usd),
+                "liquidation_distance_percent": _number(self.group_distance[g]),
+                "nearest_leg": book.ids[nearest] if nearest >= 0 else None,
+                "safe_low": _number(self.group_safe_low[g]) if asset >= 0 else None,
+                "safe_high": _number(self.group_safe_high[g]) if asset >= 0 else None,
+                "legs": [{
+                    "id": book.ids[i],
+                    "asset": book.assets[book.asset[i]],
+                    "wallet_name": book.wallets[i],
+                    "side": "LONG" if self.is_long[i] else "SHORT",
+                    "size": float(book.size[i]),
+                    "entry_price": float(book.entry_price[i]),
+                    "liquidation_price": float(book.liquidation_price[i]),
+                    "current_price": _number(self.price[i]),
+                    "liquidation_distance_percent": _number(self.distance[i]),
+                } for i in legs.tolist()],
+            })
+        return out
+
+    def report(self, limit: Optional[int] = None) -> dict:
+        """
+        The JSON /api/hedges returns.
+        """
+        return {
+            "positions": len(self.book),
+            "hedged_positions": int((self.group >= 0).sum()),
+            "hedge_count": self.groups,
+            "dangling_links": self.dangling,
+            "prices": dict(self._prices),
+            "by_asset": self.breakdown("asset"),
+            "by_wallet": self.breakdown("wallet"),
+            "exposure": self.exposure(),
+            "hedges": self.hedges(limit),
+        }
+
+
+class HedgeEngine:
+    """
+    Hedge reports for one DataLocker's positions.
+      - The HedgeBook is rebuilt when positions or hedge links change in
+        this process (portfolio / hedge version); each report() first
+        moves it to the latest prices, recomputing only assets that
+        ticked.
+    """
+
+    def __init__(self, data_locker):
+        self.data_locker = data_locker
+        self._lock = threading.Lock()
+        self._book: Optional[HedgeBook] = None
+        self._version = None
+
+    def hedge_book(self) -> HedgeBook:
+        with self._lock:
+            version = (self.data_locker.portfolio.version, self.data_locker.hedge_version)
+            if self._book is None or version != self._version:
+                book = self.data_locker.read_position_book(side_of_strict)
+                self._book = HedgeBook(book, self.data_locker.read_hedge_links())
+                self._version = version
+            latest = self.data_locker.get_latest_prices(self._book.assets)
+            self._book.apply_ticks(latest.values())
+            return self._book
+
+    def report(self, limit: Optional[int] = None) -> dict:
+        book = self.hedge_book()
+        with self._lock:
+            return book.report(limit)
@@ -0,0 +1,187 @@
+"""
+Automatic hedge pairing: sets hedge_buddy_id on opposing positions.
+
+Each run:
+
+  1) checks the existing links (hedge_engine.hedge_groups). A hedge is
+     kept while it has longs and shorts on one asset whose total sizes
+     are within min_size_ratio of each other (min / max). Any other
+     linked position (buddy gone, side or asset changed, size drifted
+     apart, or a link to nothing) is stale. Links may have been set by
+     hand, so stale ones are only reported and left as they are, unless
+     clear_links is on: then they are cleared and matched again;
+  2) matches the positions in no hedge, per asset (per asset and wallet
+     with same_wallet), closest sizes first: the sizes are sorted once,
+     every adjacent long / short is a candidate, and the candidate with
+     the smallest size ratio is paired off, after which its two outer
+     neighbours become adjacent (a heap over a linked list, O(n log n)).
+     Pairs further apart than min_size_ratio are never made;
+  3) writes only the rows whose hedge_buddy_id changes, in one
+     transaction (DataLocker.set_hedge_buddies). A pair is linked both
+     ways (A -> B and B -> A).
+
+Positions already hedged are left alone, so re-running after an import
+only touches the new ones (and, with clear_links, the changed ones). Configured under
+system_config["hedge_pairing"]; flask_app runs it after position imports.
+"""
+import math
+import heapq
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from hedge_engine import hedge_groups
+from position_book import LONG, side_of_strict
+
+logger = logging.getLogger("HedgePairingLogger")
+
+DEFAULT_PAIRING: Dict[str, Any] = {
+    "enabled": True,
+    "same_wallet": False,       # only pair positions within one wallet
+    "min_size_ratio": 0.25,     # smaller / larger size for a pair to count
+    "clear_links": False,       # clear and re-match stale links (may be hand-set)
+}
+
+
+def match_sizes(longs: List[Tuple[float, int]], shorts: List[Tuple[float, int]], min_ratio: float) -> List[Tuple[int, int]]:
+    """
+    Greedy closest-size matching of (size, row) longs against shorts:
+    repeatedly pairs the adjacent (in size order) long / short with the
+    smallest size ratio. Returns (long_row, short_row) pairs; sizes must
+    be > 0.
+    """
+    items = sorted([(s, 0, r) for s, r in longs] + [(s, 1, r) for s, r in shorts])
+    n = len(items)
+    logs = [math.log(s) for s, _, _ in items]
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    alive = [True] * n
+
+    heap = [(logs[i + 1] - logs[i], i, i + 1) for i in range(n - 1) if items[i][1] != items[i + 1][1]]
+    heapq.heapify(heap)
+    pairs = []
+    while heap:
+        gap, i, j = heapq.heappop(heap)
+        # The ratio itself, not the log gap, so a pair right at min_ratio
+        # counts as plan_pairing's balance check does.
+        if items[i][0] / items[j][0] < min_ratio:
+            break   # every remaining candidate is further apart
+        if not (alive[i] and alive[j]) or nxt[i] != j:
+            continue
+        alive[i] = alive[j] = False
+        a, b = items[i], items[j]
+        pairs.append((a[2], b[2]) if a[1] == 0 else (b[2], a[2]))
+        p, q = prev[i], nxt[j]
+        if p >= 0:
+            nxt[p] = q
+        if q < n:
+            prev[q] = p
+        if p >= 0 and q < n and items[p][1] != items[q][1]:
+            heapq.heappush(heap, (logs[q] - logs[p], p, q))
+    return pairs
+
+
+def plan_pairing(book, links: Dict[str, str], settings: Dict[str, Any]) -> Tuple[Dict[str, Optional[str]], dict]:
+    """
+    The hedge_buddy_id changes for a PositionBook (side by side_of_strict)
+    and its current {id: hedge_buddy_id} links, plus counts: kept (hedges
+    left as they are), stale (positions in any other linked group),
+    cleared (links removed), paired (new pairs).
+    """
+    min_ratio = float(settings["min_size_ratio"])
+    group = hedge_groups(book.ids, links)
+    groups = int(group.max()) + 1 if len(book) else 0
+    is_long = book.side == LONG
+    hedged = group >= 0
+
+    # 1) Existing hedges: one asset, both sides, balanced sizes.
+    g = group[hedged]
+    long_size = np.bincount(g, np.where(is_long, book.size, 0.0)[hedged], groups)
+    short_size = np.bincount(g, np.where(is_long, 0.0, book.size)[hedged], groups)
+    some_asset = np.full(groups, -1, dtype=np.int64)
+    some_asset[g] = book.asset[hedged]      # any one leg's asset
+    one_asset = np.ones(groups, dtype=bool)
+    np.logical_and.at(one_asset, g, book.asset[hedged] == some_asset[g])
+    big = np.maximum(long_size, short_size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        balanced = np.minimum(long_size, short_size) / big >= min_ratio
+    valid = one_asset & (long_size > 0) & (short_size > 0) & balanced
+    keep = np.zeros(len(book), dtype=bool)
+    keep[hedged] = valid[g]
+
+    # Stale: in a group that is not kept, or linked to nothing in the book.
+    linked = np.fromiter((bool(links.get(pid)) for pid in book.ids), dtype=bool, count=len(book))
+    stale = ~keep & (hedged | linked)
+    changes: Dict[str, Optional[str]] = {}
+    if settings["clear_links"]:
+        for i in np.flatnonzero(stale & linked).tolist():
+            changes[book.ids[i]] = None
+        matchable = ~keep
+    else:
+        matchable = ~(keep | stale)
+
+    # 2) Match everything not in a kept hedge (nor stale, without clear_links).
+    buckets: Dict[tuple, Tuple[list, list]] = {}
+    free = np.flatnonzero(matchable & (book.size > 0))
+    for i, asset, size, long in zip(free.tolist(), book.asset[free].tolist(),
+                                    book.size[free].tolist(), is_long[free].tolist()):
+        key = (asset, book.wallets[i]) if settings["same_wallet"] else (asset,)
+        legs = buckets.setdefault(key, ([], []))
+        legs[0 if long else 1].append((size, i))
+    paired = 0
+    for longs, shorts in buckets.values():
+        if not longs or not shorts:
+            continue
+        for a, b in match_sizes(longs, shorts, min_ratio):
+            changes[book.ids[a]] = book.ids[b]
+            changes[book.ids[b]] = book.ids[a]
+            paired += 1
+
+    # 3) Only rows whose link actually changes.
+    changes = {pid: buddy for pid, buddy in changes.items() if links.get(pid) != buddy}
+    counts = {
+        "kept": int(valid.sum()),
+        "stale": int(stale.sum()),
+        "cleared": sum(1 for buddy in changes.values() if buddy is None),
+        "paired": paired,
+    }
+    return changes, counts
+
+
+class HedgePairing:
+    """
+    Runs plan_pairing against one DataLocker and writes the result.
+    """
+
+    def __init__(self, data_locker, settings: Optional[Dict[str, Any]] = None):
+        self.data_locker = data_locker
+        self.settings = dict(DEFAULT_PAIRING, **(settings or {}))
+
+    @classmethod
+    def from_config(cls, data_locker, config: Dict[str, Any]) -> 'HedgePairing':
+        """
+        Builds the job from a loaded config dict (see load_config).
+        """
+        return cls(data_locker, config.get("system_config", {}).get("hedge_pairing", {}))
+
+    def run(self, **overrides) -> dict:
+        """
+        Pairs what needs pairing; returns the counts plus how many rows
+        were written and how long it took. Does nothing when disabled.
+        """
+        settings = dict(self.settings, **overrides)
+        if not settings["enabled"]:
+            return {"enabled": False}
+        start = time.perf_counter()
+        book = self.data_locker.read_position_book(side_of_strict)
+        changes, counts = plan_pairing(book, self.data_locker.read_hedge_links(), settings)
+        written = self.data_locker.set_hedge_buddies(changes)
+        result = dict(counts, enabled=True, written=written, ms=(time.perf_counter() - start) * 1000)
+        logger.info(
+            f"Hedge pairing: {counts['paired']} new pairs, {counts['kept']} kept, "
+            f"{counts['stale']} stale positions, {counts['cleared']} links cleared, "
+            f"{written} rows written in {result['ms']:.1f} ms."
+        )
+        return result
@@ -0,0 +1,109 @@
+"""
+In-process cache of the latest_prices table.
+
+DataLocker owns one LatestPriceCache and feeds it every price it commits
+(write-through), so repeated "latest BTC/ETH/SOL price" lookups within a
+request, or once per alert, come from memory. Misses fall back to
+latest_prices. Entries also expire after ttl_seconds so ticks written by
+another process (e.g. a standalone price monitor) still show up.
+
+Configured under system_config["latest_price_cache_ttl"] (seconds).
+"""
+import time
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("LatestPriceCacheLogger")
+
+DEFAULT_TTL = 2.0
+
+# Loads latest_prices rows for the given assets: {asset_type: row dict}.
+Loader = Callable[[List[str]], Dict[str, dict]]
+
+
+class LatestPriceCache:
+    """
+    asset_type -> newest price row.
+      - put() is the write-through path; an older tick never replaces a
+        newer cached one (same rule as the latest_prices upsert).
+      - Assets with no price are cached as None too, so an unknown asset
+        costs one query per ttl, not one per lookup.
+      - Rows are handed out as copies; callers may mutate them.
+    """
+
+    def __init__(self, loader: Loader, ttl: float = DEFAULT_TTL):
+        self.loader = loader
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Optional[dict], float]] = {}
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, asset_type: str) -> Optional[dict]:
+        return self.get_many([asset_type]).get(asset_type)
+
+    def get_many(self, assets: Iterable[str]) -> Dict[str, dict]:
+        """
+        Latest rows for every asset that has one, loading all misses in a
+        single query.
+        """
+        assets = list(dict.fromkeys(assets))
+        now = time.monotonic()
+        found: Dict[str, Optional[dict]] = {}
+        missing = []
+        with self._lock:
+            for asset in assets:
+                entry = self._entries.get(asset)
+                if entry is not None and now - entry[1] < self.ttl:
+                    found[asset] = entry[0]
+                else:
+                    missing.append(asset)
+            self._hits += len(found)
+            self._misses += len(missing)
+
+        if missing:
+            loaded = self.loader(missing)
+            with self._lock:
+                for asset in missing:
+                    row = loaded.get(asset)
+                    self._entries[asset] = (row, now)
+                    found[asset] = row
+        return {a: dict(row) for a, row in found.items() if row is not None}
+
+    def put(self, rows: Iterable[dict]):
+        """
+        Write-through: records committed price rows.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                asset = row["asset_type"]
+                entry = self._entries.get(asset)
+                cached = entry[0] if entry else None
+                if cached is not None and row["last_update_time"] < cached["last_update_time"]:
+                    continue
+                self._entries[asset] = (dict(row), now)
+
+    def invalidate(self, assets: Optional[Iterable[str]] = None):
+        """
+        Drops the given assets (default: everything) so the next lookup
+        re-reads latest_prices.
+        """
+        with self._lock:
+            if assets is None:
+                self._entries.clear()
+            else:
+                for asset in assets:
+                    self._entries.pop(asset, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._entries),
+                "ttl": self.ttl,
+            }
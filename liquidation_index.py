@@ -0,0 +1,221 @@
+"""
+Liquidation proximity index.
+
+AlertManager sorts positions into travel-percent liquid bands
+(travel_percent_liquid_ranges, e.g. low -25 / medium -50 / high -75;
+travel % as in aggregate_positions: 0 at entry, -100 at liquidation).
+Travel % moves monotonically with the asset's price, so every band
+edge is one price level per position:
+
+    long:   level = entry + t/100 * |entry - liquidation|
+    short:  level = entry - t/100 * |entry - liquidation|
+
+LiquidationIndex keeps those levels sorted per asset, longs and shorts
+apart. A move from p0 to p1 bisects for the levels between them and
+re-evaluates only those positions, so a tick costs O(log n + crossings)
+instead of a pass over the whole book.
+
+    index = LiquidationIndex.build(positions, ranges, latest_prices)
+    changes = index.move("BTC", 91500.0)   # [(id, old_band, new_band), ...]
+    index.in_band()                        # {id: (asset, band, travel %)}
+    index.position(id)                     # (asset, band, travel %) or None
+
+Positions that carry their own current_price don't follow the asset and
+keep the band they were built with. Rebuild after positions change.
+"""
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from calc_services import CalcServices
+from position_book import LONG, side_of_strict
+
+logger = logging.getLogger("LiquidationIndexLogger")
+
+BANDS = ("LOW", "MEDIUM", "HIGH")
+
+# (position_id, old band, new band); a band of None means outside every band.
+BandChange = Tuple[str, Optional[str], Optional[str]]
+
+
+def liquid_band(travel_percent: float, ranges: dict) -> Optional[str]:
+    """
+    The travel-percent liquid band for a value, or None: only negative
+    travel counts, and HIGH wins over MEDIUM over LOW.
+    """
+    if travel_percent >= 0:
+        return None
+    if travel_percent <= ranges["high"]:
+        return "HIGH"
+    if travel_percent <= ranges["medium"]:
+        return "MEDIUM"
+    if travel_percent <= ranges["low"]:
+        return "LOW"
+    return None
+
+
+class LiquidationIndex:
+    """
+    Per-asset sorted band-edge price levels.
+      - _levels[(asset, side)] is a sorted list of (level, row) pairs.
+      - Candidates from a range query are re-checked with the exact
+        travel % formula, so only real band changes are reported; levels
+        sitting within float error of p0 / p1 are included as candidates.
+    """
+
+    def __init__(self, ranges: dict):
+        self.ranges = {k: float(ranges[k]) for k in ("low", "medium", "high")}
+        self._calc = CalcServices()
+        self._lock = threading.Lock()
+        self._rows: List[tuple] = []   # (id, asset, "LONG"/"SHORT", entry, liquidation)
+        self._row_of: Dict[str, int] = {}
+        self._levels: Dict[Tuple[str, str], list] = {}
+        self._follow: Dict[str, List[int]] = {}   # asset -> rows priced by the asset
+        self._prices: Dict[str, float] = {}
+        self._own_price: Dict[int, float] = {}    # rows priced by their own current_price
+        self._bands: Dict[int, str] = {}          # row -> band, rows in a band only
+
+    # ----------------------------------------------------------------
+    # Building
+    # ----------------------------------------------------------------
+
+    @classmethod
+    def build(
+            cls,
+            positions: Iterable[dict],
+            ranges: dict,
+            prices: Optional[Dict[str, float]] = None
+    ) -> 'LiquidationIndex':
+        """
+        Index over position dicts (id, asset_type, position_type,
+        entry_price, liquidation_price, current_price). prices,
+        {asset: price}, places every position in its band right away;
+        otherwise that happens on each asset's first move().
+        """
+        index = cls(ranges)
+        edges = list(index.ranges.values()) + [0.0]
+        for pos in positions:
+            entry = float(pos.get("entry_price") or 0.0)
+            liquidation = float(pos.get("liquidation_price") or 0.0)
+            if entry <= 0 or liquidation <= 0 or entry == liquidation:
+                continue  # travel % is pinned at 0 => never in a band
+            asset = (pos.get("asset_type") or "").upper()
+            side = "LONG" if side_of_strict(pos.get("position_type")) == LONG else "SHORT"
+            row = len(index._rows)
+            index._rows.append((pos.get("id"), asset, side, entry, liquidation))
+            index._row_of[pos.get("id")] = row
+
+            own_price = float(pos.get("current_price") or 0.0)
+            if own_price > 0:
+                index._own_price[row] = own_price
+                index._evaluate(row, own_price)
+                continue
+            index._follow.setdefault(asset, []).append(row)
+            span = abs(entry - liquidation)
+            sign = 1.0 if side == "LONG" else -1.0
+            levels = index._levels.setdefault((asset, side), [])
+            for t in edges:
+                levels.append((entry + sign * t / 100.0 * span, row))
+
+        for levels in index._levels.values():
+            levels.sort()
+        for asset, price in (prices or {}).items():
+            index.move(asset, price)
+        logger.debug(f"Indexed {len(index._rows)} positions, {len(index._bands)} in a band.")
+        return index
+
+    # ----------------------------------------------------------------
+    # Moves
+    # ----------------------------------------------------------------
+
+    def move(self, asset_type: str, price: float) -> List[BandChange]:
+        """
+        The asset's price is now `price`. Returns the positions whose band
+        changed since its previous price (every position in a band on the
+        asset's first move).
+        """
+        asset = asset_type.upper()
+        price = float(price)
+        with self._lock:
+            previous = self._prices.get(asset)
+            self._prices[asset] = price
+            if previous is None:
+                candidates = self._follow.get(asset, ())
+            elif previous == price:
+                return []
+            else:
+                candidates = self._between(asset, min(previous, price), max(previous, price))
+
+            changes = []
+            for row in candidates:
+                before = self._bands.get(row)
+                after = self._evaluate(row, price)
+                if after != before:
+                    changes.append((self._rows[row][0], before, after))
+            return changes
+
+    def move_many(self, prices: Dict[str, float]) -> List[BandChange]:
+        changes = []
+        for asset, price in prices.items():
+            changes.extend(self.move(asset, price))
+        return changes
+
+    def _between(self, asset: str, low: float, high: float) -> set:
+        # Float slack so a level computed a hair off p0 / p1 is still checked.
+        slack = 1e-9 * max(abs(low), abs(high), 1.0)
+        rows = set()
+        for side in ("LONG", "SHORT"):
+            levels = self._levels.get((asset, side))
+            if not levels:
+                continue
+            lo = bisect_left(levels, (low - slack, -1))
+            hi = bisect_right(levels, (high + slack, len(self._rows)))
+            rows.update(row for _, row in levels[lo:hi])
+        return rows
+
+    def _travel_percent(self, row: int, price: float) -> float:
+        _, _, side, entry, liquidation = self._rows[row]
+        return self._calc.calculate_travel_percent_no_profit(side, entry, price, liquidation)
+
+    def _evaluate(self, row: int, price: float) -> Optional[str]:
+        band = liquid_band(self._travel_percent(row, price), self.ranges)
+        if band is None:
+            self._bands.pop(row, None)
+        else:
+            self._bands[row] = band
+        return band
+
+    # ----------------------------------------------------------------
+    # Reading
+    # ----------------------------------------------------------------
+
+    @property
+    def assets(self) -> List[str]:
+        return sorted(self._follow)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def in_band(self) -> Dict[str, Tuple[str, str, float]]:
+        """
+        {position_id: (asset, band, travel %)} for every position in a band,
+        travel % at the current price.
+        """
+        with self._lock:
+            return {self._rows[row][0]: self._band_info(row, band) for row, band in self._bands.items()}
+
+    def position(self, pos_id: str) -> Optional[Tuple[str, str, float]]:
+        """
+        (asset, band, travel %) for one position, or None when it is not in
+        a band (or not indexed).
+        """
+        with self._lock:
+            row = self._row_of.get(pos_id)
+            band = self._bands.get(row)
+            return None if band is None else self._band_info(row, band)
+
+    def _band_info(self, row: int, band: str) -> Tuple[str, str, float]:
+        asset = self._rows[row][1]
+        price = self._own_price.get(row) or self._prices[asset]
+        return asset, band, self._travel_percent(row, price)
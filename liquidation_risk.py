@@ -0,0 +1,276 @@
+"""
+Monte Carlo liquidation probabilities.
+
+The heat index ((size * leverage) / collateral) ranks exposure but says
+nothing about how likely a liquidation is. This module:
+
+  1) fits a return model from price_rollups closes: per-step log-return
+     volatility and the correlation between assets, over lookback_days
+     at `resolution` ('1m' / '1h' / '1d');
+  2) simulates correlated log-price paths over horizon_hours, in
+     batches of batch_paths, tracking each path's running low and high
+     per asset (zero drift in price: mu = -sigma^2 / 2 per step);
+  3) scores every position: a long is liquidated on a path whose low
+     reaches log(liquidation / price), a short when the high does. One
+     sort of the per-asset lows / highs turns that into a searchsorted
+     per position.
+
+Batches get their own seeds spawned from `seed`, so the numbers are the
+same whether the batches run inline or across a process pool (used once
+paths >= parallel_min_paths). Paths are monitored at the rollup step, so
+an intra-step wick through a liquidation price is not seen.
+
+Configured under system_config["liquidation_risk"]; LiquidationRisk
+caches results per price snapshot, and /heat shows them.
+"""
+import os
+import math
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from position_book import LONG
+
+logger = logging.getLogger("LiquidationRiskLogger")
+
+DEFAULT_RISK: Dict[str, Any] = {
+    "enabled": True,
+    "paths": 20000,
+    "horizon_hours": 24,
+    "resolution": "1h",
+    "lookback_days": 30,
+    "min_returns": 24,          # fewer aligned returns => asset has no model
+    "seed": 7,
+    "batch_paths": 10000,
+    "workers": 0,               # 0 = os.cpu_count()
+    "parallel_min_paths": 200000,
+    "cache_size": 8,
+}
+
+STEP_HOURS = {"1m": 1 / 60, "1h": 1.0, "1d": 24.0}
+
+
+class ReturnModel:
+    """
+    Per-step log returns for a set of assets: cov is the covariance
+    matrix, chol a factor with chol @ chol.T == cov.
+    """
+
+    def __init__(self, assets: List[str], cov: 'np.ndarray', observations: int):
+        self.assets = assets
+        self.cov = cov
+        self.observations = observations
+        self.vol = np.sqrt(np.diag(cov))
+        try:
+            self.chol = np.linalg.cholesky(cov)
+        except np.linalg.LinAlgError:
+            # Singular (e.g. two assets moving in lockstep): factor via eigh.
+            w, v = np.linalg.eigh(cov)
+            self.chol = v * np.sqrt(np.clip(w, 0.0, None))
+
+    @classmethod
+    def from_closes(cls, closes: Dict[str, List[Tuple[str, float]]], min_returns: int) -> Optional['ReturnModel']:
+        """
+        closes: {asset: [(bucket_start, close), ...]}. Uses the buckets
+        every asset has; assets with fewer than min_returns returns on
+        their own are dropped. None if nothing is left.
+        """
+        usable = {a: dict(rows) for a, rows in closes.items() if len(rows) > min_returns}
+        if not usable:
+            return None
+        assets = sorted(usable)
+        common = sorted(set.intersection(*(set(rows) for rows in usable.values())))
+        if len(common) <= min_returns:
+            return None
+        prices = np.array([[usable[a][b] for a in assets] for b in common], dtype=np.float64)
+        if (prices <= 0).any():
+            return None
+        returns = np.diff(np.log(prices), axis=0)
+        cov = np.atleast_2d(np.cov(returns, rowvar=False))
+        return cls(assets, cov, len(returns))
+
+    def describe(self, step_hours: float) -> dict:
+        daily = math.sqrt(24.0 / step_hours)
+        std = np.where(self.vol > 0, self.vol, 1.0)
+        corr = self.cov / np.outer(std, std)
+        return {
+            "assets": self.assets,
+            "observations": self.observations,
+            "daily_vol": {a: float(v * daily) for a, v in zip(self.assets, self.vol)},
+            "correlation": np.round(corr, 4).tolist(),
+        }
+
+
+def simulate_extremes(chol: 'np.ndarray', steps: int, paths: int, seed) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    One batch: (lows, highs), each (paths, assets), the minimum / maximum
+    cumulative log return each path reaches over `steps` steps. seed is
+    anything np.random.default_rng takes (a SeedSequence per batch).
+    Module-level so a process pool can pickle it.
+    """
+    rng = np.random.default_rng(seed)
+    drift = -0.5 * np.sum(chol * chol, axis=1)
+    level = np.zeros((paths, len(chol)))
+    lows = np.zeros_like(level)
+    highs = np.zeros_like(level)
+    for _ in range(steps):
+        level += rng.standard_normal(level.shape) @ chol.T + drift
+        np.minimum(lows, level, out=lows)
+        np.maximum(highs, level, out=highs)
+    return lows, highs
+
+
+def simulate(chol, steps: int, paths: int, seed: int, batch_paths: int, workers: int = 1):
+    """
+    (lows, highs) over all paths, batch by batch; identical for any
+    `workers` since each batch has its own spawned seed.
+    """
+    sizes = [min(batch_paths, paths - start) for start in range(0, paths, batch_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(chol, steps, size, s) for size, s in zip(sizes, seeds)]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            parts = list(pool.map(simulate_extremes, *zip(*jobs)))
+    else:
+        parts = [simulate_extremes(*job) for job in jobs]
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+def liquidation_probabilities(book, model: ReturnModel, lows, highs) -> Tuple['np.ndarray', dict]:
+    """
+    Per-position probabilities (NaN where there is no model, price or
+    liquidation price) and portfolio figures from simulated extremes.
+    """
+    paths = len(lows)
+    prob = np.full(len(book), np.nan)
+    scorable = (book.current_price > 0) & (book.liquidation_price > 0)
+    threshold = np.zeros(len(book))
+    np.log(book.liquidation_price / np.where(scorable, book.current_price, 1.0),
+           out=threshold, where=scorable)
+    is_long = book.side == LONG
+
+    hit_any = np.zeros(paths, dtype=bool)
+    hit_side = {"long": np.zeros(paths, dtype=bool), "short": np.zeros(paths, dtype=bool)}
+    for column, asset in enumerate(model.assets):
+        rows = book.rows_for(asset)
+        rows = rows[scorable[rows]]
+        if not len(rows):
+            continue
+        low, high = lows[:, column], highs[:, column]
+        longs, shorts = rows[is_long[rows]], rows[~is_long[rows]]
+        # A long dies on paths whose low <= its threshold; a short on high >= it.
+        prob[longs] = np.searchsorted(np.sort(low), threshold[longs], side="right") / paths
+        prob[shorts] = 1.0 - np.searchsorted(np.sort(high), threshold[shorts], side="left") / paths
+        if len(longs):
+            hit = low <= threshold[longs].max()
+            hit_side["long"] |= hit
+            hit_any |= hit
+        if len(shorts):
+            hit = high >= threshold[shorts].min()
+            hit_side["short"] |= hit
+            hit_any |= hit
+
+    scored = ~np.isnan(prob)
+    portfolio = {
+        "any": float(hit_any.mean()) if paths else 0.0,
+        "long": float(hit_side["long"].mean()) if paths else 0.0,
+        "short": float(hit_side["short"].mean()) if paths else 0.0,
+        "expected_liquidations": float(prob[scored].sum()),
+        "expected_collateral_lost": float((prob[scored] * book.collateral[scored]).sum()),
+        "positions_scored": int(scored.sum()),
+    }
+    return prob, portfolio
+
+
+class LiquidationRisk:
+    """
+    Liquidation probabilities for one DataLocker's positions.
+      - run() fits the model, simulates and scores, caching the result per
+        (price snapshot, settings); repeated /heat loads between ticks
+        are dictionary lookups.
+      - Never raises for short price history; the result has
+        available=False and a reason instead.
+    """
+
+    def __init__(self, data_locker, settings: Optional[Dict[str, Any]] = None):
+        self.data_locker = data_locker
+        self.settings = dict(DEFAULT_RISK, **(settings or {}))
+        self._lock = threading.Lock()
+        self._cache: 'OrderedDict[tuple, dict]' = OrderedDict()
+
+    @classmethod
+    def from_config(cls, data_locker, config: Dict[str, Any]) -> 'LiquidationRisk':
+        """
+        Builds the engine from a loaded config dict (see load_config).
+        """
+        settings = config.get("system_config", {}).get("liquidation_risk", {})
+        return cls(data_locker, settings)
+
+    def run(self, **overrides) -> dict:
+        settings = dict(self.settings, **overrides)
+        if not settings["enabled"]:
+            return {"available": False, "reason": "disabled in system_config.liquidation_risk"}
+
+        key = (self.data_locker.snapshot_key(), tuple(sorted(settings.items())))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = self._compute(settings)
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > int(settings["cache_size"]):
+                self._cache.popitem(last=False)
+        return result
+
+    def fit(self, assets: List[str], settings: Optional[Dict[str, Any]] = None) -> Optional[ReturnModel]:
+        settings = settings or self.settings
+        start = datetime.now() - timedelta(days=float(settings["lookback_days"]))
+        closes = {
+            asset: [(r["bucket_start"], r["close"]) for r in
+                    self.data_locker.get_price_series(asset, settings["resolution"], start)]
+            for asset in assets
+        }
+        return ReturnModel.from_closes(closes, int(settings["min_returns"]))
+
+    def _compute(self, settings: Dict[str, Any]) -> dict:
+        resolution = settings["resolution"]
+        if resolution not in STEP_HOURS:
+            return {"available": False, "reason": f"unknown resolution '{resolution}'"}
+        book, prices = self.data_locker.read_priced_position_book()
+        model = self.fit(book.assets, settings)
+        if model is None:
+            return {
+                "available": False,
+                "reason": f"not enough {resolution} price history in the last {settings['lookback_days']} days",
+            }
+
+        steps = max(1, round(float(settings["horizon_hours"]) / STEP_HOURS[resolution]))
+        paths = int(settings["paths"])
+        workers = int(settings["workers"]) or os.cpu_count() or 1
+        if paths < int(settings["parallel_min_paths"]):
+            workers = 1
+        lows, highs = simulate(model.chol, steps, paths, int(settings["seed"]),
+                               int(settings["batch_paths"]), workers)
+        prob, portfolio = liquidation_probabilities(book, model, lows, highs)
+        logger.debug(
+            f"Simulated {paths} paths x {steps} steps for {model.assets}; "
+            f"P(any liquidation)={portfolio['any']:.4f}"
+        )
+        return {
+            "available": True,
+            "reason": None,
+            "horizon_hours": float(settings["horizon_hours"]),
+            "paths": paths,
+            "steps": steps,
+            "prices": prices,
+            "model": model.describe(STEP_HOURS[resolution]),
+            "positions": {pid: (None if math.isnan(p) else float(p)) for pid, p in zip(book.ids, prob)},
+            "portfolio": portfolio,
+        }
@@ -0,0 +1,343 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger("MigrationsLogger")
+
+# ----------------------------------------------------------------
+# Migration steps
+#
+# Each step gets the DataLocker being constructed (so it can reuse its
+# rebuild helpers) and runs inside one transaction together with its
+# schema_version row. Steps must be safe on databases that already have
+# their changes, since older files were patched in place before
+# schema_version existed.
+# ----------------------------------------------------------------
+
+
+def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: List[Tuple[str, str]]):
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, ddl in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+            logger.info(f"Added '{name}' column to '{table}' table.")
+
+
+def _baseline(locker):
+    """
+    The schema mother_brain.db shipped with.
+    """
+    conn = locker.conn
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS prices (
+            id TEXT PRIMARY KEY,
+            asset_type TEXT NOT NULL,
+            current_price REAL NOT NULL,
+            previous_price REAL NOT NULL DEFAULT 0.0,
+            last_update_time DATETIME NOT NULL,
+            previous_update_time DATETIME,
+            source TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS positions (
+            id TEXT PRIMARY KEY,
+            asset_type TEXT NOT NULL,
+            position_type TEXT NOT NULL,
+            entry_price REAL NOT NULL,
+            liquidation_price REAL NOT NULL,
+            current_travel_percent REAL NOT NULL DEFAULT 0.0,
+            value REAL NOT NULL DEFAULT 0.0,
+            collateral REAL NOT NULL,
+            size REAL NOT NULL,
+            wallet TEXT NOT NULL DEFAULT 'Default',
+            leverage REAL DEFAULT 0.0,
+            last_updated DATETIME NOT NULL,
+            alert_reference_id TEXT,
+            hedge_buddy_id TEXT,
+            current_price REAL,
+            liquidation_distance REAL,
+            heat_index REAL NOT NULL DEFAULT 0.0,
+            current_heat_index REAL NOT NULL DEFAULT 0.0,
+            wallet_name TEXT NOT NULL DEFAULT 'Default'
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS alerts (
+            id TEXT PRIMARY KEY,
+            alert_type TEXT NOT NULL,
+            asset_type TEXT NOT NULL DEFAULT 'BTC',
+            trigger_value REAL NOT NULL,
+            condition TEXT NOT NULL,
+            notification_type TEXT NOT NULL,
+            last_triggered DATETIME,
+            status TEXT NOT NULL,
+            frequency INTEGER NOT NULL,
+            counter INTEGER NOT NULL,
+            liquidation_distance REAL NOT NULL,
+            target_travel_percent REAL NOT NULL,
+            liquidation_price REAL NOT NULL,
+            notes TEXT,
+            position_reference_id TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS api_status_counters (
+            api_name TEXT PRIMARY KEY,
+            total_reports INTEGER NOT NULL DEFAULT 0,
+            last_updated DATETIME
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS wallets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            public_address TEXT,
+            private_address TEXT,
+            image_path TEXT,
+            balance REAL DEFAULT 0.0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS brokers (
+            name TEXT PRIMARY KEY,
+            image_path TEXT NOT NULL,
+            web_address TEXT NOT NULL,
+            total_holding REAL NOT NULL DEFAULT 0.0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS system_vars (
+            id INTEGER PRIMARY KEY,
+            last_update_time_positions DATETIME,
+            last_update_positions_source TEXT,
+            last_update_time_prices DATETIME,
+            last_update_prices_source TEXT
+        )
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO system_vars (
+            id,
+            last_update_time_positions,
+            last_update_positions_source,
+            last_update_time_prices,
+            last_update_prices_source
+        )
+        VALUES (1, NULL, NULL, NULL, NULL)
+    """)
+    _add_missing_columns(conn, "system_vars", [
+        ("total_brokerage_balance", "REAL DEFAULT 0.0"),
+        ("total_wallet_balance", "REAL DEFAULT 0.0"),
+        ("total_balance", "REAL DEFAULT 0.0"),
+    ])
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS config_overrides (
+            id INTEGER PRIMARY KEY,
+            overrides TEXT
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO config_overrides (id, overrides) VALUES (1, '{}')")
+
+
+def _latest_prices(locker):
+    """
+    idx_prices_asset_time + latest_prices, one row per asset kept in step
+    with every insert so "latest price" is a PK lookup.
+    """
+    conn = locker.conn
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_prices_asset_time
+            ON prices (asset_type, last_update_time)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS latest_prices (
+            asset_type TEXT PRIMARY KEY,
+            id TEXT NOT NULL,
+            current_price REAL NOT NULL,
+            previous_price REAL NOT NULL DEFAULT 0.0,
+            last_update_time DATETIME NOT NULL,
+            previous_update_time DATETIME,
+            source TEXT NOT NULL
+        )
+    """)
+    if not conn.execute("SELECT 1 FROM latest_prices LIMIT 1").fetchone():
+        locker._rebuild_latest_prices()
+
+
+POSITIONS_KEY_COLUMNS = "wallet_name, asset_type, position_type, size, collateral, last_updated"
+
+
+def _positions_natural_key(locker):
+    """
+    Unique (wallet, market, side, size, collateral, updatedTime) so
+    imports can upsert. Rows that already share that key are never
+    deleted: their ids are logged and the index is left out, in which
+    case DataLocker.upsert_positions falls back to the old duplicate
+    check. Remove the duplicates and run `python migrations.py
+    positions-key` to add it later.
+    """
+    conn = locker.conn
+    index_sql = conn.execute("""
+        SELECT sql FROM sqlite_master
+         WHERE type='index' AND name='idx_positions_natural_key'
+    """).fetchone()
+    if index_sql:
+        if "collateral" in index_sql[0]:
+            return
+        # Built by an earlier version on (wallet, market, side, updatedTime) only.
+        conn.execute("DROP INDEX idx_positions_natural_key")
+    conflicts = conn.execute(f"""
+        SELECT GROUP_CONCAT(id, ', ') FROM positions
+         GROUP BY {POSITIONS_KEY_COLUMNS}
+        HAVING COUNT(*) > 1
+    """).fetchall()
+    if conflicts:
+        logger.warning(
+            f"Not adding idx_positions_natural_key: {len(conflicts)} sets of positions share "
+            f"({POSITIONS_KEY_COLUMNS}): " + "; ".join(row[0] for row in conflicts)
+        )
+        return
+    conn.execute(f"""
+        CREATE UNIQUE INDEX idx_positions_natural_key
+            ON positions ({POSITIONS_KEY_COLUMNS})
+    """)
+
+
+def _price_rollups(locker):
+    """
+    OHLC per asset per 1m/1h/1d bucket, backfilled from existing ticks.
+    """
+    conn = locker.conn
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS price_rollups (
+            asset_type TEXT NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket_start DATETIME NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            count INTEGER NOT NULL,
+            first_time DATETIME NOT NULL,
+            last_time DATETIME NOT NULL,
+            PRIMARY KEY (asset_type, resolution, bucket_start)
+        ) WITHOUT ROWID
+    """)
+    if not conn.execute("SELECT 1 FROM price_rollups LIMIT 1").fetchone():
+        locker._rebuild_rollups()
+
+
+# (version, name, step) -- append only, never renumber.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "baseline schema", _baseline),
+    (2, "latest_prices and prices(asset_type, last_update_time) index", _latest_prices),
+    (3, "positions natural key", _positions_natural_key),
+    (4, "price_rollups", _price_rollups),
+    (5, "positions natural key with size and collateral", _positions_natural_key),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# ----------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------
+
+_migrated: Dict[str, int] = {}
+_migrated_lock = threading.Lock()
+
+
+def _schema_key(db_path: str) -> str:
+    return db_path if db_path == ":memory:" else os.path.abspath(db_path)
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME NOT NULL,
+            duration_ms REAL NOT NULL
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(locker) -> int:
+    """
+    Brings locker's database up to SCHEMA_VERSION, one transaction per
+    step. BEGIN IMMEDIATE makes concurrent processes take turns, and the
+    version is re-read under that lock so no step runs twice.
+    Returns the number of steps applied.
+    """
+    conn = locker.conn
+    applied = 0
+    for version, name, step in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            step(locker)
+            duration_ms = (time.perf_counter() - started) * 1000
+            conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at, duration_ms) VALUES (?, ?, ?, ?)",
+                (version, name, datetime.now().isoformat(), round(duration_ms, 3))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {version} ({name}) failed; rolled back.", exc_info=True)
+            raise
+        applied += 1
+        logger.info(f"Applied migration {version} ({name}) in {duration_ms:.1f} ms.")
+    return applied
+
+
+def ensure_schema(locker) -> bool:
+    """
+    Runs migrate() the first time a database is opened in this process;
+    afterwards it is a dict lookup. Returns True if this call migrated.
+    """
+    key = _schema_key(locker.db_path)
+    if key == ":memory:":
+        # Every pooled :memory: connection is its own empty database.
+        migrate(locker)
+        return True
+    if _migrated.get(key) == SCHEMA_VERSION:
+        return False
+    with _migrated_lock:
+        if _migrated.get(key) == SCHEMA_VERSION:
+            return False
+        migrate(locker)
+        _migrated[key] = SCHEMA_VERSION
+    return True
+
+
+def forget_schema(db_path: str):
+    """
+    Drops the cached "already migrated" flag, e.g. after the file was
+    replaced or restored from a backup.
+    """
+    with _migrated_lock:
+        _migrated.pop(_schema_key(db_path), None)
+
+
+if __name__ == "__main__":
+    import sys
+    from data_locker import DataLocker
+
+    logging.basicConfig(level=logging.INFO)
+    args = [a for a in sys.argv[1:] if a != "positions-key"]
+    locker = DataLocker(args[0] if args else "mother_brain.db")
+    if "positions-key" in sys.argv:
+        # Retry the positions natural key after removing duplicates by hand.
+        with locker.conn:
+            _positions_natural_key(locker)
+    print(f"Schema version {current_version(locker.conn)} (latest {SCHEMA_VERSION}).")
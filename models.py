@@ -1,5 +1,7 @@
+import sqlite3
 from enum import Enum
-from typing import Optional
+from operator import itemgetter
+from typing import Iterable, List, Optional
 from datetime import datetime
 from uuid import uuid4
 
@@ -33,12 +35,78 @@ class NotificationType(str, Enum):
     ACTION = "Action"
 
 
-class Price:
+# ----------------------------------------------------------------
+# Row decoding
+#
+# Every model has __slots__ (no per-instance __dict__) named after its
+# table's columns. from_rows() picks those columns out of each sqlite3.Row
+# by index (name lookups on a Row are slow) and _from_values() converts
+# each field once: REAL columns to float, DATETIME columns to datetime.
+# Validation runs once per object, in _validate().
+# ----------------------------------------------------------------
+
+def _float(value, default: float = 0.0) -> float:
+    return default if value is None else float(value)
+
+
+def _opt_float(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def _dt(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class _SlotsModel:
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Decodes one row (sqlite3.Row or dict) holding the model's columns.
+        """
+        return cls._from_values(tuple(row[name] for name in cls.__slots__))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> List:
+        """
+        Decodes a batch of rows that all share the first row's columns.
+        """
+        rows = rows if isinstance(rows, list) else list(rows)
+        if not rows:
+            return []
+        first = rows[0]
+        if isinstance(first, sqlite3.Row):
+            keys = first.keys()
+            pick = itemgetter(*[keys.index(name) for name in cls.__slots__])
+        else:
+            pick = itemgetter(*cls.__slots__)
+        from_values = cls._from_values
+        return [from_values(pick(row)) for row in rows]
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __getitem__(self, name: str):
+        # Lets templates and callers written for dict rows keep using row["field"].
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+
+class Price(_SlotsModel):
     """
     Represents pricing details for a given asset.
     Manually validates current_price > 0, previous_price >= 0, and
     ensures previous_update_time <= last_update_time if both set.
     """
+    __slots__ = (
+        "id", "asset_type", "current_price", "previous_price",
+        "last_update_time", "previous_update_time", "source",
+    )
+
     def __init__(
         self,
         id: Optional[str],
@@ -49,17 +117,9 @@ class Price:
         previous_update_time: Optional[datetime],
         source: SourceType
     ):
-        if current_price <= 0:
-            raise ValueError("current_price must be > 0")
-        if previous_price < 0:
-            raise ValueError("previous_price cannot be negative")
-
         if not last_update_time:
             last_update_time = datetime.utcnow()
 
-        if previous_update_time and previous_update_time > last_update_time:
-            raise ValueError("previous_update_time cannot be after last_update_time")
-
         self.id = id
         self.asset_type = asset_type
         self.current_price = current_price
@@ -67,6 +127,31 @@ class Price:
         self.last_update_time = last_update_time
         self.previous_update_time = previous_update_time
         self.source = source
+        self._validate()
+
+    def _validate(self):
+        if self.current_price <= 0:
+            raise ValueError("current_price must be > 0")
+        if self.previous_price < 0:
+            raise ValueError("previous_price cannot be negative")
+        if self.previous_update_time and self.previous_update_time > self.last_update_time:
+            raise ValueError("previous_update_time cannot be after last_update_time")
+
+    @classmethod
+    def _from_values(cls, values) -> 'Price':
+        # A prices / latest_prices row, in __slots__ order.
+        (id, asset_type, current_price, previous_price,
+         last_update_time, previous_update_time, source) = values
+        self = cls.__new__(cls)
+        self.id = id
+        self.asset_type = asset_type
+        self.current_price = float(current_price)
+        self.previous_price = _float(previous_price)
+        self.last_update_time = _dt(last_update_time)
+        self.previous_update_time = _dt(previous_update_time)
+        self.source = source
+        self._validate()
+        return self
 
     def __repr__(self):
         return (
@@ -77,10 +162,17 @@ class Price:
         )
 
 
-class Alert:
+class Alert(_SlotsModel):
     """
     Represents alert configuration for monitoring certain thresholds.
     """
+    __slots__ = (
+        "id", "alert_type", "trigger_value", "notification_type",
+        "last_triggered", "status", "frequency", "counter",
+        "liquidation_distance", "target_travel_percent", "liquidation_price",
+        "notes", "position_reference_id", "asset_type", "condition",
+    )
+
     def __init__(
         self,
         id: str,
@@ -95,7 +187,9 @@ class Alert:
         target_travel_percent: float,
         liquidation_price: float,
         notes: Optional[str],
-        position_reference_id: Optional[str]
+        position_reference_id: Optional[str],
+        asset_type: AssetType = AssetType.BTC,
+        condition: str = "ABOVE"
     ):
         self.id = id
         self.alert_type = alert_type
@@ -110,6 +204,32 @@ class Alert:
         self.liquidation_price = liquidation_price
         self.notes = notes
         self.position_reference_id = position_reference_id
+        self.asset_type = asset_type
+        self.condition = condition
+
+    @classmethod
+    def _from_values(cls, values) -> 'Alert':
+        # An alerts row, in __slots__ order.
+        (id, alert_type, trigger_value, notification_type, last_triggered,
+         status, frequency, counter, liquidation_distance, target_travel_percent,
+         liquidation_price, notes, position_reference_id, asset_type, condition) = values
+        self = cls.__new__(cls)
+        self.id = id
+        self.alert_type = alert_type
+        self.trigger_value = float(trigger_value)
+        self.notification_type = notification_type
+        self.last_triggered = _dt(last_triggered)
+        self.status = status
+        self.frequency = int(frequency)
+        self.counter = int(counter)
+        self.liquidation_distance = float(liquidation_distance)
+        self.target_travel_percent = float(target_travel_percent)
+        self.liquidation_price = float(liquidation_price)
+        self.notes = notes
+        self.position_reference_id = position_reference_id
+        self.asset_type = asset_type
+        self.condition = condition
+        return self
 
     def __repr__(self):
         return (
@@ -118,14 +238,23 @@ class Alert:
             f"status={self.status!r}, frequency={self.frequency}, counter={self.counter}, "
             f"liquidation_distance={self.liquidation_distance}, target_travel_percent={self.target_travel_percent}, "
             f"liquidation_price={self.liquidation_price}, notes={self.notes!r}, "
-            f"position_reference_id={self.position_reference_id!r})"
+            f"position_reference_id={self.position_reference_id!r}, asset_type={self.asset_type!r}, "
+            f"condition={self.condition!r})"
         )
 
 
-class Position:
+class Position(_SlotsModel):
     """
     Represents a trading position, with manual validation for current_travel_percent.
     """
+    __slots__ = (
+        "id", "asset_type", "position_type", "entry_price", "liquidation_price",
+        "current_travel_percent", "value", "collateral", "size", "leverage",
+        "wallet", "last_updated", "alert_reference_id", "hedge_buddy_id",
+        "current_price", "liquidation_distance", "heat_index",
+        "current_heat_index", "wallet_name",
+    )
+
     def __init__(
         self,
         id: Optional[str] = None,
@@ -145,7 +274,8 @@ class Position:
         current_price: Optional[float] = 0.0,
         liquidation_distance: Optional[float] = None,
         heat_index: float = 0.0,
-        current_heat_index: float = 0.0
+        current_heat_index: float = 0.0,
+        wallet_name: str = "Default"
     ):
         # Autogenerate an 'id' if not provided
         if id is None:
@@ -154,10 +284,6 @@ class Position:
         if last_updated is None:
             last_updated = datetime.now()
 
-        # Validate current_travel_percent
-        if not -11500.0 <= current_travel_percent <= 1000.0:
-            raise ValueError("current_travel_percent must be between -11500 and 1000")
-
         self.id = id
         self.asset_type = asset_type
         self.position_type = position_type
@@ -176,6 +302,43 @@ class Position:
         self.liquidation_distance = liquidation_distance
         self.heat_index = heat_index
         self.current_heat_index = current_heat_index
+        self.wallet_name = wallet_name
+        self._validate()
+
+    def _validate(self):
+        if not -11500.0 <= self.current_travel_percent <= 1000.0:
+            raise ValueError("current_travel_percent must be between -11500 and 1000")
+
+    @classmethod
+    def _from_values(cls, values) -> 'Position':
+        # A positions row, in __slots__ order.
+        (id, asset_type, position_type, entry_price, liquidation_price,
+         current_travel_percent, value, collateral, size, leverage,
+         wallet, last_updated, alert_reference_id, hedge_buddy_id,
+         current_price, liquidation_distance, heat_index,
+         current_heat_index, wallet_name) = values
+        self = cls.__new__(cls)
+        self.id = id
+        self.asset_type = asset_type
+        self.position_type = position_type
+        self.entry_price = float(entry_price)
+        self.liquidation_price = float(liquidation_price)
+        self.current_travel_percent = _float(current_travel_percent)
+        self.value = _float(value)
+        self.collateral = float(collateral)
+        self.size = float(size)
+        self.leverage = _float(leverage)
+        self.wallet = wallet
+        self.last_updated = _dt(last_updated)
+        self.alert_reference_id = alert_reference_id
+        self.hedge_buddy_id = hedge_buddy_id
+        self.current_price = _opt_float(current_price)
+        self.liquidation_distance = _opt_float(liquidation_distance)
+        self.heat_index = _float(heat_index)
+        self.current_heat_index = _float(current_heat_index)
+        self.wallet_name = wallet_name
+        self._validate()
+        return self
 
     def __repr__(self):
         return (
@@ -186,11 +349,11 @@ class Position:
             f"last_updated={self.last_updated}, alert_reference_id={self.alert_reference_id!r}, "
             f"hedge_buddy_id={self.hedge_buddy_id!r}, current_price={self.current_price}, "
             f"liquidation_distance={self.liquidation_distance}, heat_index={self.heat_index}, "
-            f"current_heat_index={self.current_heat_index})"
+            f"current_heat_index={self.current_heat_index}, wallet_name={self.wallet_name!r})"
         )
 
 
-class CryptoWallet:
+class CryptoWallet(_SlotsModel):
     """
     Represents a crypto wallet with:
       - name:           e.g., "VaderVault"
@@ -199,6 +362,8 @@ class CryptoWallet:
       - image_path:     path or URL to an identifying image
       - balance:        total balance in USD (or any currency you like)
     """
+    __slots__ = ("name", "public_address", "private_address", "image_path", "balance")
+
     def __init__(
             self,
             name: str,
@@ -213,6 +378,18 @@ class CryptoWallet:
         self.image_path = image_path
         self.balance = balance
 
+    @classmethod
+    def _from_values(cls, values) -> 'CryptoWallet':
+        # A wallets row, in __slots__ order.
+        name, public_address, private_address, image_path, balance = values
+        self = cls.__new__(cls)
+        self.name = name
+        self.public_address = public_address
+        self.private_address = private_address
+        self.image_path = image_path or ""
+        self.balance = _float(balance)
+        return self
+
     def __repr__(self):
         return (
             f"CryptoWallet(name={self.name!r}, "
@@ -223,10 +400,12 @@ class CryptoWallet:
         )
 
 
-class Broker:
+class Broker(_SlotsModel):
     """
     Represents a broker (e.g., an exchange or trading platform).
     """
+    __slots__ = ("name", "image_path", "web_address", "total_holding")
+
     def __init__(
         self,
         name: str,
@@ -239,6 +418,17 @@ class Broker:
         self.web_address = web_address
         self.total_holding = total_holding
 
+    @classmethod
+    def _from_values(cls, values) -> 'Broker':
+        # A brokers row, in __slots__ order.
+        name, image_path, web_address, total_holding = values
+        self = cls.__new__(cls)
+        self.name = name
+        self.image_path = image_path
+        self.web_address = web_address
+        self.total_holding = _float(total_holding)
+        return self
+
     def __repr__(self):
         return (
             f"Broker(name={self.name!r}, "
@@ -0,0 +1,318 @@
+"""
+Portfolio totals kept up to date incrementally.
+
+CalcServices.calculate_totals rescans every position on each request.
+PortfolioAggregator instead keeps running sums per (asset, side, wallet)
+group:
+
+    add / remove / update of one position    O(1)
+    a new price for one asset                O(positions on that asset)
+    totals(...) / breakdown(...)             O(groups)
+
+Positions are valued the way the positions page values them
+(aggregate_positions: TRAVEL_NO_PROFIT, side_of_strict), at their own
+current_price when it is set and at the asset's latest price otherwise.
+
+DataLocker owns one aggregator per database (data_locker.portfolio),
+loads it lazily on first read and feeds it from its commit hooks:
+
+    totals = data_locker.read_portfolio().totals()
+    by_wallet = data_locker.read_portfolio().breakdown("wallet")
+"""
+import math
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from calc_services import CalcServices
+from position_book import BOOK_COLUMNS, LONG, side_of_strict
+from valuation import TRAVEL_NO_PROFIT
+
+logger = logging.getLogger("PortfolioAggregatorLogger")
+
+# The keys calculate_totals returns, which totals() returns too.
+TOTAL_FIELDS = (
+    "total_size", "total_value", "total_collateral",
+    "avg_leverage", "avg_travel_percent", "avg_heat_index",
+)
+GROUP_BY = ("asset", "side", "wallet")
+
+# One position's contribution to its group's running sums, in this order.
+_SUMS = ("size", "value", "collateral", "leverage_x_size", "travel_x_size", "heat", "heat_count")
+_ZERO = (0.0,) * len(_SUMS)
+
+GroupKey = Tuple[str, str, Optional[str]]
+
+
+def _totals_from_sums(sums) -> dict:
+    size, value, collateral, leverage_x_size, travel_x_size, heat, heat_count = sums
+    return {
+        "total_size": size,
+        "total_value": value,
+        "total_collateral": collateral,
+        "avg_leverage": leverage_x_size / size if size > 0 else 0.0,
+        "avg_travel_percent": travel_x_size / size if size > 0 else 0.0,
+        "avg_heat_index": heat / heat_count if heat_count > 0 else 0.0,
+    }
+
+
+class PortfolioAggregator:
+    """
+    Running portfolio sums.
+      - Until load() runs the aggregator is unloaded: add/remove/update
+        only bump a version, so a load() that raced with them can tell
+        and stays unloaded (the next read reloads).
+      - invalidate() drops everything for changes it can't apply one
+        position at a time (bulk upserts, raw deletes).
+      - A group's sums are re-added from scratch whenever its asset is
+        repriced, so add/remove rounding drift never builds up.
+    Thread-safe; DataLocker's hooks call it from the write-behind thread.
+    """
+
+    def __init__(self):
+        self._calc = CalcServices()
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
+        self._inputs: Dict[str, dict] = {}           # id -> BOOK_COLUMNS dict
+        self._keys: Dict[str, GroupKey] = {}          # id -> group
+        self._contrib: Dict[str, tuple] = {}          # id -> _SUMS values
+        self._groups: Dict[GroupKey, List[float]] = {}
+        self._members: Dict[GroupKey, set] = {}
+        self._by_asset: Dict[str, set] = {}           # asset -> its groups
+        self._prices: Dict[str, float] = {}
+        self._stamps: Dict[str, str] = {}
+
+    # ----------------------------------------------------------------
+    # Loading
+    # ----------------------------------------------------------------
+
+    def load(self, positions: Iterable[dict], prices: Iterable[dict] = (), since: Optional[int] = None):
+        """
+        Rebuilds from position dicts (at least BOOK_COLUMNS) and latest
+        price rows. `since` is the version read before the positions were
+        read; if anything changed in between, the aggregator stays
+        unloaded.
+        """
+        positions = [self._input_of(p) for p in positions]
+        with self._lock:
+            self._reset()
+            self._apply_ticks(prices)
+            contribs = self._contributions(positions)
+            for pos, contrib in zip(positions, contribs):
+                self._insert(pos, contrib)
+            self.loaded = since is None or since == self.version
+        logger.debug(f"Loaded {len(positions)} positions into {len(self._groups)} groups.")
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self.loaded = False
+            self._reset()
+
+    # ----------------------------------------------------------------
+    # Positions
+    # ----------------------------------------------------------------
+
+    def add(self, position: dict):
+        """
+        Adds a position, or replaces the one with the same id.
+        """
+        pos = self._input_of(position)
+        with self._lock:
+            self.version += 1
+            if not self.loaded:
+                return
+            if pos["id"] in self._inputs:
+                self._discard(pos["id"])
+            self._insert(pos, self._contributions([pos])[0])
+
+    def remove(self, position_id: str):
+        with self._lock:
+            self.version += 1
+            if self.loaded and position_id in self._inputs:
+                self._discard(position_id)
+
+    def update(self, position_id: str, **fields):
+        """
+        Changes some of a position's columns, e.g. update(pid, size=...).
+        """
+        with self._lock:
+            self.version += 1
+            if not self.loaded or position_id not in self._inputs:
+                return
+            pos = dict(self._inputs[position_id], **fields)
+            self._discard(position_id)
+            self._insert(pos, self._contributions([pos])[0])
+
+    def remove_wallet(self, wallet_name: str):
+        with self._lock:
+            self.version += 1
+            if not self.loaded:
+                return
+            doomed = [pid for pid, key in self._keys.items() if key[2] == wallet_name]
+            for pid in doomed:
+                self._discard(pid)
+
+    def clear(self):
+        """
+        Every position is gone; prices are kept.
+        """
+        with self._lock:
+            self.version += 1
+            prices, stamps = self._prices, self._stamps
+            self._reset()
+            self._prices, self._stamps = prices, stamps
+
+    # ----------------------------------------------------------------
+    # Prices
+    # ----------------------------------------------------------------
+
+    def apply_ticks(self, rows: Iterable[dict]) -> int:
+        """
+        Takes price rows (asset_type, current_price, last_update_time);
+        an older tick never replaces a newer one. Every asset whose price
+        changed has its positions revalued. Returns how many positions
+        were revalued.
+        """
+        with self._lock:
+            changed = self._apply_ticks(rows)
+            if not self.loaded:
+                return 0
+            return sum(self._reprice(asset) for asset in changed)
+
+    def _apply_ticks(self, rows: Iterable[dict]) -> List[str]:
+        changed = []
+        for row in rows:
+            asset = (row["asset_type"] or "").upper()
+            stamp = str(row.get("last_update_time") or "")
+            if asset in self._stamps and stamp < self._stamps[asset]:
+                continue
+            self._stamps[asset] = stamp
+            price = float(row["current_price"] or 0.0)
+            if self._prices.get(asset) != price:
+                self._prices[asset] = price
+                changed.append(asset)
+        return changed
+
+    def _reprice(self, asset: str) -> int:
+        groups = self._by_asset.get(asset, ())
+        ids = [pid for key in groups for pid in self._members[key]
+               if not (self._inputs[pid]["current_price"] or 0.0) > 0]
+        for pid, contrib in zip(ids, self._contributions([self._inputs[pid] for pid in ids])):
+            self._contrib[pid] = contrib
+        for key in groups:
+            self._groups[key] = self._sum(self._contrib[pid] for pid in self._members[key])
+        return len(ids)
+
+    # ----------------------------------------------------------------
+    # Reading
+    # ----------------------------------------------------------------
+
+    @property
+    def assets(self) -> List[str]:
+        with self._lock:
+            return sorted(self._by_asset)
+
+    def __len__(self):
+        return len(self._inputs)
+
+    def totals(
+            self,
+            asset_type: Optional[str] = None,
+            side: Optional[str] = None,
+            wallet_name: Optional[str] = None
+    ) -> dict:
+        """
+        calculate_totals' dict over every position, or only those matching
+        the given asset / side ("LONG" / "SHORT") / wallet.
+        """
+        wanted = (asset_type.upper() if asset_type else None, side.upper() if side else None, wallet_name)
+        with self._lock:
+            sums = [s for key, s in self._groups.items()
+                    if all(w is None or w == k for w, k in zip(wanted, key))]
+        return _totals_from_sums(self._sum(sums))
+
+    def breakdown(self, by: str = "asset") -> Dict[Optional[str], dict]:
+        """
+        {asset | side | wallet: totals} for one of GROUP_BY.
+        """
+        if by not in GROUP_BY:
+            raise ValueError(f"breakdown by '{by}', expected one of {GROUP_BY}")
+        column = GROUP_BY.index(by)
+        buckets: Dict[Optional[str], list] = {}
+        with self._lock:
+            for key, sums in self._groups.items():
+                buckets.setdefault(key[column], []).append(sums)
+        return {name: _totals_from_sums(self._sum(sums)) for name, sums in buckets.items()}
+
+    # ----------------------------------------------------------------
+    # Internals (callers hold _lock)
+    # ----------------------------------------------------------------
+
+    @staticmethod
+    def _input_of(position: dict) -> dict:
+        pos = {c: position.get(c) for c in BOOK_COLUMNS}
+        pos["asset_type"] = (pos["asset_type"] or "").upper()
+        return pos
+
+    @staticmethod
+    def _sum(rows: Iterable[tuple]) -> List[float]:
+        return [math.fsum(column) for column in zip(*rows)] or list(_ZERO)
+
+    def _key_of(self, pos: dict) -> GroupKey:
+        side = "LONG" if side_of_strict(pos["position_type"]) == LONG else "SHORT"
+        return pos["asset_type"], side, pos["wallet_name"]
+
+    def _contributions(self, positions: List[dict]) -> List[tuple]:
+        """
+        _SUMS for each position, valued at its own price or its asset's.
+        """
+        priced = [
+            p if (p["current_price"] or 0.0) > 0 else dict(p, current_price=self._prices.get(p["asset_type"], 0.0))
+            for p in positions
+        ]
+        columns = self._calc.value_positions(priced, TRAVEL_NO_PROFIT, side_of_strict)
+        valued = zip(columns["value"], columns["leverage"], columns["travel_percent"], columns["heat_index"])
+
+        out = []
+        for pos, (value, leverage, travel, heat) in zip(priced, valued):
+            size = float(pos["size"] or 0.0)
+            out.append((
+                size, value, float(pos["collateral"] or 0.0),
+                leverage * size, travel * size, heat, 1.0 if heat != 0.0 else 0.0,
+            ))
+        return out
+
+    def _insert(self, pos: dict, contrib: tuple):
+        pid, key = pos["id"], self._key_of(pos)
+        self._inputs[pid] = pos
+        self._keys[pid] = key
+        self._contrib[pid] = contrib
+        sums = self._groups.get(key)
+        if sums is None:
+            sums = self._groups[key] = list(_ZERO)
+            self._members[key] = set()
+            self._by_asset.setdefault(key[0], set()).add(key)
+        self._members[key].add(pid)
+        for i, v in enumerate(contrib):
+            sums[i] += v
+
+    def _discard(self, pid: str):
+        key = self._keys.pop(pid)
+        contrib = self._contrib.pop(pid)
+        del self._inputs[pid]
+        members = self._members[key]
+        members.discard(pid)
+        if not members:
+            del self._groups[key], self._members[key]
+            self._by_asset[key[0]].discard(key)
+            if not self._by_asset[key[0]]:
+                del self._by_asset[key[0]]
+            return
+        sums = self._groups[key]
+        for i, v in enumerate(contrib):
+            sums[i] -= v
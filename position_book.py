@@ -0,0 +1,179 @@
+"""
+Positions as parallel NumPy columns, for whole-portfolio math.
+
+A PositionBook holds one row per position:
+
+    entry_price, liquidation_price, size, collateral, current_price
+        float64 columns
+    side    int8, +1 long / -1 short ("short" anywhere in position_type,
+            like prepare_positions_for_display)
+    asset   int16 code into book.assets (e.g. 0 -> "BTC")
+
+plus ids / wallets lists and an id -> row index. Membership is fixed once
+built (rebuild after positions are added or removed); prices are updated
+in place per asset through precomputed row indexes, so repricing 100k
+positions is a couple of fancy-index assignments.
+
+    book = data_locker.read_position_book()
+    book.set_prices({"BTC": 97000.0, "ETH": 3100.0})
+"""
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+LONG = 1
+SHORT = -1
+
+# positions columns the book is built from, in this order.
+BOOK_COLUMNS = (
+    "id", "wallet_name", "asset_type", "position_type",
+    "entry_price", "liquidation_price", "size", "collateral", "current_price",
+)
+PRICE_COLUMNS = ("entry_price", "liquidation_price", "size", "collateral", "current_price")
+
+
+def side_of(position_type: Optional[str]) -> int:
+    return SHORT if "short" in (position_type or "").lower() else LONG
+
+
+def side_of_strict(position_type: Optional[str]) -> int:
+    """
+    aggregate_positions' rule: only "LONG" (or no type) is long.
+    """
+    return LONG if (position_type or "LONG").upper() == "LONG" else SHORT
+
+
+class PositionBook:
+    """
+    Column store of positions.
+      - book.index_of(id) / book.rows_for(asset) give row indexes into
+        every column; book.position(id) returns one position as a dict.
+      - set_price / set_prices write current_price for every position on
+        an asset in place.
+    """
+
+    def __init__(
+            self,
+            ids: List[str],
+            wallets: List[str],
+            assets: List[str],
+            asset: 'np.ndarray',
+            side: 'np.ndarray',
+            entry_price: 'np.ndarray',
+            liquidation_price: 'np.ndarray',
+            size: 'np.ndarray',
+            collateral: 'np.ndarray',
+            current_price: 'np.ndarray'
+    ):
+        self.ids = ids
+        self.wallets = wallets
+        self.assets = assets
+        self.asset = asset
+        self.side = side
+        self.entry_price = entry_price
+        self.liquidation_price = liquidation_price
+        self.size = size
+        self.collateral = collateral
+        self.current_price = current_price
+        self._index: Dict[str, int] = {pid: i for i, pid in enumerate(ids)}
+        # asset code -> row indexes, sorted; built once since membership is fixed.
+        order = np.argsort(asset, kind="stable")
+        bounds = np.searchsorted(asset[order], np.arange(len(assets) + 1))
+        self._asset_rows = [order[bounds[c]:bounds[c + 1]] for c in range(len(assets))]
+        self._asset_codes = {name: code for code, name in enumerate(assets)}
+
+    # ----------------------------------------------------------------
+    # Building
+    # ----------------------------------------------------------------
+
+    @classmethod
+    def from_rows(cls, rows: Iterable, side_rule: Callable[[Optional[str]], int] = side_of) -> 'PositionBook':
+        """
+        Builds a book from rows with BOOK_COLUMNS in order (tuples or
+        sqlite3.Row from a SELECT of exactly those columns). side_rule maps
+        position_type to LONG / SHORT.
+        """
+        rows = rows if isinstance(rows, list) else list(rows)
+        n = len(rows)
+        if n:
+            ids, wallets, asset_names, ptypes, *values = (list(c) for c in zip(*rows))
+            # None (e.g. no current_price yet) becomes NaN here, then 0.0.
+            numbers = np.array(values, dtype=np.float64)
+            numbers[np.isnan(numbers)] = 0.0
+        else:
+            ids, wallets, asset_names, ptypes = [], [], [], []
+            numbers = np.empty((len(PRICE_COLUMNS), 0), dtype=np.float64)
+
+        asset_names = [(a or "").upper() for a in asset_names]
+        assets = sorted(set(asset_names))
+        codes = {name: code for code, name in enumerate(assets)}
+        asset = np.fromiter((codes[a] for a in asset_names), dtype=np.int16, count=n)
+        side = np.fromiter((side_rule(p) for p in ptypes), dtype=np.int8, count=n)
+        columns = dict(zip(PRICE_COLUMNS, numbers))
+        return cls(ids, wallets, assets, asset, side, **columns)
+
+    @classmethod
+    def from_positions(
+            cls,
+            positions: Iterable[dict],
+            side_rule: Callable[[Optional[str]], int] = side_of
+    ) -> 'PositionBook':
+        """
+        Builds a book from position dicts (as returned by read_positions).
+        """
+        return cls.from_rows([tuple(p.get(c) for c in BOOK_COLUMNS) for p in positions], side_rule)
+
+    # ----------------------------------------------------------------
+    # Lookups
+    # ----------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, position_id: str):
+        return position_id in self._index
+
+    def index_of(self, position_id: str) -> int:
+        return self._index[position_id]
+
+    def rows_for(self, asset_type: str) -> 'np.ndarray':
+        """
+        Row indexes of every position on asset_type (empty if none).
+        """
+        code = self._asset_codes.get(asset_type.upper())
+        if code is None:
+            return np.empty(0, dtype=np.intp)
+        return self._asset_rows[code]
+
+    def position(self, position_id: str) -> dict:
+        i = self._index[position_id]
+        return {
+            "id": position_id,
+            "wallet_name": self.wallets[i],
+            "asset_type": self.assets[self.asset[i]],
+            "position_type": "SHORT" if self.side[i] == SHORT else "LONG",
+            **{name: float(getattr(self, name)[i]) for name in PRICE_COLUMNS},
+        }
+
+    # ----------------------------------------------------------------
+    # Prices
+    # ----------------------------------------------------------------
+
+    def set_price(self, asset_type: str, price: float) -> int:
+        """
+        Sets current_price for every position on asset_type. Returns how
+        many positions were repriced.
+        """
+        rows = self.rows_for(asset_type)
+        self.current_price[rows] = price
+        return len(rows)
+
+    def set_prices(self, prices: Dict[str, float]) -> int:
+        return sum(self.set_price(asset, price) for asset, price in prices.items())
+
+    def apply_latest_prices(self, data_locker) -> int:
+        """
+        Reprices every asset in the book from the locker's latest prices.
+        """
+        latest = data_locker.get_latest_prices(self.assets)
+        return self.set_prices({a: float(row["current_price"]) for a, row in latest.items()})
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Append-only columnar archive of price ticks, one pair of flat binary
+files per asset:
+
+    <archive_dir>/<ASSET>.ts.i8   int64 microseconds since 1970-01-01 (naive
+                                  local time, same clock as last_update_time)
+    <archive_dir>/<ASSET>.px.f8   float64 prices
+
+Both files are read through numpy.memmap, so read_range() returns views
+straight onto the page cache: no per-row Python objects, and the
+timestamp view can be reinterpreted as datetime64[us] for free.
+
+DataLocker mirrors the prices table into the archive after every price
+insert (see DataLocker(archive_dir=...)). The mirror only ever appends
+ticks newer than the asset's last archived one; older ticks (e.g. a
+historical backfill) need a rebuild:
+
+    python price_archive.py [db_path] [archive_dir] [--rebuild]
+"""
+import os
+import sys
+import logging
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("PriceArchiveLogger")
+
+TS_DTYPE = "<i8"
+PX_DTYPE = "<f8"
+SYNC_CHUNK = 100_000
+
+
+def to_micros(timestamps) -> 'np.ndarray':
+    """
+    ISO strings / datetimes -> int64 microseconds (naive, no tz shift).
+    """
+    return np.asarray(timestamps, dtype="datetime64[us]").astype(TS_DTYPE)
+
+
+def to_iso(micros: int) -> str:
+    return str(np.datetime_as_string(np.datetime64(int(micros), "us"), unit="us"))
+
+
+class PriceArchive:
+    """
+    Per-asset (timestamp, price) column files under one directory.
+      - append() writes prices first, then timestamps; the row count is
+        the shorter of the two, so a torn append is simply not visible.
+      - read_range() maps the files read-only and slices them with
+        searchsorted on the (sorted) timestamp column.
+    """
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        os.makedirs(archive_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._maps: Dict[str, Tuple[int, 'np.memmap', 'np.memmap']] = {}
+
+    # ----------------------------------------------------------------
+    # Files
+    # ----------------------------------------------------------------
+
+    def _paths(self, asset: str) -> Tuple[str, str]:
+        base = os.path.join(self.archive_dir, asset.upper())
+        return base + ".ts.i8", base + ".px.f8"
+
+    def _count(self, asset: str) -> int:
+        ts_path, px_path = self._paths(asset)
+        if not os.path.exists(ts_path) or not os.path.exists(px_path):
+            return 0
+        return min(os.path.getsize(ts_path) // 8, os.path.getsize(px_path) // 8)
+
+    def assets(self):
+        return sorted(
+            name[:-len(".ts.i8")] for name in os.listdir(self.archive_dir)
+            if name.endswith(".ts.i8")
+        )
+
+    def __len__(self):
+        return sum(self._count(a) for a in self.assets())
+
+    def count(self, asset: str) -> int:
+        return self._count(asset)
+
+    def last_time(self, asset: str) -> Optional[int]:
+        n = self._count(asset)
+        if not n:
+            return None
+        ts, _ = self._columns(asset)
+        return int(ts[n - 1])
+
+    def _columns(self, asset: str) -> Tuple['np.ndarray', 'np.ndarray']:
+        """
+        Memory maps for the asset's columns, re-mapped when the files grew.
+        """
+        asset = asset.upper()
+        n = self._count(asset)
+        cached = self._maps.get(asset)
+        if cached and cached[0] == n:
+            return cached[1], cached[2]
+        if n == 0:
+            return np.empty(0, TS_DTYPE), np.empty(0, PX_DTYPE)
+        ts_path, px_path = self._paths(asset)
+        ts = np.memmap(ts_path, dtype=TS_DTYPE, mode="r", shape=(n,))
+        px = np.memmap(px_path, dtype=PX_DTYPE, mode="r", shape=(n,))
+        self._maps[asset] = (n, ts, px)
+        return ts, px
+
+    def _truncate(self, asset: str, n: int):
+        for path in self._paths(asset):
+            if os.path.exists(path) and os.path.getsize(path) != n * 8:
+                # Drop our own maps first; a mapped file can't be shrunk on Windows.
+                self._maps.pop(asset.upper(), None)
+                with open(path, "r+b") as f:
+                    f.truncate(n * 8)
+
+    # ----------------------------------------------------------------
+    # Writes
+    # ----------------------------------------------------------------
+
+    def append(self, asset: str, timestamps, prices) -> int:
+        """
+        Appends ticks for one asset. timestamps are int64 microseconds (or
+        anything to_micros accepts) and must be sorted and not older than
+        the last archived tick. Returns rows appended.
+        """
+        ts = np.asarray(timestamps)
+        if ts.dtype.kind != "i":
+            ts = to_micros(ts)
+        ts = ts.astype(TS_DTYPE, copy=False)
+        px = np.asarray(prices, dtype=PX_DTYPE)
+        if len(ts) != len(px):
+            raise ValueError("timestamps and prices must be the same length")
+        if not len(ts):
+            return 0
+        if np.any(np.diff(ts) < 0):
+            raise ValueError("timestamps must be sorted")
+
+        with self._lock:
+            n = self._count(asset)
+            last = self.last_time(asset)
+            if last is not None and ts[0] < last:
+                raise ValueError(
+                    f"{asset} tick at {to_iso(ts[0])} is older than the archive end {to_iso(last)}; "
+                    f"rebuild the archive instead"
+                )
+            # Trim any torn tail from an interrupted append before adding more.
+            self._truncate(asset, n)
+            ts_path, px_path = self._paths(asset)
+            with open(px_path, "ab") as f:
+                f.write(px.tobytes())
+            with open(ts_path, "ab") as f:
+                f.write(ts.tobytes())
+        return len(ts)
+
+    def sync(self, conn: sqlite3.Connection, assets: Optional[Iterable[str]] = None) -> int:
+        """
+        Appends every tick in the prices table newer than each asset's last
+        archived tick (all assets in latest_prices if none given). Reads go
+        through idx_prices_asset_time in SYNC_CHUNK-row batches.
+        Returns rows appended.
+        """
+        if assets is None:
+            assets = [r[0] for r in conn.execute("SELECT asset_type FROM latest_prices")]
+        appended = 0
+        for asset in set(assets):
+            last = self.last_time(asset)
+            after = to_iso(last) if last is not None else ""
+            cur = conn.execute("""
+                SELECT last_update_time, current_price
+                  FROM prices
+                 WHERE asset_type = ? AND last_update_time > ?
+                 ORDER BY last_update_time
+            """, (asset, after))
+            while True:
+                rows = cur.fetchmany(SYNC_CHUNK)
+                if not rows:
+                    break
+                times, prices = zip(*rows)
+                appended += self.append(asset, to_micros(times), prices)
+        return appended
+
+    def rebuild(self, conn: sqlite3.Connection, assets: Optional[Iterable[str]] = None) -> int:
+        """
+        Throws away the archive for the given assets (default: all) and
+        re-mirrors them from the prices table. Ticks already pruned by
+        price retention can't come back, so only rebuild when needed.
+        """
+        if assets is None:
+            assets = [r[0] for r in conn.execute("SELECT asset_type FROM latest_prices")]
+            assets = set(assets) | set(self.assets())
+        for asset in assets:
+            with self._lock:
+                self._truncate(asset, 0)
+        return self.sync(conn, assets)
+
+    # ----------------------------------------------------------------
+    # Reads
+    # ----------------------------------------------------------------
+
+    def read_range(
+            self,
+            asset: str,
+            start=None,
+            end=None
+    ) -> Tuple['np.ndarray', 'np.ndarray']:
+        """
+        Returns (timestamps, prices) for start <= t < end as read-only views
+        onto the archive files. start/end accept int64 microseconds, ISO
+        strings or datetimes. Use ts.view("datetime64[us]") for dates.
+        """
+        ts, px = self._columns(asset)
+        lo = 0 if start is None else int(np.searchsorted(ts, self._micros(start), side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, self._micros(end), side="left"))
+        return ts[lo:hi], px[lo:hi]
+
+    @staticmethod
+    def _micros(value) -> int:
+        if isinstance(value, (int, np.integer)):
+            return int(value)
+        return int(to_micros([value])[0])
+
+
+_archives: Dict[str, PriceArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(archive_dir: str) -> PriceArchive:
+    """
+    Returns the process-wide archive for archive_dir, so every DataLocker
+    mirroring into it shares one append lock.
+    """
+    key = os.path.abspath(archive_dir)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None:
+            archive = PriceArchive(key)
+            _archives[key] = archive
+        return archive
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    db_path = args[0] if args else "mother_brain.db"
+    archive_dir = args[1] if len(args) > 1 else "price_archive"
+
+    conn = sqlite3.connect(db_path)
+    archive = get_archive(archive_dir)
+    if "--rebuild" in sys.argv:
+        written = archive.rebuild(conn)
+    else:
+        written = archive.sync(conn)
+    print(f"Archived {written} ticks into {archive_dir} ({len(archive)} total).")
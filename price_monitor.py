@@ -1,9 +1,11 @@
 import asyncio
 import logging
+from datetime import datetime
 from typing import Dict, Optional, List
 
 from config_manager import load_config
 from data_locker import DataLocker
+from async_data_locker import AsyncDataLocker
 from coingecko_fetcher import fetch_current_coingecko
 from coinmarketcap_fetcher import fetch_current_cmc, fetch_historical_cmc
 from coinpaprika_fetcher import fetch_current_coinpaprika
@@ -20,9 +22,12 @@ class PriceMonitor:
         self.db_path = db_path
         self.config_path = config_path
 
-        # 1) Setup data locker & DB
-        self.data_locker = DataLocker(self.db_path)
+        # 1) Setup data locker & DB (shared; also starts write-behind and
+        #    the price archive mirror if the config turns them on)
+        self.data_locker = DataLocker.startup(self.db_path, self.config_path)
         self.db_conn = self.data_locker.get_db_connection()
+        # Coroutines go through this so DB work never blocks the event loop
+        self.async_locker = AsyncDataLocker(self.data_locker)
 
         # 2) Load final config as a pure dict
         self.config = load_config(self.config_path, self.db_conn)
@@ -32,7 +37,7 @@ class PriceMonitor:
         self.coinpaprika_enabled = (api_cfg.get("coinpaprika_api_enabled") == "ENABLE")
         self.binance_enabled = (api_cfg.get("binance_api_enabled") == "ENABLE")
 
-        # 4) Parse relevant fields from config
+        # 3) Parse relevant fields from config
         price_cfg = self.config.get("price_config", {})
         self.assets = price_cfg.get("assets", ["BTC", "ETH"])
         self.currency = price_cfg.get("currency", "USD")
@@ -76,13 +81,23 @@ class PriceMonitor:
             for sym, price_val in result_dict.items():
                 aggregated.setdefault(sym, []).append(price_val)
 
-        # Now compute the average per symbol & insert
+        # Now compute the average per symbol & insert the whole tick at once
+        tick_time = datetime.now()
+        batch = []
         for sym, price_list in aggregated.items():
             if not price_list:
                 continue
             avg_price = sum(price_list) / len(price_list)
             # We'll label it "Averaged" as the source
-            self.data_locker.insert_or_update_price(sym, avg_price, "Averaged")
+            batch.append({
+                "asset_type": sym,
+                "current_price": avg_price,
+                "source": "Averaged",
+                "timestamp": tick_time,
+            })
+        await self.async_locker.insert_prices_bulk(batch)
+        # New prices => refresh the positions' stored travel % / heat index
+        await self.async_locker.sync_calc_services()
 
         logger.info("All price updates completed.")
 
@@ -119,7 +134,7 @@ class PriceMonitor:
             sym = found_sym if found_sym else slug  # fallback
             results[sym] = price
 
-        self.data_locker.increment_api_report_counter("CoinGecko")
+        await self.async_locker.increment_api_report_counter("CoinGecko")
         return results
 
 
@@ -143,7 +158,7 @@ class PriceMonitor:
             return {}
 
         data = await fetch_current_coinpaprika(ids)  # e.g. {"BTC": 29050, "ETH": 1905}
-        self.data_locker.increment_api_report_counter("CoinPaprika")
+        await self.async_locker.increment_api_report_counter("CoinPaprika")
         return data
 
 
@@ -154,7 +169,7 @@ class PriceMonitor:
         logger.info("Fetching Binance for assets: ...")
         binance_symbols = [sym.upper() + "USDT" for sym in self.assets]
         bn_data = await fetch_current_binance(binance_symbols)  # e.g. {"BTC": 29040, "ETH": 1898}
-        self.data_locker.increment_api_report_counter("Binance")
+        await self.async_locker.increment_api_report_counter("Binance")
         return bn_data
 
 
@@ -165,7 +180,7 @@ class PriceMonitor:
         logger.info("Fetching CMC for assets: %s", self.assets)
         cmc_data = await fetch_current_cmc(self.assets, self.currency, self.cmc_api_key)
         # e.g. {"BTC": 29045, "ETH": 1899}
-        self.data_locker.increment_api_report_counter("CoinMarketCap")
+        await self.async_locker.increment_api_report_counter("CoinMarketCap")
         return cmc_data
 
 
@@ -182,16 +197,23 @@ class PriceMonitor:
         )
         logger.debug(f"Fetched {len(records)} daily records for {symbol} from CMC.")
 
+        # Each daily record becomes one price row: the close, stamped at
+        # the day's close time (local, like live ticks).
+        batch = []
         for r in records:
-            self.data_locker.insert_historical_ohlc(
-                symbol,
-                r["time_open"],
-                r["open"],
-                r["high"],
-                r["low"],
-                r["close"],
-                r["volume"],
-            )
+            stamp = r.get("time_close") or r.get("time_open")
+            if not stamp or not r.get("close"):
+                continue
+            closed_at = datetime.fromisoformat(stamp.replace("Z", "+00:00"))
+            if closed_at.tzinfo is not None:
+                closed_at = closed_at.astimezone().replace(tzinfo=None)
+            batch.append({
+                "asset_type": symbol.upper(),
+                "current_price": float(r["close"]),
+                "source": "CoinMarketCap",
+                "timestamp": closed_at,
+            })
+        await self.async_locker.insert_prices_bulk(batch)
 
 
 # Standalone usage
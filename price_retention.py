@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Retention for raw price ticks.
+
+Raw rows older than `raw_days` are folded into price_rollups (which keep
+the long-range history) and then deleted in small chunks. Every chunk is
+its own short write through DataLocker._execute_write, so it queues
+behind the write-behind writer like any other write and the monitor
+never holds the write lock for long. Freed pages are handed back to the
+filesystem with incremental VACUUM, but only on files already using
+auto_vacuum=INCREMENTAL. Converting a file is a full VACUUM that blocks
+every writer, so it is never done implicitly. Run it by hand instead:
+
+    python price_retention.py [db_path] --auto-vacuum
+
+Configured under system_config["price_retention"]. It is off by default,
+since it deletes raw ticks:
+    {
+      "enabled": false,
+      "raw_days": 30,
+      "chunk_size": 5000,
+      "interval_seconds": 3600,
+      "vacuum_pages": 2000
+    }
+
+One-off run:
+    python price_retention.py [db_path] [raw_days]
+"""
+import sys
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from price_rollups import day_bounds
+
+logger = logging.getLogger("PriceRetentionLogger")
+
+DEFAULT_RETENTION: Dict[str, Any] = {
+    "enabled": False,
+    "raw_days": 30,
+    "chunk_size": 5000,
+    "interval_seconds": 3600,
+    "vacuum_pages": 2000,      # pages freed per step; 0 = all in one step
+    "chunk_pause": 0.1,        # seconds between chunks, lets other writers in
+}
+
+
+class PriceRetention:
+    """
+    Prunes raw price ticks older than the retention window.
+      - The cutoff is aligned to midnight, so a day is either kept whole
+        or rolled up and deleted whole.
+      - maybe_run() only does work once every interval_seconds, so it can
+        be called on every monitor loop iteration.
+    """
+
+    def __init__(self, data_locker, settings: Optional[Dict[str, Any]] = None):
+        self.data_locker = data_locker
+        self.settings = dict(DEFAULT_RETENTION, **(settings or {}))
+        self.last_run: Optional[float] = None
+        self.last_report: Optional[dict] = None
+
+    @classmethod
+    def from_config(cls, data_locker, config: Dict[str, Any]) -> 'PriceRetention':
+        """
+        Builds the engine from a loaded config dict (see load_config).
+        """
+        settings = config.get("system_config", {}).get("price_retention", {})
+        return cls(data_locker, settings)
+
+    def cutoff(self, now: Optional[datetime] = None) -> str:
+        now = now or datetime.now()
+        oldest_kept = now - timedelta(days=int(self.settings["raw_days"]))
+        return day_bounds(oldest_kept, oldest_kept)[0]
+
+    def maybe_run(self, now: Optional[datetime] = None) -> Optional[dict]:
+        """
+        Runs retention if it is enabled and the interval has elapsed.
+        Never raises; a failed pass is logged and retried next interval.
+        """
+        if not self.settings["enabled"]:
+            return None
+        interval = float(self.settings["interval_seconds"])
+        if self.last_run is not None and time.monotonic() - self.last_run < interval:
+            return None
+        self.last_run = time.monotonic()
+        try:
+            return self.run(now)
+        except Exception as e:
+            logger.error(f"Price retention failed: {e}", exc_info=True)
+            return None
+
+    def run(self, now: Optional[datetime] = None) -> dict:
+        """
+        One retention pass. Returns a report with the cutoff, rolled-up
+        and deleted row counts, and pages/bytes reclaimed from the file.
+        """
+        started = time.perf_counter()
+        conn = self.data_locker.conn
+        cutoff = self.cutoff(now)
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+
+        assets = [r["asset_type"] for r in conn.execute("SELECT asset_type FROM latest_prices")]
+        rolled_up = 0
+        deleted = 0
+        for asset in assets:
+            oldest = conn.execute(
+                "SELECT MIN(last_update_time) FROM prices WHERE asset_type = ?", (asset,)
+            ).fetchone()[0]
+            if oldest is None or oldest >= cutoff:
+                continue
+            # Make sure every bucket about to lose its ticks is complete,
+            # one day per transaction.
+            day, _ = day_bounds(oldest, oldest)
+            while day < cutoff:
+                next_day = day_bounds(day, day)[1]
+                rolled_up += self.data_locker._execute_write(
+                    lambda c, start=day, end=next_day: self.data_locker._rebuild_rollups(asset, start, end),
+                    wait=True
+                )
+                day = next_day
+                self._pause()
+            deleted += self._delete_chunked(asset, cutoff)
+
+        vacuumed = self._incremental_vacuum()
+        pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+        if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+            # Let the truncated file reach disk without waiting on readers.
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+
+        report = {
+            "cutoff": cutoff,
+            "rollup_rows": rolled_up,
+            "rows_deleted": deleted,
+            "pages_reclaimed": pages_before - pages_after,
+            "bytes_reclaimed": (pages_before - pages_after) * page_size,
+            "vacuumed": vacuumed,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        self.last_report = report
+        logger.info(
+            f"Price retention: deleted {deleted} ticks before {cutoff}, "
+            f"reclaimed {report['bytes_reclaimed']} bytes in {report['seconds']}s."
+        )
+        return report
+
+    def _delete_chunked(self, asset: str, cutoff: str) -> int:
+        """
+        Deletes one asset's ticks before cutoff, chunk_size rows per
+        transaction (the rowids come straight off idx_prices_asset_time).
+        """
+        chunk_size = int(self.settings["chunk_size"])
+        deleted = 0
+        while True:
+            n = self.data_locker._execute_write(
+                lambda c: c.execute("""
+                    DELETE FROM prices
+                     WHERE rowid IN (
+                        SELECT rowid FROM prices
+                         WHERE asset_type = ? AND last_update_time < ?
+                         LIMIT ?
+                     )
+                """, (asset, cutoff, chunk_size)).rowcount,
+                wait=True
+            )
+            deleted += n
+            if n < chunk_size:
+                return deleted
+            self._pause()
+
+    def _pause(self):
+        """
+        Sleeps between transactions. Waiting writers retry on sqlite's busy
+        backoff (up to 100 ms apart), so without a gap they never get in.
+        """
+        pause = float(self.settings["chunk_pause"])
+        if pause:
+            time.sleep(pause)
+
+    def _incremental_vacuum(self) -> bool:
+        """
+        Releases free pages if the file uses auto_vacuum=INCREMENTAL; on
+        any other mode it does nothing (see convert_auto_vacuum).
+        """
+        conn = self.data_locker.conn
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return False
+
+        pages = int(self.settings["vacuum_pages"])
+        sql = f"PRAGMA incremental_vacuum({pages})" if pages > 0 else "PRAGMA incremental_vacuum"
+        vacuumed = False
+        while conn.execute("PRAGMA freelist_count").fetchone()[0]:
+            # Each step is its own short write; incremental_vacuum returns
+            # a row per page, so fetch them all to let it finish.
+            self.data_locker._execute_write(lambda c: c.execute(sql).fetchall(), wait=True)
+            vacuumed = True
+            if pages <= 0:
+                break
+        return vacuumed
+
+
+def convert_auto_vacuum(data_locker) -> bool:
+    """
+    Switches the file to auto_vacuum=INCREMENTAL with a full VACUUM, which
+    rewrites the whole file and blocks every other writer while it runs.
+    Meant for the command line, with the app stopped. Returns False if
+    the file was already converted.
+    """
+    data_locker.flush()
+    conn = data_locker.conn
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    logger.info("Converting database to auto_vacuum=INCREMENTAL (full VACUUM).")
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+if __name__ == "__main__":
+    from data_locker import DataLocker
+
+    logging.basicConfig(level=logging.INFO)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    db_path = args[0] if args else "mother_brain.db"
+    if "--auto-vacuum" in sys.argv:
+        converted = convert_auto_vacuum(DataLocker(db_path))
+        print("Converted to auto_vacuum=INCREMENTAL." if converted else "Already auto_vacuum=INCREMENTAL.")
+    else:
+        settings = {"raw_days": int(args[1])} if len(args) > 1 else None
+        report = PriceRetention(DataLocker(db_path), settings).run()
+        print(report)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+OHLC rollups of the raw prices table.
+
+DataLocker keeps one price_rollups row per asset / resolution / bucket,
+updated in the same transaction as every price insert. Buckets are cut
+straight from the ISO timestamp text, so the SQL backfill and the
+incremental path always agree on bucket boundaries.
+
+Backfill (or rebuild) from existing price rows:
+    python price_rollups.py [db_path]
+"""
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Union
+
+# resolution -> (ISO prefix length kept, padding appended to the prefix)
+ROLLUP_RESOLUTIONS: Dict[str, Tuple[int, str]] = {
+    "1m": (16, ":00"),
+    "1h": (13, ":00:00"),
+    "1d": (10, "T00:00:00"),
+}
+
+
+def bucket_start(timestamp: str, resolution: str) -> str:
+    """
+    '2025-01-29T21:48:25.677823' -> '2025-01-29T21:48:00' for '1m'.
+    """
+    keep, pad = ROLLUP_RESOLUTIONS[resolution]
+    return timestamp[:keep] + pad
+
+
+def rollup_rows(price_rows: List[dict]) -> List[dict]:
+    """
+    Expands price rows into one rollup upsert row per resolution.
+    """
+    rows = []
+    for p in price_rows:
+        ts = p["last_update_time"]
+        for resolution in ROLLUP_RESOLUTIONS:
+            rows.append({
+                "asset_type": p["asset_type"],
+                "resolution": resolution,
+                "bucket_start": bucket_start(ts, resolution),
+                "price": p["current_price"],
+                "ts": ts,
+            })
+    return rows
+
+
+def day_bounds(start: Union[str, datetime], end: Union[str, datetime]) -> Tuple[str, str]:
+    """
+    Widens [start, end] to whole days, so a rebuild never leaves a
+    partially recomputed bucket at any resolution.
+    """
+    if isinstance(start, str):
+        start = datetime.fromisoformat(start[:19])
+    if isinstance(end, str):
+        end = datetime.fromisoformat(end[:19])
+    first_day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    last_day = end.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return first_day.isoformat(), last_day.isoformat()
+
+
+if __name__ == "__main__":
+    import logging
+    from data_locker import DataLocker
+
+    logging.basicConfig(level=logging.INFO)
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "mother_brain.db"
+    locker = DataLocker(db_path)
+    written = locker.rebuild_price_rollups()
+    print(f"Rebuilt {written} rollup rows in {db_path}.")
@@ -0,0 +1,462 @@
+"""
+Historical replay of the current position book.
+
+Answers "how would today's positions have fared over the last month":
+stored prices are streamed in time order through the same valuation and
+alert rules the live app uses, and nothing is written anywhere.
+
+  1) Prices: raw ticks (source "ticks": the archive when one is attached,
+     else the prices table) or rollup closes (source "rollups" at
+     '1m' / '1h' / '1d', stamped at the bucket end so a close is never
+     seen before its bucket is over). Every asset is forward-filled onto
+     one time grid: the union of all tick times, or a regular grid every
+     step_seconds (e.g. the alert monitor's poll interval).
+  2) Metrics: every position is revalued at every grid step with the
+     valuation kernel (TRAVEL_NO_PROFIT, side_of_strict, as the positions
+     page and AlertManager do), asset by asset in chunks of time x
+     positions. Per step: total_value, pnl, avg_travel_percent
+     (size-weighted, as calculate_totals), how many positions sit in each
+     travel% liquid band and how many are at or past liquidation.
+  3) Alerts: AlertManager's rules replayed on the grid. A position in a
+     band fires a travel% alert unless the same position / band fired
+     less than cooldown_seconds ago; active PRICE_THRESHOLD alerts fire
+     on their ABOVE / BELOW condition with the same cooldown per alert.
+     Cooldowns are applied by jumping between eligible steps with
+     searchsorted, so the cost follows the number of firings.
+
+Positions keep today's size, collateral and liquidation price for the
+whole replay, and all of them follow their asset's history (a stored
+current_price of their own is ignored). Before an asset's first tick in
+the window its positions are held at entry (pnl 0, travel 0).
+
+Configured under system_config["replay"]; /api/replay serves it.
+"""
+import math
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from liquidation_index import BANDS
+from position_book import LONG, side_of_strict
+from price_archive import to_iso, to_micros
+from price_rollups import ROLLUP_RESOLUTIONS
+from valuation import round2, travel_percent
+
+logger = logging.getLogger("ReplayLogger")
+
+DEFAULT_REPLAY: Dict[str, Any] = {
+    "days": 30,
+    "source": "ticks",          # "ticks" or "rollups"
+    "resolution": "1m",         # rollups only
+    "step_seconds": 0,          # 0 = every tick time
+    "max_points": 2000,         # to_json thins the series to this
+    "max_alerts": 1000,         # and lists this many alert firings
+}
+SOURCES = ("ticks", "rollups")
+
+SERIES_FIELDS = (
+    "total_value", "pnl", "avg_travel_percent",
+    "in_low", "in_medium", "in_high", "liquidated",
+)
+BUCKET_MICROS = {"1m": 60_000_000, "1h": 3_600_000_000, "1d": 86_400_000_000}
+# Caps the (time steps x positions) temporaries at about this many floats.
+CHUNK_CELLS = 1 << 20
+ALERT_COLUMNS = ("step", "row", "band", "travel_percent", "price")
+
+PriceSeries = Tuple['np.ndarray', 'np.ndarray']   # (int64 micros, float64 prices)
+
+
+# ----------------------------------------------------------------
+# Price grid
+# ----------------------------------------------------------------
+
+def price_grid(series: Dict[str, PriceSeries], step_micros: int = 0) -> Tuple['np.ndarray', Dict[str, 'np.ndarray']]:
+    """
+    (times, {asset: prices at each time}) from per-asset sorted ticks,
+    each asset carrying its last price forward (NaN before its first
+    tick). times is every distinct tick time, or every step_micros from
+    the first tick to the last.
+    """
+    stamps = [ts for ts, _ in series.values() if len(ts)]
+    if not stamps:
+        return np.empty(0, dtype=np.int64), {asset: np.empty(0) for asset in series}
+    if step_micros > 0:
+        first = min(int(ts[0]) for ts in stamps)
+        last = max(int(ts[-1]) for ts in stamps)
+        times = np.arange(first, last + 1, step_micros, dtype=np.int64)
+    else:
+        times = np.unique(np.concatenate(stamps))
+
+    grid = {}
+    for asset, (ts, px) in series.items():
+        at = np.searchsorted(ts, times, side="right") - 1
+        prices = np.full(len(times), np.nan)
+        seen = at >= 0
+        prices[seen] = px[at[seen]]
+        grid[asset] = prices
+    return times, grid
+
+
+def cooldown_fires(
+        times: 'np.ndarray',
+        keys: 'np.ndarray',
+        width: int,
+        cooldown: int,
+        ready: 'np.ndarray'
+) -> 'np.ndarray':
+    """
+    AlertManager's cooldown (fire, then stay quiet until now - last >=
+    cooldown) for many alert keys at once.
+      - keys: sorted group * width + step for every step (index into
+        times, < width) at which a group's condition holds;
+      - ready: per group, the earliest time it may fire; updated in place
+        to its last firing + cooldown.
+    Returns the indexes into keys that fire. Each pass moves every group
+    on to its next firing, so there are as many passes as the busiest
+    group has firings.
+    """
+    if not len(keys):
+        return np.empty(0, dtype=np.intp)
+    last = len(keys) - 1
+    groups = keys // width
+    groups = groups[np.flatnonzero(np.diff(groups, prepend=-1))]
+    fired = []
+    while len(groups):
+        at = np.searchsorted(keys, groups * width + np.searchsorted(times, ready[groups], side="left"))
+        live = (at <= last) & (keys[np.minimum(at, last)] // width == groups)
+        at, groups = at[live], groups[live]
+        fired.append(at)
+        ready[groups] = times[keys[at] % width] + cooldown
+    return np.sort(np.concatenate(fired))
+
+
+def _not_yet(count: int) -> 'np.ndarray':
+    # ready times for groups that have never fired
+    return np.full(count, np.iinfo(np.int64).min, dtype=np.int64)
+
+
+# ----------------------------------------------------------------
+# Book replay
+# ----------------------------------------------------------------
+
+def replay_book(
+        book,
+        times: 'np.ndarray',
+        grid: Dict[str, 'np.ndarray'],
+        ranges: dict,
+        cooldown_micros: int
+) -> Tuple[Dict[str, 'np.ndarray'], Dict[str, 'np.ndarray']]:
+    """
+    Revalues the book (side by side_of_strict) at every step of the grid.
+    Returns ({field: array over steps} for SERIES_FIELDS, travel% alert
+    firings as columns: step, row (into the book), band (1 LOW, 2 MEDIUM,
+    3 HIGH), travel_percent and price, ordered by step).
+    """
+    steps = len(times)
+    low, medium, high = (float(ranges[k]) for k in ("low", "medium", "high"))
+    sums = {f: np.zeros(steps) for f in ("total_value", "pnl", "travel_x_size")}
+    counts = {f: np.zeros(steps, dtype=np.int64) for f in ("in_low", "in_medium", "in_high", "liquidated")}
+    band_field = {1: "in_low", 2: "in_medium", 3: "in_high"}
+
+    is_long = book.side == LONG
+    tokens = np.zeros_like(book.size)
+    np.divide(book.size, book.entry_price, out=tokens, where=book.entry_price > 0)
+    signed_tokens = np.where(is_long, tokens, -tokens)
+
+    fired = {f: [] for f in ALERT_COLUMNS}
+    for asset in book.assets:
+        rows = book.rows_for(asset)
+        if not len(rows):
+            continue
+        prices = grid.get(asset)
+        if prices is None:
+            prices = np.full(steps, np.nan)
+        side, entry, liq = book.side[rows], book.entry_price[rows], book.liquidation_price[rows]
+        collateral, size = book.collateral[rows], book.size[rows]
+        ready = {code: _not_yet(len(rows)) for code in band_field}
+        chunk = max(1, CHUNK_CELLS // len(rows))
+
+        # Chunks are (positions x steps), so each position's steps are
+        # contiguous and nonzero() comes out position-major.
+        side, entry, liq = side[:, None], entry[:, None], liq[:, None]
+        collateral, size, signed = collateral[:, None], size[:, None], signed_tokens[rows, None]
+        for start in range(0, steps, chunk):
+            part = slice(start, start + chunk)
+            chunk_times = times[part]
+            p = prices[None, part]
+            current = np.where(np.isnan(p), entry, p)
+            pnl = (current - entry) * signed
+            value = round2((collateral + pnl).ravel()).reshape(pnl.shape)
+            travel = travel_percent(side, entry, current, liq)
+            # liquid_band's order: HIGH over MEDIUM over LOW, never at travel >= 0
+            band = np.zeros(travel.shape, dtype=np.int8)
+            band[travel <= low] = 1
+            band[travel <= medium] = 2
+            band[travel <= high] = 3
+            band[travel >= 0] = 0
+
+            sums["total_value"][part] += value.sum(axis=0)
+            sums["pnl"][part] += pnl.sum(axis=0)
+            sums["travel_x_size"][part] += (travel * size).sum(axis=0)
+            counts["liquidated"][part] += (travel <= -100).sum(axis=0)
+            for code, field in band_field.items():
+                in_band = band == code
+                counts[field][part] += in_band.sum(axis=0)
+                cols, at = np.nonzero(in_band)
+                hit = cooldown_fires(chunk_times, cols * len(chunk_times) + at, len(chunk_times),
+                                     cooldown_micros, ready[code])
+                cols, at = cols[hit], at[hit]
+                fired["step"].append(at + start)
+                fired["row"].append(rows[cols])
+                fired["band"].append(np.full(len(hit), code, dtype=np.int8))
+                fired["travel_percent"].append(travel[cols, at])
+                fired["price"].append(current[cols, at])
+
+    total_size = float(book.size.sum())
+    series = {
+        "total_value": sums["total_value"],
+        "pnl": sums["pnl"],
+        "avg_travel_percent": sums["travel_x_size"] / total_size if total_size > 0 else np.zeros(steps),
+        **counts,
+    }
+    alerts = {f: np.concatenate(parts) if parts else np.empty(0) for f, parts in fired.items()}
+    order = np.argsort(alerts["step"], kind="stable")
+    return series, {f: column[order] for f, column in alerts.items()}
+
+
+def replay_price_alerts(
+        times: 'np.ndarray',
+        grid: Dict[str, 'np.ndarray'],
+        price_alerts: List[dict],
+        cooldown_micros: int
+) -> Dict[str, 'np.ndarray']:
+    """
+    Firings of PRICE_THRESHOLD alerts over the grid, per check_price_alerts
+    (ABOVE fires at price >= trigger_value, anything else at <=), as
+    columns: step, alert (index into price_alerts) and price, by step.
+    """
+    keys = []
+    for i, alert in enumerate(price_alerts):
+        prices = grid.get((alert.get("asset_type") or "BTC").upper())
+        if prices is None:
+            continue
+        trigger = float(alert.get("trigger_value") or 0.0)
+        with np.errstate(invalid="ignore"):
+            met = prices >= trigger if (alert.get("condition") or "ABOVE").upper() == "ABOVE" else prices <= trigger
+        keys.append(i * len(times) + np.flatnonzero(met))
+    keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+    keys = keys[cooldown_fires(times, keys, len(times), cooldown_micros, _not_yet(len(price_alerts)))]
+    step, alert = keys % len(times), keys // len(times)
+    order = np.argsort(step, kind="stable")
+    step, alert = step[order], alert[order]
+    price = np.array([grid[(price_alerts[a].get("asset_type") or "BTC").upper()][s] for s, a in zip(step, alert)])
+    return {"step": step, "alert": alert, "price": price}
+
+
+def max_drawdown(values: 'np.ndarray') -> float:
+    """
+    Largest peak-to-trough drop as a fraction of the peak (0.0 to 1.0).
+    """
+    if not len(values):
+        return 0.0
+    peaks = np.maximum.accumulate(values)
+    drops = np.zeros_like(values)
+    np.divide(peaks - values, peaks, out=drops, where=peaks > 0)
+    return float(drops.max())
+
+
+# ----------------------------------------------------------------
+# Engine
+# ----------------------------------------------------------------
+
+class ReplayEngine:
+    """
+    Replays one DataLocker's positions and alerts over its stored prices.
+      - Read-only: positions, alerts and prices are read, nothing written.
+      - Alert rules (travel_percent_liquid_ranges, alert_cooldown_seconds)
+        come from the same config AlertManager loads.
+      - No price history in the window gives available=False and a
+        reason; a bad source / resolution raises ValueError.
+    """
+
+    def __init__(
+            self,
+            data_locker,
+            ranges: dict,
+            cooldown_seconds: float = 900,
+            settings: Optional[Dict[str, Any]] = None
+    ):
+        self.data_locker = data_locker
+        self.ranges = {k: float(ranges[k]) for k in ("low", "medium", "high")}
+        self.cooldown_seconds = float(cooldown_seconds)
+        self.settings = dict(DEFAULT_REPLAY, **(settings or {}))
+
+    @classmethod
+    def from_config(cls, data_locker, config: Dict[str, Any]) -> 'ReplayEngine':
+        """
+        Builds the engine from a loaded config dict (see load_config).
+        """
+        return cls(
+            data_locker,
+            config["alert_ranges"]["travel_percent_liquid_ranges"],
+            config.get("alert_cooldown_seconds", 900),
+            config.get("system_config", {}).get("replay", {}),
+        )
+
+    def run(self, start: Optional[datetime] = None, end: Optional[datetime] = None, **overrides) -> dict:
+        """
+        Replays [start, end) (default: the last `days` days up to now).
+        Times, prices, series and alert firings come back as NumPy
+        columns; to_json turns a result into JSON.
+        """
+        settings = dict(self.settings, **overrides)
+        if settings["source"] not in SOURCES:
+            raise ValueError(f"Unknown replay source '{settings['source']}', use one of {SOURCES}")
+        if settings["source"] == "rollups" and settings["resolution"] not in ROLLUP_RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{settings['resolution']}', use one of {list(ROLLUP_RESOLUTIONS)}")
+
+        end = end or datetime.now()
+        start = start or end - timedelta(days=float(settings["days"]))
+        book = self.data_locker.read_position_book(side_of_strict)
+        price_alerts = [
+            a for a in self.data_locker.get_alerts()
+            if a.get("alert_type") == "PRICE_THRESHOLD" and (a.get("status") or "").lower() == "active"
+        ]
+        assets = sorted(set(book.assets) | {(a.get("asset_type") or "BTC").upper() for a in price_alerts})
+        series = self.load_prices(assets, start, end, settings)
+        times, grid = price_grid(series, int(float(settings["step_seconds"]) * 1_000_000))
+        if not len(times):
+            return {"available": False, "reason": f"no prices ({settings['source']}) between {start} and {end}"}
+
+        cooldown = int(self.cooldown_seconds * 1_000_000)
+        metrics, travel_alerts = replay_book(book, times, grid, self.ranges, cooldown)
+        fired_prices = replay_price_alerts(times, grid, price_alerts, cooldown)
+
+        value = metrics["total_value"]
+        summary = {
+            "start_value": float(value[0]),
+            "end_value": float(value[-1]),
+            "min_value": float(value.min()),
+            "max_drawdown": max_drawdown(value),
+            "max_in_high": int(metrics["in_high"].max()),
+            "max_liquidated": int(metrics["liquidated"].max()),
+            "travel_alerts": {band: int((travel_alerts["band"] == i + 1).sum()) for i, band in enumerate(BANDS)},
+            "price_alerts": len(fired_prices["step"]),
+        }
+        logger.debug(
+            f"Replayed {len(book)} positions over {len(times)} steps: "
+            f"{len(travel_alerts['step'])} travel% and {len(fired_prices['step'])} price alerts."
+        )
+        return {
+            "available": True,
+            "reason": None,
+            "source": settings["source"],
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "positions": len(book),
+            "steps": len(times),
+            "times": times,
+            "prices": grid,
+            "series": metrics,
+            "position_ids": book.ids,
+            "position_assets": [book.assets[code] for code in book.asset.tolist()],
+            "travel_alerts": travel_alerts,
+            "price_alerts": price_alerts,
+            "price_alert_firings": fired_prices,
+            "summary": summary,
+        }
+
+    def load_prices(self, assets: List[str], start: datetime, end: datetime, settings: dict) -> Dict[str, PriceSeries]:
+        """
+        {asset: (int64 micros, prices)} for [start, end) from ticks or
+        rollup closes (stamped at bucket end).
+        """
+        if settings["source"] == "ticks":
+            return {asset: self.data_locker.read_price_ticks(asset, start, end) for asset in assets}
+        resolution = settings["resolution"]
+        width = BUCKET_MICROS[resolution]
+        out = {}
+        for asset in assets:
+            rows = self.data_locker.get_price_series(asset, resolution, start, end)
+            ts = to_micros([r["bucket_start"] for r in rows]) + width
+            px = np.array([r["close"] for r in rows], dtype=np.float64)
+            keep = ts <= to_micros([end])[0]
+            out[asset] = (ts[keep], px[keep])
+        return out
+
+
+def alert_rows(result: dict) -> List[dict]:
+    """
+    A run() result's alert firings as dicts, oldest first: kind
+    "travel_percent" (position_id, asset_type, band, travel_percent,
+    price) or "price" (alert_id, asset_type, condition, trigger_value,
+    price); time is int64 microseconds.
+    """
+    times, ids, assets = result["times"], result["position_ids"], result["position_assets"]
+    travel = result["travel_alerts"]
+    rows = [{
+        "time": int(times[step]),
+        "kind": "travel_percent",
+        "position_id": ids[row],
+        "asset_type": assets[row],
+        "band": BANDS[band - 1],
+        "travel_percent": pct,
+        "price": price,
+    } for step, row, band, pct, price in zip(
+        travel["step"].tolist(), travel["row"].tolist(), travel["band"].tolist(),
+        travel["travel_percent"].tolist(), travel["price"].tolist())]
+    for step, i, price in zip(*(result["price_alert_firings"][f].tolist() for f in ("step", "alert", "price"))):
+        alert = result["price_alerts"][i]
+        rows.append({
+            "time": int(times[step]),
+            "kind": "price",
+            "alert_id": alert.get("id"),
+            "asset_type": (alert.get("asset_type") or "BTC").upper(),
+            "condition": (alert.get("condition") or "ABOVE").upper(),
+            "trigger_value": float(alert.get("trigger_value") or 0.0),
+            "price": price,
+        })
+    rows.sort(key=lambda r: r["time"])
+    return rows
+
+
+def to_json(
+        result: dict,
+        max_points: int = DEFAULT_REPLAY["max_points"],
+        max_alerts: int = DEFAULT_REPLAY["max_alerts"]
+) -> dict:
+    """
+    A run() result for JSON: series thinned to about max_points steps
+    (always keeping the last), times as ISO strings, and the first
+    max_alerts alert firings (alerts_total says how many there were).
+    """
+    if not result.get("available"):
+        return result
+    steps = result["steps"]
+    stride = max(1, -(-steps // max(int(max_points), 1)))
+    keep = np.unique(np.append(np.arange(0, steps, stride), steps - 1))
+
+    def thin(values):
+        values = values[keep]
+        if values.dtype.kind != "f":
+            return values.tolist()
+        return [None if math.isnan(v) else v for v in values.tolist()]
+
+    # Both kinds are ordered by step, so only the first max_alerts of
+    # each can make the cut.
+    total = len(result["travel_alerts"]["step"]) + len(result["price_alert_firings"]["step"])
+    alerts = alert_rows(dict(result, **{
+        kind: {f: column[:max_alerts] for f, column in result[kind].items()}
+        for kind in ("travel_alerts", "price_alert_firings")
+    }))[:max_alerts]
+    return {
+        **{k: v for k, v in result.items() if k in ("available", "reason", "source", "start", "end", "positions", "steps", "summary")},
+        "points": len(keep),
+        "times": [to_iso(t) for t in result["times"][keep]],
+        "prices": {asset: thin(values) for asset, values in result["prices"].items()},
+        "series": {field: thin(values) for field, values in result["series"].items()},
+        "alerts_total": total,
+        "alerts": [dict(a, time=to_iso(a["time"])) for a in alerts],
+    }
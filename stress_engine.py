@@ -0,0 +1,231 @@
+"""
+Price-shock stress testing over the whole position book.
+
+A scenario is one move per asset (e.g. BTC -10%, ETH and SOL -5%
+together). Scenarios come from a grid of factors, each factor being one
+or more assets that move together through a list of shocks in percent:
+
+    {"BTC": [-20, -10, -5, 0], "ETH,SOL": [-10, 0, 10]}    # 4 x 3 = 12
+
+Every position is revalued under every scenario with NumPy broadcasting
+(price levels x positions, per asset), using the CalcServices formulas:
+
+    pnl      = (price - entry) * size / entry        (sign flipped for shorts)
+    value    = collateral + pnl
+    liquidated: long at price <= liquidation, short at price >= liquidation
+
+A liquidated position is worth 0 (its collateral is lost); one with no
+price at all is held at its collateral. Per scenario the engine returns
+total_value, value_change (vs. no shock), pnl, liquidated (count),
+liquidated_collateral and surviving_collateral.
+
+StressEngine wraps this for a DataLocker and caches results per price
+snapshot (latest prices + positions version), which is what /api/stress
+serves.
+"""
+import logging
+import math
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence as SequenceABC
+from itertools import product
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from position_book import LONG, PositionBook
+
+logger = logging.getLogger("StressEngineLogger")
+
+DEFAULT_SHOCKS = (-20.0, -10.0, -5.0, 0.0, 5.0, 10.0, 20.0)
+MAX_SCENARIOS = 100_000
+# Caps the (price levels x positions) temporaries in stress_book at about
+# this many floats each.
+CHUNK_CELLS = 1 << 20
+
+STRESS_FIELDS = (
+    "total_value", "value_change", "pnl", "liquidated",
+    "liquidated_collateral", "surviving_collateral",
+)
+
+Factors = Dict[str, Sequence[float]]
+
+
+def parse_factors(factors: Factors) -> List[Tuple[Tuple[str, ...], Tuple[float, ...]]]:
+    """
+    {"BTC": [...], "ETH,SOL": [...]} -> [(("BTC",), shocks), (("ETH", "SOL"), shocks)],
+    assets upper-cased. Raises ValueError for factors that are not such a
+    dict, a shock that is not a finite number, an asset listed twice or a
+    shock of -100% or below.
+    """
+    if not isinstance(factors, dict):
+        raise ValueError(f"Stress factors must be an object of asset: [shocks], got {type(factors).__name__}")
+    parsed, seen = [], set()
+    for key, shocks in factors.items():
+        if not isinstance(shocks, SequenceABC) or isinstance(shocks, str):
+            raise ValueError(f"Shocks for '{key}' must be a list, got {type(shocks).__name__}")
+        assets = tuple(a.strip().upper() for a in key.split(",") if a.strip())
+        for s in shocks:
+            if not isinstance(s, (int, float)) or isinstance(s, bool) or not math.isfinite(s):
+                raise ValueError(f"Shocks for '{key}' must be finite numbers, got {s!r}")
+        shocks = tuple(float(s) for s in shocks)
+        if not assets or not shocks:
+            raise ValueError(f"Empty stress factor '{key}'")
+        if seen.intersection(assets):
+            raise ValueError(f"Asset listed in more than one stress factor: '{key}'")
+        if min(shocks) <= -100:
+            raise ValueError(f"Shocks must be above -100%, got {min(shocks)} for '{key}'")
+        seen.update(assets)
+        parsed.append((assets, shocks))
+    return parsed
+
+
+def scenario_grid(factors: Factors, assets: Sequence[str]) -> 'np.ndarray':
+    """
+    Every combination of the factors' shocks as a (scenarios, len(assets))
+    matrix of fractional moves (-0.1 for -10%). Assets no factor names
+    stay at 0.
+    """
+    parsed = parse_factors(factors)
+    count = 1
+    for _, shocks in parsed:
+        count *= len(shocks)
+    if count > MAX_SCENARIOS:
+        raise ValueError(f"{count} scenarios requested, the limit is {MAX_SCENARIOS}")
+
+    column = {asset: i for i, asset in enumerate(assets)}
+    grid = np.zeros((count, len(assets)), dtype=np.float64)
+    for row, combo in enumerate(product(*(shocks for _, shocks in parsed))):
+        for (factor_assets, _), shock in zip(parsed, combo):
+            for asset in factor_assets:
+                if asset in column:
+                    grid[row, column[asset]] = shock / 100.0
+    return grid
+
+
+def stress_book(book: PositionBook, moves: 'np.ndarray') -> Dict[str, 'np.ndarray']:
+    """
+    Revalues the book under each row of moves, a (scenarios, len(book.assets))
+    matrix of fractional price moves applied to book.current_price.
+    Returns {field: array over scenarios} for STRESS_FIELDS.
+
+    A position's price only depends on its own asset's move, so each asset
+    is revalued once per distinct move (distinct moves x its positions)
+    and scenarios add up those per-asset totals.
+    """
+    scenarios = len(moves)
+    is_long = book.side == LONG
+    has_entry = book.entry_price > 0
+    tokens = np.zeros_like(book.size)
+    np.divide(book.size, book.entry_price, out=tokens, where=has_entry)
+    priced = book.current_price > 0
+    signed_tokens = np.where(priced, np.where(is_long, tokens, -tokens), 0.0)
+    has_liq = (book.liquidation_price > 0) & priced
+
+    def revalue(rows, levels):
+        # -> per level: value, pnl, liquidated count, collateral lost
+        current, entry, liq = book.current_price[rows], book.entry_price[rows], book.liquidation_price[rows]
+        longs, collateral = is_long[rows], book.collateral[rows]
+        totals = np.zeros((4, len(levels)))
+        step = max(1, CHUNK_CELLS // max(len(rows), 1))
+        for start in range(0, len(levels), step):
+            part = slice(start, start + step)
+            price = current * (1.0 + levels[part, None])
+            pnl = (price - entry) * signed_tokens[rows]
+            liquidated = has_liq[rows] & np.where(longs, price <= liq, price >= liq)
+            totals[0, part] = np.where(liquidated, 0.0, collateral + pnl).sum(axis=1)
+            totals[1, part] = np.where(liquidated, 0.0, pnl).sum(axis=1)
+            totals[2, part] = liquidated.sum(axis=1)
+            totals[3, part] = np.where(liquidated, collateral, 0.0).sum(axis=1)
+        return totals
+
+    summed = np.zeros((4, scenarios))
+    base_value = 0.0
+    for code, asset in enumerate(book.assets):
+        rows = book.rows_for(asset)
+        if not len(rows):
+            continue
+        levels, which = np.unique(moves[:, code], return_inverse=True)
+        summed += revalue(rows, levels)[:, which]
+        base_value += revalue(rows, np.zeros(1))[0, 0]
+
+    value, pnl, liquidated, lost = summed
+    return {
+        "total_value": value,
+        "value_change": value - base_value,
+        "pnl": pnl,
+        "liquidated": liquidated.astype(np.int64),
+        "liquidated_collateral": lost,
+        "surviving_collateral": float(book.collateral.sum()) - lost,
+    }
+
+
+class StressEngine:
+    """
+    Stress runs against one DataLocker's positions at its latest prices.
+      - Positions with their own current_price keep it; the rest are
+        priced from latest prices, as on the positions page.
+      - Results are cached per (price snapshot, factors), keeping the
+        last `cache_size`; a new tick or a position change here makes a
+        new snapshot.
+    """
+
+    def __init__(self, data_locker, cache_size: int = 16):
+        self.data_locker = data_locker
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: 'OrderedDict[tuple, dict]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, factors: Optional[Factors] = None) -> dict:
+        """
+        Stress results for factors (default: DEFAULT_SHOCKS on every asset
+        in the book, independently), as a JSON-ready dict. Malformed
+        factors raise ValueError (see parse_factors).
+        """
+        key_factors = None if factors is None else tuple(sorted(parse_factors(factors)))
+        key = (self.data_locker.snapshot_key(), key_factors)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return dict(cached, cached=True)
+            self.misses += 1
+
+        result = self._compute(factors)
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return dict(result, cached=False)
+
+    def _compute(self, factors: Optional[Factors]) -> dict:
+        book, prices = self.data_locker.read_priced_position_book()
+        if factors is None:
+            factors = {asset: DEFAULT_SHOCKS for asset in book.assets}
+        moves = scenario_grid(factors, book.assets)
+        results = stress_book(book, moves)
+
+        scenarios = []
+        for i, row in enumerate(moves):
+            shocks = {asset: round(float(m) * 100, 6) for asset, m in zip(book.assets, row)}
+            scenarios.append({
+                "shocks": shocks,
+                "prices": {a: p * (1 + shocks[a] / 100) for a, p in prices.items() if a in shocks},
+                **{field: results[field][i].item() for field in STRESS_FIELDS},
+            })
+        worst = int(np.argmin(results["total_value"])) if scenarios else None
+        logger.debug(f"Stressed {len(book)} positions over {len(scenarios)} scenarios.")
+        return {
+            "positions": len(book),
+            "prices": prices,
+            "factors": {k: list(v) for k, v in factors.items()},
+            "scenarios": scenarios,
+            "worst": worst,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
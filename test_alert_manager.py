@@ -0,0 +1,129 @@
+"""
+Travel% liquid alerts in AlertManager.check_alerts, driven by the
+LiquidationIndex crossings and the cooldown schedule, must fire exactly
+what the old rule fired: every cycle, every position in a band whose
+(position, band) cooldown has run out.
+
+    python -m pytest -q test_alert_manager.py
+"""
+import os
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+import alert_manager
+from alert_manager import AlertManager
+from calc_services import CalcServices
+from liquidation_index import liquid_band
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sonic_config.json")
+START = 1_700_000_000.0
+STEP_SECONDS = 60
+
+
+def random_positions(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    positions = []
+    for i in range(count):
+        side = rng.choice(["LONG", "SHORT"])
+        entry = rng.uniform(90, 110)
+        span = rng.uniform(5, 40)
+        positions.append({
+            "id": f"p{i}",
+            "wallet_name": "w1",
+            "asset_type": rng.choice(["BTC", "ETH"]),
+            "position_type": side,
+            "entry_price": entry,
+            "liquidation_price": entry - span if side == "LONG" else entry + span,
+            "collateral": 100.0,
+            "size": 1000.0,
+            "current_price": 0.0,
+            "last_updated": f"2025-02-01T00:00:00-{i}",
+        })
+    # Priced by its own current_price: sits in a band without ever moving.
+    positions.append(dict(positions[0], id="own", position_type="LONG", entry_price=100.0,
+                          liquidation_price=50.0, current_price=70.0, last_updated="own"))
+    return positions
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [START]
+    monkeypatch.setattr(alert_manager.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def manager(tmp_path, clock):
+    m = AlertManager(db_path=str(tmp_path / "alerts.db"), config_path=CONFIG_PATH)
+    m.fired = []
+    m.send_email = lambda body: m.fired.append((
+        clock[0],
+        re.search(r"Position ID: (\S+),", body).group(1),
+        re.search(r"=> (\w+) zone", body).group(1),
+    ))
+    m.send_sms = lambda body: None
+    return m
+
+
+def old_rule(positions, prices, ranges, cooldown, now, last) -> set:
+    calc = CalcServices()
+    fired = set()
+    for pos in positions:
+        price = pos["current_price"] or prices[pos["asset_type"]]
+        travel = calc.calculate_travel_percent_no_profit(
+            pos["position_type"], pos["entry_price"], price, pos["liquidation_price"])
+        band = liquid_band(travel, ranges)
+        if band and now - last.get((pos["id"], band), 0) >= cooldown:
+            last[(pos["id"], band)] = now
+            fired.add((now, pos["id"], band))
+    return fired
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+@pytest.mark.parametrize("index_refresh", [300, 10 ** 9], ids=["rebuilds", "schedule_only"])
+def test_alerts_match_checking_every_position(manager, clock, seed, index_refresh):
+    manager.index_refresh = index_refresh
+    positions = random_positions(300, seed)
+    manager.data_locker.upsert_positions(positions)
+    ranges = {k: float(v) for k, v in manager.liquid_cfg.items()}
+    rng = random.Random(seed)
+    prices = {"BTC": 100.0, "ETH": 100.0}
+    expected, last = set(), {}
+
+    for step in range(240):
+        clock[0] = START + step * STEP_SECONDS
+        for asset in prices:
+            prices[asset] = max(40.0, min(160.0, prices[asset] * rng.uniform(0.95, 1.05)))
+            manager.data_locker.insert_or_update_price(
+                asset, prices[asset], "test", datetime(2025, 1, 1) + timedelta(minutes=step))
+        manager.check_alerts()
+        expected |= old_rule(positions, prices, ranges, manager.cooldown, clock[0], last)
+
+    assert expected
+    assert any(pid == "own" for _, pid, _ in expected)
+    assert set(manager.fired) == expected
+    assert len(manager.fired) == len(expected)
+
+
+def test_quiet_cycle_checks_nothing(manager, clock, monkeypatch):
+    manager.index_refresh = 10 ** 9
+    manager.data_locker.upsert_positions(random_positions(300, 3))
+    for asset in ("BTC", "ETH"):
+        manager.data_locker.insert_or_update_price(asset, 70.0, "test", datetime(2025, 1, 1))
+    manager.check_alerts()
+    assert manager.fired
+
+    checked = []
+    original = manager._check_indexed_position
+    monkeypatch.setattr(manager, "_check_indexed_position",
+                        lambda index, pos_id: checked.append(pos_id) or original(index, pos_id))
+    clock[0] += STEP_SECONDS     # same prices, nothing due yet
+    manager.check_alerts()
+    assert checked == []
+
+    clock[0] += manager.cooldown  # every alert's cooldown ran out
+    manager.check_alerts()
+    assert len(checked) == len(set(pid for _, pid, _ in manager.fired))
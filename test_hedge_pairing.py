@@ -0,0 +1,136 @@
+"""
+Automatic hedge pairing (hedge_pairing.py) against a scratch database:
+incremental re-runs, stale / hand-set links with and without
+clear_links, the min_size_ratio limit and two-way links.
+
+    python -m pytest -q test_hedge_pairing.py
+"""
+import random
+
+import pytest
+
+from data_locker import DataLocker
+from hedge_pairing import HedgePairing
+
+
+def position(pid, side, size, asset="BTC", wallet="w1") -> dict:
+    return {
+        "id": pid,
+        "wallet_name": wallet,
+        "asset_type": asset,
+        "position_type": side,
+        "entry_price": 100.0,
+        "liquidation_price": 50.0 if side == "LONG" else 150.0,
+        "collateral": size / 5,
+        "size": size,
+        "last_updated": f"2025-02-01T00:00:00-{pid}",
+    }
+
+
+@pytest.fixture
+def locker(tmp_path):
+    return DataLocker(str(tmp_path / "hedges.db"))
+
+
+def links(locker) -> dict:
+    return locker.read_hedge_links()
+
+
+def assert_two_way(linked: dict):
+    for pid, buddy in linked.items():
+        assert linked.get(buddy) == pid, (pid, buddy)
+
+
+def test_rerun_writes_nothing(locker):
+    locker.upsert_positions([position("l1", "LONG", 100), position("s1", "SHORT", 90),
+                             position("l2", "LONG", 1000)])
+    pairing = HedgePairing(locker)
+    first = pairing.run()
+    assert (first["paired"], first["written"]) == (1, 2)
+    assert links(locker) == {"l1": "s1", "s1": "l1"}
+
+    again = pairing.run()
+    assert (again["paired"], again["written"], again["cleared"]) == (0, 0, 0)
+
+
+def test_new_positions_only_touch_new_rows(locker):
+    locker.upsert_positions([position("l1", "LONG", 100), position("s1", "SHORT", 90)])
+    pairing = HedgePairing(locker)
+    pairing.run()
+    # s2 would fit l1 better, but l1's hedge is kept as it is.
+    locker.upsert_positions([position("s2", "SHORT", 100), position("l2", "LONG", 110)])
+    result = pairing.run()
+    assert (result["paired"], result["written"], result["kept"]) == (1, 2, 1)
+    assert links(locker) == {"l1": "s1", "s1": "l1", "s2": "l2", "l2": "s2"}
+
+
+def test_stale_and_hand_set_links_kept_without_clear_links(locker):
+    locker.upsert_positions([
+        position("l1", "LONG", 1000), position("s1", "SHORT", 10),   # unbalanced, hand-set
+        position("l2", "LONG", 100), position("s2", "SHORT", 100),   # linked across assets
+        position("e1", "LONG", 100, asset="ETH"),
+        position("o1", "LONG", 10),                                   # linked to nothing
+        position("s3", "SHORT", 1000),                                # would fit l1
+    ])
+    hand_set = {"l1": "s1", "s1": "l1", "l2": "e1", "e1": "l2", "o1": "gone"}
+    locker.set_hedge_buddies(hand_set)
+
+    result = HedgePairing(locker).run()
+    assert (result["cleared"], result["stale"]) == (0, 5)
+    current = links(locker)
+    assert all(current[pid] == buddy for pid, buddy in hand_set.items())
+    # Only the positions in no link at all get paired.
+    assert current.get("s2") is None and current.get("s3") is None
+
+
+def test_clear_links_clears_and_rematches_stale(locker):
+    locker.upsert_positions([
+        position("l1", "LONG", 1000), position("s1", "SHORT", 10),
+        position("o1", "LONG", 10),
+        position("s3", "SHORT", 1000),
+    ])
+    locker.set_hedge_buddies({"l1": "s1", "s1": "l1", "o1": "gone"})
+
+    result = HedgePairing(locker, {"clear_links": True}).run()
+    current = links(locker)
+    assert current == {"l1": "s3", "s3": "l1", "o1": "s1", "s1": "o1"}
+    assert result["paired"] == 2
+    assert HedgePairing(locker, {"clear_links": True}).run()["written"] == 0
+
+
+def test_pairs_under_min_size_ratio_never_made(locker):
+    locker.upsert_positions([
+        position("l1", "LONG", 100), position("s1", "SHORT", 24.9),   # 0.249
+        position("l2", "LONG", 100, asset="ETH"), position("s2", "SHORT", 25, asset="ETH"),
+    ])
+    result = HedgePairing(locker).run()
+    assert result["paired"] == 1
+    assert links(locker) == {"l2": "s2", "s2": "l2"}
+    assert HedgePairing(locker).run(min_size_ratio=0.2)["paired"] == 1
+
+
+def test_same_wallet_keeps_pairs_within_a_wallet(locker):
+    locker.upsert_positions([position("l1", "LONG", 100, wallet="a"), position("s1", "SHORT", 100, wallet="b")])
+    assert HedgePairing(locker, {"same_wallet": True}).run()["paired"] == 0
+    assert HedgePairing(locker).run()["paired"] == 1
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_every_link_is_two_way_balanced_and_opposite(locker, seed):
+    rng = random.Random(seed)
+    locker.upsert_positions([
+        position(f"p{i}", rng.choice(["LONG", "SHORT"]), round(rng.lognormvariate(5, 1.5), 2),
+                 asset=rng.choice(["BTC", "ETH", "SOL"]))
+        for i in range(500)
+    ])
+    HedgePairing(locker).run()
+    rows = {r["id"]: r for r in locker.conn.execute(
+        "SELECT id, asset_type, position_type, size FROM positions")}
+    linked = links(locker)
+    assert linked
+    assert_two_way(linked)
+    for pid, buddy in linked.items():
+        a, b = rows[pid], rows[buddy]
+        assert a["asset_type"] == b["asset_type"]
+        assert a["position_type"] != b["position_type"]
+        assert min(a["size"], b["size"]) / max(a["size"], b["size"]) >= 0.25
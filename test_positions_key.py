@@ -0,0 +1,134 @@
+"""
+Position imports against the natural key (migration 5): with the unique
+index a re-import refreshes the stored row through ON CONFLICT; when
+duplicates already in the table keep the migration from adding the
+index, upsert_positions falls back to matching rows the old way.
+
+    python -m pytest -q test_positions_key.py
+"""
+import logging
+
+import pytest
+
+from data_locker import DataLocker
+from migrations import forget_schema
+
+OLD_KEY_INDEX = """
+    CREATE UNIQUE INDEX idx_positions_natural_key
+        ON positions (wallet_name, asset_type, position_type, last_updated)
+"""
+
+
+def jupiter_position(**changes) -> dict:
+    # A fresh dict (and id) per call, like every Jupiter import.
+    pos = {
+        "wallet_name": "w1",
+        "asset_type": "BTC",
+        "position_type": "LONG",
+        "entry_price": 50000.0,
+        "liquidation_price": 40000.0,
+        "collateral": 1000.0,
+        "size": 5000.0,
+        "value": 1000.0,
+        "leverage": 5.0,
+        "last_updated": "2025-02-01T00:00:00",
+    }
+    pos.update(changes)
+    return pos
+
+
+def has_key_index(locker) -> bool:
+    return locker.conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_positions_natural_key'"
+    ).fetchone() is not None
+
+
+def stored(locker) -> list:
+    return [dict(r) for r in locker.conn.execute(
+        "SELECT id, size, collateral, entry_price, leverage FROM positions ORDER BY id")]
+
+
+@pytest.fixture
+def locker(tmp_path):
+    return DataLocker(str(tmp_path / "positions.db"))
+
+
+@pytest.fixture
+def locker_with_duplicates(tmp_path, caplog):
+    """
+    A database at schema version 4 without the key index, holding two rows
+    that share the new key too, reopened so migration 5 runs on it.
+    """
+    path = str(tmp_path / "duplicates.db")
+    old = DataLocker(path)
+    with old.conn as conn:
+        conn.execute("DROP INDEX idx_positions_natural_key")
+        conn.execute("DELETE FROM schema_version WHERE version >= 5")
+        for pid in ("dup-a", "dup-b"):
+            conn.execute(old._INSERT_POSITION_SQL, old._apply_position_defaults(jupiter_position(id=pid)))
+    forget_schema(path)
+    with caplog.at_level(logging.WARNING, logger="MigrationsLogger"):
+        locker = DataLocker(path)
+    return locker
+
+
+def test_reimport_refreshes_with_index(locker):
+    assert has_key_index(locker)
+    assert locker.upsert_positions([jupiter_position()]) == 1
+    [first] = stored(locker)
+
+    assert locker.upsert_positions([jupiter_position(entry_price=51000.0, leverage=6.0)]) == 0
+    [row] = stored(locker)
+    assert row["id"] == first["id"]
+    assert (row["entry_price"], row["leverage"]) == (51000.0, 6.0)
+
+
+def test_distinct_sizes_are_distinct_positions(locker):
+    locker.upsert_positions([jupiter_position(), jupiter_position(size=2500.0)])
+    assert locker.upsert_positions([jupiter_position(collateral=500.0)]) == 1
+    assert len(stored(locker)) == 3
+
+
+def test_index_matches_size_exactly(locker):
+    # The unique index compares REAL values exactly (the fallback uses a
+    # 0.000001 tolerance, see test_fallback_matches_within_tolerance).
+    locker.upsert_positions([jupiter_position()])
+    assert locker.upsert_positions([jupiter_position(size=5000.0 + 1e-9)]) == 1
+
+
+def test_migration_upgrades_old_key(tmp_path):
+    path = str(tmp_path / "old_key.db")
+    old = DataLocker(path)
+    with old.conn as conn:
+        conn.execute("DROP INDEX idx_positions_natural_key")
+        conn.execute(OLD_KEY_INDEX)
+        conn.execute("DELETE FROM schema_version WHERE version >= 5")
+    forget_schema(path)
+    locker = DataLocker(path)
+    sql = locker.conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name='idx_positions_natural_key'").fetchone()[0]
+    assert "collateral" in sql
+
+
+def test_migration_keeps_duplicates_and_skips_index(locker_with_duplicates, caplog):
+    locker = locker_with_duplicates
+    assert not has_key_index(locker)
+    assert [r["id"] for r in stored(locker)] == ["dup-a", "dup-b"]
+    assert any("dup-a" in r.getMessage() and "dup-b" in r.getMessage() for r in caplog.get_records("setup"))
+
+
+def test_reimport_refreshes_without_index(locker_with_duplicates):
+    locker = locker_with_duplicates
+    assert locker.upsert_positions([jupiter_position(entry_price=52000.0)]) == 0
+    rows = stored(locker)
+    assert [r["id"] for r in rows] == ["dup-a", "dup-b"]
+    assert all(r["entry_price"] == 52000.0 for r in rows)
+
+    assert locker.upsert_positions([jupiter_position(size=100.0)]) == 1
+    assert len(stored(locker)) == 3
+
+
+def test_fallback_matches_within_tolerance(locker_with_duplicates):
+    locker = locker_with_duplicates
+    assert locker.upsert_positions([jupiter_position(size=5000.0 + 1e-9)]) == 0
+    assert len(stored(locker)) == 2
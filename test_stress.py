@@ -0,0 +1,79 @@
+"""
+Stress factor validation: parse_factors rejects anything that is not
+{asset: [finite numbers]}, and /api/stress turns that into a 400.
+
+    python -m pytest -q test_stress.py
+"""
+import math
+import os
+
+import pytest
+
+from stress_engine import parse_factors
+
+BAD_FACTORS = [
+    {"BTC": [None]},
+    {"BTC": [[1]]},
+    {"BTC": ["-10"]},
+    {"BTC": [True]},
+    {"BTC": [math.nan]},
+    {"BTC": [math.inf]},
+    {"BTC": [-math.inf]},
+    {"BTC": 5},
+    {"BTC": "-10"},
+    {"BTC": []},
+    {"BTC": [-100]},
+    {"BTC": [-10], "btc": [10]},
+    [["BTC", [-10]]],
+]
+
+
+@pytest.mark.parametrize("factors", BAD_FACTORS)
+def test_parse_factors_rejects(factors):
+    with pytest.raises(ValueError):
+        parse_factors(factors)
+
+
+def test_parse_factors_accepts_ints_and_floats():
+    assert parse_factors({"btc": [-20, 0.5], "ETH, sol": [10]}) == [
+        (("BTC",), (-20.0, 0.5)),
+        (("ETH", "SOL"), (10.0,)),
+    ]
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    os.environ["SONIC_DB_PATH"] = str(tmp_path_factory.mktemp("stress") / "stress.db")
+    import flask_app
+    return flask_app.app.test_client()
+
+
+@pytest.mark.parametrize("body", [
+    [1, 2],
+    {"factors": [1]},
+    {"factors": {"BTC": [None]}},
+    {"factors": {"BTC": [[1]]}},
+    {"factors": {"BTC": 5}},
+])
+def test_stress_api_rejects_bad_bodies(client, body):
+    response = client.post("/api/stress", json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+@pytest.mark.parametrize("query", ["BTC=nan", "BTC=inf", "BTC=x"])
+def test_stress_api_rejects_bad_query(client, query):
+    assert client.get(f"/api/stress?{query}").status_code == 400
+
+
+def test_stress_api_nan_and_inf_bodies(client):
+    # json.dumps writes these as NaN / Infinity, which Flask's parser accepts.
+    for shock in ("NaN", "Infinity", "-Infinity"):
+        response = client.post("/api/stress", data=f'{{"factors": {{"BTC": [{shock}]}}}}',
+                               content_type="application/json")
+        assert response.status_code == 400
+
+
+def test_stress_api_accepts_good_factors(client):
+    response = client.post("/api/stress", json={"factors": {"BTC": [-10, 0]}})
+    assert response.status_code == 200
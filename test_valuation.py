@@ -0,0 +1,121 @@
+"""
+Property tests: CalcServices.value_positions (the NumPy kernel in
+valuation.py) must give exactly what the scalar CalcServices methods give,
+position by position, for both travel modes and both side rules.
+
+The reference is built the way aggregate_positions / prepare_positions_for_display
+did before the kernel: calculate_travel_percent(_no_profit),
+calculate_leverage, calculate_heat_index and calculate_liquid_distance,
+plus their inline PnL / value arithmetic.
+
+    python -m pytest -q test_valuation.py
+"""
+import random
+
+import pytest
+
+from calc_services import CalcServices
+from position_book import side_of, side_of_strict
+from valuation import TRAVEL_NO_PROFIT, TRAVEL_PROFIT, VALUATION_FIELDS
+
+# Values whose x100 lands on (or within float error of) a .5 rounding tie.
+TIES = [1.005, 2.675, 0.125, 0.375, 10.005, 1.015, 0.045]
+
+
+def random_book(count: int, seed: int) -> list:
+    """
+    Positions with the awkward cases mixed in: zero / negative prices,
+    entry == liquidation, price at entry, zero / negative collateral,
+    rounding ties and position types the two side rules read differently.
+    """
+    rng = random.Random(seed)
+    positions = []
+    for i in range(count):
+        entry = rng.choice([0.0, -1.0, 100.0, rng.choice(TIES), rng.uniform(0.01, 1e5)])
+        positions.append({
+            "id": f"p{i}",
+            "asset_type": rng.choice(["BTC", "ETH", "SOL"]),
+            "position_type": rng.choice(["Long", "Short", "LONG", "short", "Perp short", "Perp", None]),
+            "entry_price": entry,
+            "liquidation_price": rng.choice([0.0, -3.0, entry, 50.0, rng.uniform(0.01, 1e5)]),
+            "current_price": rng.choice([entry, 0.0, -2.0, rng.choice(TIES), rng.uniform(0.01, 1e5)]),
+            "collateral": rng.choice([0.0, -5.0, 1.0, 3.0, rng.choice(TIES), rng.uniform(0.01, 1e4)]),
+            "size": rng.choice([0.0, 10.0, rng.choice(TIES), rng.uniform(0, 1e5)]),
+        })
+    return positions
+
+
+def scalar_valuation(calc: CalcServices, pos: dict, mode: str, side_rule) -> dict:
+    if side_rule is side_of_strict:
+        # aggregate_positions: the type as stored, only "LONG" is long.
+        position_type = (pos.get("position_type") or "LONG").upper()
+    else:
+        # prepare_positions_for_display: "short" anywhere means short.
+        position_type = "SHORT" if "short" in (pos.get("position_type") or "LONG").strip().lower() else "LONG"
+    entry_price = float(pos.get("entry_price", 0.0))
+    current_price = float(pos.get("current_price", 0.0))
+    liquidation_price = float(pos.get("liquidation_price", 0.0))
+    collateral = float(pos.get("collateral", 0.0))
+    size = float(pos.get("size", 0.0))
+
+    if mode == TRAVEL_PROFIT:
+        travel = calc.calculate_travel_percent(position_type, entry_price, current_price, liquidation_price)
+    else:
+        travel = calc.calculate_travel_percent_no_profit(position_type, entry_price, current_price, liquidation_price)
+
+    if entry_price > 0:
+        token_count = size / entry_price
+        if position_type == "LONG":
+            pnl = (current_price - entry_price) * token_count
+        else:
+            pnl = (entry_price - current_price) * token_count
+    else:
+        pnl = 0.0
+
+    leverage = calc.calculate_leverage(size, collateral)
+    return {
+        "travel_percent": travel,
+        "pnl": pnl,
+        "value": round(collateral + pnl, 2),
+        "leverage": leverage,
+        "heat_index": calc.calculate_heat_index(
+            {"size": size, "leverage": leverage, "collateral": collateral}) or 0.0,
+        "liquidation_distance": calc.calculate_liquid_distance(current_price, liquidation_price),
+    }
+
+
+@pytest.mark.parametrize("mode", [TRAVEL_NO_PROFIT, TRAVEL_PROFIT])
+@pytest.mark.parametrize("side_rule", [side_of_strict, side_of], ids=["strict", "contains_short"])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_value_positions_matches_scalar_methods(mode, side_rule, seed):
+    calc = CalcServices()
+    positions = random_book(5000, seed)
+    vector = calc.value_positions(positions, mode, side_rule)
+
+    mismatches = []
+    for i, pos in enumerate(positions):
+        expected = scalar_valuation(calc, pos, mode, side_rule)
+        for field in VALUATION_FIELDS:
+            if vector[field][i] != expected[field]:
+                mismatches.append((field, vector[field][i], expected[field], pos))
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[:3]}"
+
+
+def test_rounding_ties_follow_python_round():
+    calc = CalcServices()
+    positions = [
+        {"id": f"t{i}", "asset_type": "BTC", "position_type": "LONG", "entry_price": 0.0,
+         "liquidation_price": 0.0, "current_price": price, "collateral": collateral, "size": size}
+        for i, (price, collateral, size) in enumerate(
+            (p, c, s) for p in TIES for c in TIES + [1.0] for s in TIES)
+    ]
+    vector = calc.value_positions(positions, TRAVEL_NO_PROFIT, side_of_strict)
+    for i, pos in enumerate(positions):
+        expected = scalar_valuation(calc, pos, TRAVEL_NO_PROFIT, side_of_strict)
+        for field in ("value", "leverage", "heat_index", "liquidation_distance"):
+            assert vector[field][i] == expected[field], (field, pos)
+
+
+def test_empty_book():
+    vector = CalcServices().value_positions([], TRAVEL_NO_PROFIT, side_of_strict)
+    assert all(vector[field] == [] for field in VALUATION_FIELDS)
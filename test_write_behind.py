@@ -0,0 +1,134 @@
+"""
+Write-behind queue behavior (write_behind.py): read-your-writes, flush()
+as a barrier, a failing mutation rolled back alone under its savepoint,
+and `after` hooks only for committed writes.
+
+    python -m pytest -q test_write_behind.py
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from data_locker import DataLocker
+from write_behind import execute_write, start_write_behind, stop_write_behind, wait_for_own_writes
+
+# Long enough that queued writes share one batch and are still pending
+# when the test looks.
+MAX_DELAY_MS = 500
+
+
+def insert(value):
+    def write(conn):
+        conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+        return value
+    return write
+
+
+def insert_then_fail(value):
+    def write(conn):
+        conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+        raise RuntimeError(f"failed after inserting {value}")
+    return write
+
+
+def stored(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return sorted(v for (v,) in conn.execute("SELECT value FROM items"))
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "write_behind.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT UNIQUE)")
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def queue(db_path):
+    wb = start_write_behind(db_path, {"max_batch": 100, "max_delay_ms": MAX_DELAY_MS})
+    yield wb
+    stop_write_behind(db_path)
+
+
+def test_read_your_writes(db_path, queue):
+    future = execute_write(db_path, insert("a"))
+    assert not future.done()
+    wait_for_own_writes()
+    assert future.done()
+    assert stored(db_path) == ["a"]
+
+
+def test_data_locker_reads_see_own_queued_write(tmp_path):
+    path = str(tmp_path / "locker.db")
+    locker = DataLocker(path)
+    start_write_behind(path, {"max_delay_ms": MAX_DELAY_MS})
+    try:
+        locker._execute_write(lambda conn: conn.execute(
+            "INSERT INTO system_vars (id, last_update_time_positions) VALUES (1, 'x') "
+            "ON CONFLICT(id) DO UPDATE SET last_update_time_positions = 'x'"))
+        row = locker.conn.execute("SELECT last_update_time_positions FROM system_vars WHERE id = 1").fetchone()
+        assert row[0] == "x"
+    finally:
+        stop_write_behind(path)
+
+
+def test_flush_is_a_barrier(db_path, queue):
+    futures = []
+
+    def writer():
+        # Another thread's writes: wait_for_own_writes here wouldn't cover them.
+        futures.extend(execute_write(db_path, insert(str(i))) for i in range(20))
+
+    t = threading.Thread(target=writer)
+    t.start()
+    t.join()
+    assert not any(f.done() for f in futures)
+    queue.flush(timeout=5)
+    assert all(f.done() and f.exception() is None for f in futures)
+    assert stored(db_path) == sorted(str(i) for i in range(20))
+
+
+def test_failing_write_rolls_back_only_its_savepoint(db_path, queue):
+    good = execute_write(db_path, insert("before"))
+    bad = execute_write(db_path, insert_then_fail("bad"))
+    duplicate = execute_write(db_path, insert("before"))    # UNIQUE violation
+    later = execute_write(db_path, insert("after"))
+    queue.flush(timeout=5)
+
+    assert queue.metrics()["batches"] == 1
+    assert good.result() == "before"
+    assert later.result() == "after"
+    with pytest.raises(RuntimeError):
+        bad.result()
+    with pytest.raises(sqlite3.IntegrityError):
+        duplicate.result()
+    assert stored(db_path) == ["after", "before"]
+
+
+def test_wait_raises_the_write_error(db_path, queue):
+    with pytest.raises(RuntimeError):
+        execute_write(db_path, insert_then_fail("bad"), wait=True)
+    assert stored(db_path) == []
+
+
+def test_after_runs_only_for_committed_writes(db_path, queue):
+    ran = []
+    execute_write(db_path, insert("ok"), after=lambda: ran.append("ok"))
+    execute_write(db_path, insert_then_fail("bad"), after=lambda: ran.append("bad"))
+    queue.flush(timeout=5)
+    assert ran == ["ok"]
+
+
+def test_synchronous_failure_rolls_back_and_skips_after(db_path):
+    ran = []
+    assert execute_write(db_path, insert("ok"), after=lambda: ran.append("ok")) == "ok"
+    with pytest.raises(RuntimeError):
+        execute_write(db_path, insert_then_fail("bad"), after=lambda: ran.append("bad"))
+    assert ran == ["ok"]
+    assert stored(db_path) == ["ok"]
@@ -0,0 +1,137 @@
+"""
+Alert classes and colors for positions, from thresholds compiled once.
+
+alert_ranges (sonic_config.json) gives low / medium / high per metric,
+read as:
+
+    value >= high   => "alert-high"
+    value >= medium => "alert-medium"
+    value >= low    => "alert-low"
+    otherwise       => ""
+
+with a missing low / medium meaning 0.0, a null high or medium meaning
++inf and a null low -inf. Checked top down, that is the same as a sorted
+table of cumulative minima (high, min(medium, high), min(low, medium,
+high)), so a bisect (or np.searchsorted over a column) gives the class
+for any ranges, ordered or not.
+
+color_ranges ({metric: [(lower, upper, color), ...]}, see CalcServices)
+compile to elementary intervals between all the bounds, each holding the
+first range's color that covers it ("red" outside them all), which keeps
+CalcServices.get_color's first-match answer for gaps and overlaps too.
+
+ThresholdClassifier.label_positions fills every *_alert_class field of
+a list of positions in one call; flask_app keeps one per config file
+version (see get_threshold_classifier).
+"""
+import math
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ALERT_CLASSES = ("", "alert-low", "alert-medium", "alert-high")
+
+# (position field set, alert_ranges key, position field read)
+ALERT_METRICS = (
+    ("heat_alert_class", "heat_index_ranges", "heat_index"),
+    ("collateral_alert_class", "collateral_ranges", "collateral"),
+    ("value_alert_class", "value_ranges", "value"),
+    ("size_alert_class", "size_ranges", "size"),
+    ("leverage_alert_class", "leverage_ranges", "leverage"),
+    ("liqdist_alert_class", "liquidation_distance_ranges", "liquidation_distance"),
+    ("travel_liquid_alert_class", "travel_percent_liquid_ranges", "current_travel_percent"),
+    ("travel_profit_alert_class", "travel_percent_profit_ranges", "current_travel_percent"),
+)
+
+DEFAULT_COLOR = "white"     # metric without color ranges
+OUTSIDE_COLOR = "red"       # value outside every range
+
+
+def alert_bounds(ranges: Dict[str, Any]) -> Tuple[float, float, float]:
+    """
+    {"low", "medium", "high"} -> ascending (low, medium, high) bounds for
+    bisect_right: index 0..3 into ALERT_CLASSES.
+    """
+    high = ranges.get("high")
+    medium = ranges.get("medium", 0.0)
+    low = ranges.get("low", 0.0)
+    high = math.inf if high is None else float(high)
+    medium = min(math.inf if medium is None else float(medium), high)
+    low = min(-math.inf if low is None else float(low), medium)
+    return low, medium, high
+
+
+def color_table(ranges: Sequence[Tuple[float, float, str]]) -> Tuple[List[float], List[str]]:
+    """
+    [(lower, upper, color), ...] -> (bounds, colors): the color of
+    [bounds[i], bounds[i + 1]) is colors[i + 1]; colors[0] and colors[-1]
+    cover below / above every bound.
+    """
+    bounds = sorted({float(b) for lower, upper, _ in ranges for b in (lower, upper)})
+    colors = [OUTSIDE_COLOR]
+    for lower, upper in zip(bounds, bounds[1:]):
+        colors.append(next((c for lo, up, c in ranges if lo <= lower and upper <= up), OUTSIDE_COLOR))
+    colors.append(OUTSIDE_COLOR)
+    return bounds, colors
+
+
+def _number(value) -> float:
+    try:
+        return float(value or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ThresholdClassifier:
+    """
+    Compiled alert_ranges and color_ranges.
+      - alert_class / color label one value;
+      - label_positions sets all ALERT_METRICS classes on every position.
+    """
+
+    def __init__(self, alert_ranges: Optional[Dict[str, Any]] = None,
+                 color_ranges: Optional[Dict[str, Sequence[Tuple[float, float, str]]]] = None):
+        alert_ranges = alert_ranges or {}
+        self.color_ranges = color_ranges
+        self.bounds = {key: alert_bounds(alert_ranges.get(key) or {}) for _, key, _ in ALERT_METRICS}
+        self.colors = {metric: color_table(ranges) for metric, ranges in (color_ranges or {}).items()}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], color_ranges=None) -> 'ThresholdClassifier':
+        """
+        Builds the classifier from a loaded config dict (see load_config).
+        """
+        return cls(config.get("alert_ranges", {}), color_ranges)
+
+    def alert_class(self, value: float, range_key: str) -> str:
+        if value != value:  # NaN matches no threshold
+            return ""
+        return ALERT_CLASSES[bisect_right(self.bounds[range_key], value)]
+
+    def color(self, value: float, metric: str) -> str:
+        table = self.colors.get(metric)
+        if table is None:
+            return DEFAULT_COLOR
+        bounds, colors = table
+        return colors[bisect_right(bounds, value)]
+
+    def label_positions(self, positions: List[dict]) -> List[dict]:
+        """
+        Sets every ALERT_METRICS class on each position dict (missing or
+        non-numeric fields count as 0). Returns the same list.
+        """
+        if not positions:
+            return positions
+        labels = np.array(ALERT_CLASSES, dtype=object)
+        columns = {}
+        for field, key, source in ALERT_METRICS:
+            if source not in columns:
+                columns[source] = np.fromiter((_number(p.get(source)) for p in positions),
+                                              dtype=np.float64, count=len(positions))
+            values = columns[source]
+            index = np.searchsorted(self.bounds[key], values, side="right")
+            index[np.isnan(values)] = 0
+            for pos, label in zip(positions, labels[index].tolist()):
+                pos[field] = label
+        return positions
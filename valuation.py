@@ -0,0 +1,120 @@
+"""
+Vectorized position valuation.
+
+Computes, for every position at once, the fields CalcServices used to
+work out one dict at a time:
+
+    travel_percent, pnl, value, leverage, heat_index, liquidation_distance
+
+Results match the scalar CalcServices functions exactly (same operations
+in the same order, and round2 rounds like Python's round(x, 2)); see
+test_valuation.py for the randomized equivalence tests.
+
+Two travel-percent modes, as the scalar code has:
+  - TRAVEL_NO_PROFIT (aggregate_positions): 0% at entry, -100% at
+    liquidation, uncapped on the profit side.
+  - TRAVEL_PROFIT (prepare_positions_for_display): anchored at +100% at
+    twice the entry price.
+"""
+from typing import Dict
+
+import numpy as np
+
+TRAVEL_NO_PROFIT = "no_profit"
+TRAVEL_PROFIT = "profit"
+
+VALUATION_FIELDS = ("travel_percent", "pnl", "value", "leverage", "heat_index", "liquidation_distance")
+
+
+def round2(x: 'np.ndarray') -> 'np.ndarray':
+    """
+    Elementwise round(x, 2) with Python's results. rint(x * 100) / 100
+    agrees with round() except where x * 100 lands within float error of
+    a .5 tie (or is huge / not finite); those few go through round().
+    """
+    scaled = x * 100.0
+    out = np.rint(scaled) / 100.0
+    frac = scaled - np.floor(scaled)
+    with np.errstate(invalid="ignore"):
+        unsure = np.flatnonzero(~(np.abs(frac - 0.5) > 1e-6) | ~(np.abs(x) < 1e13))
+    for i in unsure:
+        out[i] = round(float(x[i]), 2)
+    return out
+
+
+def _ratio_pct(numer: 'np.ndarray', denom: 'np.ndarray') -> 'np.ndarray':
+    # (numer / denom) * 100, or 0.0 where denom is 0.
+    out = np.zeros_like(numer)
+    np.divide(numer, denom, out=out, where=denom != 0)
+    out *= 100
+    return out
+
+
+def travel_percent(side, entry, current, liquidation, mode: str = TRAVEL_NO_PROFIT) -> 'np.ndarray':
+    """
+    Travel % per position; side is +1 long / -1 short.
+    """
+    is_long = side > 0
+    up = current - entry      # the long side's numerator
+    down = entry - current    # the short side's numerator
+    numer = np.where(is_long, up, down)
+
+    if mode == TRAVEL_NO_PROFIT:
+        valid = (entry > 0) & (liquidation > 0) & (entry != liquidation)
+        denom = np.abs(entry - liquidation)
+        return np.where(valid, _ratio_pct(numer, np.where(valid, denom, 0.0)), 0.0)
+
+    if mode != TRAVEL_PROFIT:
+        raise ValueError(f"Unknown travel mode '{mode}'")
+    valid = (entry > 0) & (liquidation > 0)
+    profit_price = entry * 2
+    losing = np.where(is_long, current < entry, current > entry)
+    loss_denom = -np.abs(np.where(is_long, entry - liquidation, liquidation - entry))
+    gain_denom = np.where(is_long, profit_price - entry, np.abs(entry - profit_price))
+    denom = np.where(losing, loss_denom, gain_denom)
+    return np.where(valid, _ratio_pct(numer, np.where(valid, denom, 0.0)), 0.0)
+
+
+def value_columns(
+        side,
+        entry,
+        current,
+        liquidation,
+        size,
+        collateral,
+        mode: str = TRAVEL_NO_PROFIT
+) -> Dict[str, 'np.ndarray']:
+    """
+    Every valuation field for whole columns at once (float64 arrays,
+    side as +1/-1). Returns {field: array} for VALUATION_FIELDS.
+    """
+    is_long = side > 0
+    has_entry = entry > 0
+    token_count = np.zeros_like(size)
+    np.divide(size, entry, out=token_count, where=has_entry)
+    pnl = np.where(is_long, current - entry, entry - current) * token_count
+    pnl = np.where(has_entry, pnl, 0.0)
+
+    has_collateral = collateral > 0
+    safe_collateral = np.where(has_collateral, collateral, 1.0)
+    leverage = np.where(has_collateral, round2(size / safe_collateral), 0.0)
+    heat_index = np.where(has_collateral, round2((size * leverage) / safe_collateral), 0.0)
+
+    return {
+        "travel_percent": travel_percent(side, entry, current, liquidation, mode),
+        "pnl": pnl,
+        "value": round2(collateral + pnl),
+        "leverage": leverage,
+        "heat_index": heat_index,
+        "liquidation_distance": round2(np.abs(liquidation - current)),
+    }
+
+
+def value_book(book, mode: str = TRAVEL_NO_PROFIT) -> Dict[str, 'np.ndarray']:
+    """
+    value_columns over a PositionBook at its current prices.
+    """
+    return value_columns(
+        book.side, book.entry_price, book.current_price,
+        book.liquidation_price, book.size, book.collateral, mode
+    )
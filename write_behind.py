@@ -0,0 +1,296 @@
+import os
+import time
+import queue
+import logging
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from connection_pool import get_pool
+
+logger = logging.getLogger("WriteBehindLogger")
+
+# system_config["write_behind"]
+DEFAULT_WRITE_BEHIND: Dict[str, Any] = {
+    "enabled": False,
+    "max_batch": 500,       # mutations per transaction
+    "max_delay_ms": 50,     # how long the first queued mutation may wait for company
+}
+
+WriteFn = Callable[[sqlite3.Connection], Any]
+
+# Batch-size histogram buckets (upper bounds, inclusive).
+_BATCH_BUCKETS = (1, 10, 100, 1000)
+
+
+class WriteBehindQueue:
+    """
+    Single writer thread for one database file.
+      - submit(fn) queues a mutation; fn(conn) runs on the writer thread
+        (without committing) and the returned Future gets its result.
+      - The writer drains the queue into one transaction per batch, closing
+        a batch at max_batch mutations or max_delay_ms after its first one.
+      - Each mutation runs under a savepoint, so a failing one is rolled
+        back alone and only its own Future gets the exception.
+      - flush() is a barrier: it returns once everything queued before it
+        is committed.
+    """
+
+    def __init__(self, db_path: str, settings: Optional[Dict[str, Any]] = None):
+        self.db_path = db_path
+        self.settings = dict(DEFAULT_WRITE_BEHIND, **(settings or {}))
+        self.max_batch = int(self.settings["max_batch"])
+        self.max_delay = float(self.settings["max_delay_ms"]) / 1000.0
+        self.pool = get_pool(db_path)
+        self._queue: "queue.Queue[Optional[Tuple[Optional[WriteFn], Future]]]" = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "submitted": 0,
+            "committed": 0,
+            "failed": 0,
+            "batches": 0,
+            "max_depth": 0,
+            "max_batch": 0,
+            "last_batch_ms": 0.0,
+            "total_batch_ms": 0.0,
+            "batch_sizes": dict([(f"<={b}", 0) for b in _BATCH_BUCKETS] + [(f">{_BATCH_BUCKETS[-1]}", 0)]),
+        }
+        self._thread = threading.Thread(
+            target=self._run, name=f"WriteBehind-{os.path.basename(db_path)}", daemon=True
+        )
+        self._thread.start()
+
+    # ----------------------------------------------------------------
+    # Submitting
+    # ----------------------------------------------------------------
+
+    def submit(self, fn: WriteFn) -> Future:
+        if not self._thread.is_alive():
+            raise RuntimeError("Write-behind queue is stopped.")
+        future: Future = Future()
+        self._queue.put((fn, future))
+        depth = self._queue.qsize()
+        with self._metrics_lock:
+            self._metrics["submitted"] += 1
+            self._metrics["max_depth"] = max(self._metrics["max_depth"], depth)
+        return future
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Blocks until every mutation submitted before this call is committed.
+        """
+        barrier: Future = Future()
+        self._queue.put((None, barrier))
+        barrier.result(timeout)
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Commits what is queued, then stops the writer thread.
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ----------------------------------------------------------------
+    # Writer thread
+    # ----------------------------------------------------------------
+
+    def _run(self):
+        conn = self.pool.connection()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            # A barrier closes the batch right away; nobody waits on the timer.
+            while item[0] is not None and len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+        self.pool.release()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Tuple[Optional[WriteFn], Future]]):
+        started = time.perf_counter()
+        outcomes = []
+        writes = [(fn, fut) for fn, fut in batch if fn is not None]
+        try:
+            if writes:
+                conn.execute("BEGIN IMMEDIATE")
+                for fn, fut in writes:
+                    conn.execute("SAVEPOINT write_behind")
+                    try:
+                        result = fn(conn)
+                        conn.execute("RELEASE write_behind")
+                        outcomes.append((fut, result, None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write_behind")
+                        conn.execute("RELEASE write_behind")
+                        logger.error(f"Write-behind mutation failed: {e}", exc_info=True)
+                        outcomes.append((fut, None, e))
+                conn.commit()
+        except sqlite3.Error as e:
+            # The transaction itself failed: nothing in this batch landed.
+            logger.error(f"Write-behind batch of {len(writes)} failed: {e}", exc_info=True)
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(fut, None, e) for _, fut in writes]
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._record_batch(outcomes, elapsed_ms)
+        for fut, result, error in outcomes:
+            if error is None:
+                fut.set_result(result)
+            else:
+                fut.set_exception(error)
+        for fn, fut in batch:
+            if fn is None:
+                fut.set_result(None)
+
+    def _record_batch(self, outcomes, elapsed_ms: float):
+        if not outcomes:
+            return
+        size = len(outcomes)
+        failed = sum(1 for _, _, e in outcomes if e is not None)
+        bucket = next((f"<={b}" for b in _BATCH_BUCKETS if size <= b), f">{_BATCH_BUCKETS[-1]}")
+        with self._metrics_lock:
+            m = self._metrics
+            m["batches"] += 1
+            m["committed"] += size - failed
+            m["failed"] += failed
+            m["max_batch"] = max(m["max_batch"], size)
+            m["last_batch_ms"] = round(elapsed_ms, 3)
+            m["total_batch_ms"] += elapsed_ms
+            m["batch_sizes"][bucket] += 1
+
+    def metrics(self) -> dict:
+        """
+        Queue depth now/max, batch counts and sizes, and commit timings.
+        """
+        with self._metrics_lock:
+            m = dict(self._metrics, batch_sizes=dict(self._metrics["batch_sizes"]))
+        batches = m["batches"] or 1
+        m["depth"] = self._queue.qsize()
+        m["avg_batch"] = round((m["committed"] + m["failed"]) / batches, 2)
+        m["avg_batch_ms"] = round(m.pop("total_batch_ms") / batches, 3)
+        return m
+
+
+_queues: Dict[str, WriteBehindQueue] = {}
+_queues_lock = threading.Lock()
+_own_writes = threading.local()
+
+
+def _queue_key(db_path: str) -> str:
+    return os.path.abspath(db_path)
+
+
+def get_write_behind(db_path: str) -> Optional[WriteBehindQueue]:
+    """
+    The running queue for db_path, or None when write-behind is off.
+    """
+    return _queues.get(_queue_key(db_path))
+
+
+def start_write_behind(db_path: str, settings: Optional[Dict[str, Any]] = None) -> WriteBehindQueue:
+    """
+    Starts (or returns the already running) write-behind queue for db_path.
+    Every DataLocker on that file routes its writes through it from now on.
+    """
+    key = _queue_key(db_path)
+    with _queues_lock:
+        wb = _queues.get(key)
+        if wb is None:
+            wb = WriteBehindQueue(key, settings)
+            _queues[key] = wb
+            logger.info(f"Write-behind enabled for {key}: {wb.settings}")
+        return wb
+
+
+def stop_write_behind(db_path: str):
+    """
+    Drains and stops db_path's queue; writes go back to being synchronous.
+    """
+    with _queues_lock:
+        wb = _queues.pop(_queue_key(db_path), None)
+    if wb is not None:
+        wb.stop()
+
+
+def configure_write_behind(db_path: str, config: Dict[str, Any]) -> Optional[WriteBehindQueue]:
+    """
+    Starts write-behind if system_config["write_behind"]["enabled"] is set
+    in a loaded config dict.
+    """
+    settings = config.get("system_config", {}).get("write_behind") or {}
+    if not settings.get("enabled"):
+        return None
+    return start_write_behind(db_path, settings)
+
+
+def execute_write(
+        db_path: str,
+        fn: WriteFn,
+        wait: bool = False,
+        after: Optional[Callable[[], None]] = None
+):
+    """
+    Runs fn(conn) as one write against db_path.
+      - Write-behind off: runs now in a transaction on the calling thread's
+        pooled connection and returns fn's result.
+      - Write-behind on: queues fn and returns its Future (or, with
+        wait=True, blocks for and returns fn's result).
+    `after` runs once the write is committed.
+    """
+    wb = get_write_behind(db_path)
+    if wb is None:
+        conn = get_pool(db_path).connection()
+        with conn:
+            result = fn(conn)
+        if after is not None:
+            after()
+        return result
+
+    future = wb.submit(fn)
+    if after is not None:
+        future.add_done_callback(lambda f: f.exception() is None and after())
+    _own_writes.last = future
+    return future.result() if wait else future
+
+
+def wait_for_own_writes():
+    """
+    Read-your-writes for the calling thread: blocks until the last write it
+    queued has been committed. Cheap when nothing is pending.
+    """
+    future = getattr(_own_writes, "last", None)
+    if future is not None:
+        if not future.done():
+            future.exception()
+        _own_writes.last = None
+
+
+def _queues_after_fork():
+    """
+    Writer threads don't survive fork. The child starts with write-behind
+    off (synchronous writes) until it calls configure_write_behind again,
+    e.g. through DataLocker.startup.
+    """
+    global _queues_lock, _own_writes
+    _queues.clear()
+    _queues_lock = threading.Lock()
+    _own_writes = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_queues_after_fork)